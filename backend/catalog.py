@@ -0,0 +1,260 @@
+import asyncio
+import inspect
+import time
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional
+
+# Metadata fields that get an equality bitmap index
+INDEXED_FIELDS = ("diet_type", "cuisine")
+
+# Numeric metadata field that gets a range index
+RANGE_FIELD = "time_to_eat"
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _bitmap(rows, size):
+    # Building through a bytearray is linear, OR-ing single bits into an int is quadratic
+    bits = bytearray((size + 7) // 8)
+    for row in rows:
+        bits[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(bits, "little")
+
+
+class CatalogSnapshot:
+    """
+    Immutable columnar view of the recipe metadata.
+
+    Rows keep the order in which Chroma returned them. Row sets are Python ints used as
+    bitmaps (bit i set = row i matches), so combining filters is a handful of word-wise
+    AND/OR operations done in C instead of a per-row scan.
+
+    Args:
+        ids (list): Recipe IDs, one per row.
+        metadatas (list): Metadata dicts, one per row.
+    """
+
+    def __init__(self, ids: List[str], metadatas: List[dict]):
+        self.ids = ids
+        self.metadatas = metadatas
+        self.all_rows = (1 << len(ids)) - 1
+        self.row_by_id = {recipe_id: row for row, recipe_id in enumerate(ids)}
+
+        # Equality indexes: field -> value -> bitmap
+        self.indexes: Dict[str, Dict[object, int]] = {}
+        for field in INDEXED_FIELDS:
+            rows_by_value = {}
+            for row, metadata in enumerate(metadatas):
+                rows_by_value.setdefault(metadata.get(field), []).append(row)
+            self.indexes[field] = {value: _bitmap(rows, len(ids)) for value, rows in rows_by_value.items()}
+
+        # Range index: sorted distinct values and, for each, the bitmap of rows <= that value
+        rows_by_value = {}
+        for row, metadata in enumerate(metadatas):
+            value = metadata.get(RANGE_FIELD)
+            if _is_number(value):
+                rows_by_value.setdefault(value, []).append(row)
+        self.range_values = sorted(rows_by_value)
+        self.range_prefix = []
+        prefix = 0
+        for value in self.range_values:
+            prefix |= _bitmap(rows_by_value[value], len(ids))
+            self.range_prefix.append(prefix)
+        self.numeric_rows = prefix
+
+    def __len__(self):
+        return len(self.ids)
+
+    def values(self, field):
+        return [value for value, rows in self.indexes[field].items() if rows]
+
+    def _at_most(self, value, inclusive=True):
+        position = bisect_right(self.range_values, value) if inclusive else bisect_left(self.range_values, value)
+        return self.range_prefix[position - 1] if position else 0
+
+    def _match_condition(self, field, condition) -> Optional[int]:
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        if len(condition) != 1:
+            return None
+        operator, value = next(iter(condition.items()))
+
+        if operator == "$eq" and field in self.indexes:
+            return self.indexes[field].get(value, 0)
+        if field == RANGE_FIELD and _is_number(value):
+            if operator == "$gte":
+                return self.numeric_rows & ~self._at_most(value, inclusive=False)
+            if operator == "$gt":
+                return self.numeric_rows & ~self._at_most(value)
+            if operator == "$lte":
+                return self._at_most(value)
+            if operator == "$lt":
+                return self._at_most(value, inclusive=False)
+        return None
+
+    def match(self, where: Optional[dict]) -> Optional[int]:
+        """
+        Evaluates a Chroma where filter as produced by build_filters.
+
+        Returns:
+            int: Bitmap of matching rows, or None if the filter uses something the catalog
+                cannot answer (the caller should fall back to Chroma then).
+        """
+        if not where:
+            return self.all_rows
+        if len(where) != 1:
+            return None
+
+        key, value = next(iter(where.items()))
+        if key == "$and":
+            rows = self.all_rows
+            for condition in value:
+                matched = self.match(condition)
+                if matched is None:
+                    return None
+                rows &= matched
+            return rows
+        if key == "$or":
+            rows = 0
+            for condition in value:
+                matched = self.match(condition)
+                if matched is None:
+                    return None
+                rows |= matched
+            return rows
+        return self._match_condition(key, value)
+
+    def page(self, rows: int, offset: int, limit: int) -> List[int]:
+        """
+        Returns the row numbers of the matches offset..offset+limit.
+
+        The start row is found with a binary search over prefix popcounts, so the cost does
+        not grow with the offset.
+        """
+        if offset >= rows.bit_count():
+            return []
+
+        low, high = 0, rows.bit_length()
+        while low < high:
+            middle = (low + high) // 2
+            if (rows & ((1 << middle) - 1)).bit_count() > offset:
+                high = middle
+            else:
+                low = middle + 1
+
+        position = low - 1
+        remaining = rows >> position
+        page = []
+        while remaining and len(page) < limit:
+            lowest = (remaining & -remaining).bit_length() - 1
+            position += lowest
+            page.append(position)
+            remaining >>= lowest + 1
+            position += 1
+        return page
+
+
+class RecipeCatalog:
+    """
+    Keeps a CatalogSnapshot of a Chroma collection in process and refreshes it when the
+    collection changes.
+
+    Requests never wait for a refresh once the first snapshot is loaded: at most every
+    check_interval seconds a background task compares the collection count, and on a change
+    (or once the snapshot is older than max_age seconds) a new snapshot is built and swapped in.
+
+    Args:
+        collection: Async Chroma collection to mirror.
+        check_interval (float): Minimum seconds between change checks.
+        max_age (float): Seconds after which the snapshot is rebuilt even without a count change,
+            which picks up upserts that replaced existing recipes.
+        page_size (int): Number of records fetched per request while loading.
+        on_refresh (callable, optional): Called with every new snapshot once it is swapped in,
+            including the first one, e.g. to drop or update state derived from the old one. May
+            be a coroutine function.
+    """
+
+    def __init__(self, collection, check_interval=5.0, max_age=300.0, page_size=1000, on_refresh=None):
+        self.collection = collection
+        self.on_refresh = on_refresh
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self.page_size = page_size
+        self.snapshot: Optional[CatalogSnapshot] = None
+        self.loaded_at = 0.0
+        self.checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _load(self):
+        ids = []
+        metadatas = []
+        offset = 0
+        while True:
+            batch = await self.collection.get(include=["metadatas"], limit=self.page_size, offset=offset)
+            ids.extend(batch["ids"])
+            metadatas.extend(batch["metadatas"])
+            if len(batch["ids"]) < self.page_size:
+                break
+            offset += self.page_size
+        # Building the indexes is CPU bound, keep it off the event loop
+        return await asyncio.to_thread(CatalogSnapshot, ids, metadatas)
+
+    async def _notify(self, snapshot):
+        if self.on_refresh is not None:
+            result = self.on_refresh(snapshot)
+            if inspect.isawaitable(result):
+                await result
+
+    async def _notify_first(self, snapshot):
+        try:
+            await self._notify(snapshot)
+        except Exception as e:
+            print(f"Catalog refresh failed: {e}")
+
+    async def refresh(self):
+        async with self._lock:
+            self.snapshot = await self._load()
+            self.loaded_at = time.monotonic()
+        await self._notify(self.snapshot)
+
+    async def _check(self):
+        try:
+            stale = (time.monotonic() - self.loaded_at >= self.max_age
+                     or await self.collection.count() != len(self.snapshot))
+            if stale:
+                await self.refresh()
+        except Exception as e:
+            print(f"Catalog refresh failed: {e}")
+
+    async def get(self) -> CatalogSnapshot:
+        """
+        Returns the current snapshot, loading it on first use.
+        """
+        if self.snapshot is None:
+            async with self._lock:
+                if self.snapshot is None:
+                    self.snapshot = await self._load()
+                    self.loaded_at = self.checked_at = time.monotonic()
+                    # Derived state is built in the background, the first request only waits for the snapshot
+                    self._task = asyncio.create_task(self._notify_first(self.snapshot))
+            return self.snapshot
+
+        now = time.monotonic()
+        if now - self.checked_at >= self.check_interval and (self._task is None or self._task.done()):
+            self.checked_at = now
+            self._task = asyncio.create_task(self._check())
+        return self.snapshot
+
+    async def wait_idle(self):
+        """
+        Waits until a running background check or refresh, including its on_refresh call, is done.
+        """
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    def invalidate(self):
+        self.checked_at = 0.0
+        self.loaded_at = 0.0
@@ -0,0 +1,168 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import List, Optional
+
+from cache import LRUCache
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes a query so that trivially different spellings share one cache entry.
+
+    Collapses all whitespace (including newlines) and case-folds the text.
+    """
+    return " ".join(text.split()).casefold()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache for query embeddings keyed by model and normalized text.
+
+    The first tier is an in-process LRU. The optional second tier is a SQLite file that
+    survives restarts and can be shared by several workers on the same host. Entries found
+    on disk are promoted into memory.
+
+    Args:
+        memory_size (int): Maximum number of embeddings kept in process.
+        disk_path (str, optional): Path of the SQLite file. The disk tier is disabled if empty.
+        disk_max_entries (int): Maximum number of rows kept on disk before the least recently
+            used ones are evicted.
+    """
+
+    def __init__(self, memory_size=4096, disk_path: Optional[str] = None, disk_max_entries=200000):
+        self.memory = LRUCache(memory_size)
+        self.disk_max_entries = disk_max_entries
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._disk_rows = 0
+
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._disk_rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return f"{model}\x00{normalize_text(text)}"
+
+    async def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Looks up the embeddings of several texts, None for every text that is not cached.
+
+        Memory hits are answered on the event loop. The remaining texts are looked up on disk
+        in one worker thread, so SQLite I/O never blocks other requests.
+        """
+        keys = [self.key(model, text) for text in texts]
+        embeddings = [self.memory.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+        if missing and self._db is not None:
+            found = await asyncio.to_thread(self._disk_get, [keys[i] for i in missing])
+            for i, embedding in zip(missing, found):
+                if embedding is not None:
+                    self.memory.put(keys[i], embedding)
+                    self.disk_hits += 1
+                    embeddings[i] = embedding
+
+        self.misses += sum(1 for embedding in embeddings if embedding is None)
+        return embeddings
+
+    async def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        """
+        Stores embeddings in memory at once and on disk in a worker thread.
+        """
+        keys = [self.key(model, text) for text in texts]
+        for key, embedding in zip(keys, embeddings):
+            self.memory.put(key, embedding)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_put, keys, embeddings)
+
+    def _disk_get(self, keys: List[str]) -> List[Optional[List[float]]]:
+        embeddings = []
+        with self._db_lock:
+            for key in keys:
+                row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+                embeddings.append(array("f", row[0]).tolist() if row is not None else None)
+        return embeddings
+
+    def _disk_put(self, keys: List[str], embeddings: List[List[float]]):
+        now = time.time()
+        with self._db_lock:
+            cursor = self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", embedding).tobytes(), now) for key, embedding in zip(keys, embeddings)]
+            )
+            self._disk_rows += cursor.rowcount
+            if self._disk_rows > self.disk_max_entries:
+                self._evict()
+
+    def preload(self, model: str, limit: int) -> int:
+        """
+        Loads the most recently used disk entries of a model into memory, e.g. on startup.
+
+        Returns:
+            int: Number of embeddings loaded.
+        """
+        if self._db is None or limit <= 0:
+            return 0
+        # Keys start with the model and a NUL separator, the range scan stays on the primary key
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT key, vector FROM embeddings WHERE key >= ? AND key < ? ORDER BY last_used DESC LIMIT ?",
+                (f"{model}\x00", f"{model}\x01", min(limit, self.memory.maxsize))
+            ).fetchall()
+        # Oldest first, so the most recently used entries end up most recent in the LRU
+        for key, vector in reversed(rows):
+            self.memory.put(key, array("f", vector).tolist())
+        return len(rows)
+
+    def _evict(self):
+        # Evict in chunks of 10% so that the DELETE is amortized over many inserts.
+        # Other workers may share the file, so the row count is re-read first.
+        self._disk_rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._disk_rows - self.disk_max_entries
+        if excess <= 0:
+            return
+        excess += self.disk_max_entries // 10
+        self._db.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,)
+        )
+        self._disk_rows = max(self._disk_rows - excess, 0)
+
+    def stats(self):
+        memory_stats = self.memory.stats()
+        lookups = memory_stats["hits"] + self.disk_hits + self.misses
+        return {
+            "memory_size": memory_stats["size"],
+            "memory_hits": memory_stats["hits"],
+            "disk_enabled": self._db is not None,
+            "disk_size": self._disk_rows,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (memory_stats["hits"] + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+def embedding_cache_from_env():
+    return EmbeddingCache(
+        memory_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")),
+        disk_path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+        disk_max_entries=int(os.getenv("EMBEDDING_CACHE_DISK_MAX", "200000")),
+    )
@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import math
+import os
+import re
+from typing import List, Tuple
+
+# Collections built before they were tagged used this model
+LEGACY_MODEL = "text-embedding-3-small"
+LEGACY_DIMENSION = 1536
+
+
+class EmbeddingProvider:
+    """
+    Turns texts into embedding vectors.
+
+    Subclasses implement embed_with_usage. Collections are tagged with model and dimension,
+    so vectors of different providers never end up in the same collection.
+    """
+
+    model: str
+    dimension: int
+
+    def embed_with_usage(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """
+        Returns:
+            tuple: One embedding per text and the number of tokens that were processed.
+        """
+        raise NotImplementedError
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_with_usage(texts)[0]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        # In-process models are CPU bound, run them next to the event loop instead of on it
+        return await asyncio.to_thread(self.embed, texts)
+
+    def collection_metadata(self):
+        return {"embedding_model": self.model, "embedding_dim": self.dimension}
+
+    def check_collection(self, collection):
+        """
+        Raises if a collection was built with a different model or dimension.
+        """
+        metadata = collection.metadata or {}
+        model = metadata.get("embedding_model", LEGACY_MODEL)
+        dimension = metadata.get("embedding_dim", LEGACY_DIMENSION)
+        if (model, dimension) != (self.model, self.dimension):
+            raise RuntimeError(
+                f"Collection '{collection.name}' was built with {model} ({dimension} dimensions) "
+                f"but the configured embedding provider is {self.model} ({self.dimension} dimensions). "
+                f"Re-index with tools/db_processor.py --full or change EMBEDDING_PROVIDER."
+            )
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """
+    Embeddings from the OpenAI API.
+
+    Args:
+        model (str): Embedding model name.
+        dimension (int): Dimension of the model's vectors.
+        client (OpenAI, optional): Client for synchronous calls.
+        async_client (AsyncOpenAI, optional): Client for calls from the event loop.
+    """
+
+    def __init__(self, model=LEGACY_MODEL, dimension=LEGACY_DIMENSION, client=None, async_client=None):
+        self.model = model
+        self.dimension = dimension
+        self.client = client
+        self.async_client = async_client
+
+    def embed_with_usage(self, texts):
+        response = self.client.embeddings.create(input=texts, model=self.model)
+        embeddings = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        return embeddings, response.usage.total_tokens if response.usage else 0
+
+    async def aembed(self, texts):
+        response = await self.async_client.embeddings.create(input=texts, model=self.model)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class SentenceTransformerProvider(EmbeddingProvider):
+    """
+    Embeddings from a local sentence-transformers model, computed on the CPU without network.
+
+    Args:
+        model_name_or_path (str): Model name or path to local model files.
+    """
+
+    def __init__(self, model_name_or_path="all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = os.path.basename(os.path.normpath(model_name_or_path))
+        self.encoder = SentenceTransformer(model_name_or_path, device="cpu")
+        self.dimension = self.encoder.get_sentence_embedding_dimension()
+
+    def embed_with_usage(self, texts):
+        embeddings = self.encoder.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        return embeddings.tolist(), sum(len(text.split()) for text in texts)
+
+
+class HashingProvider(EmbeddingProvider):
+    """
+    Deterministic hashing vectorizer over word unigrams and character trigrams.
+
+    Needs no model files and no network, which makes it the provider for tests and offline
+    benchmarks. Texts sharing words or word pieces get similar vectors.
+
+    Args:
+        dimension (int): Number of hash buckets.
+    """
+
+    def __init__(self, dimension=LEGACY_DIMENSION):
+        self.dimension = dimension
+        self.model = f"hashing-v1-{dimension}"
+
+    def _embed_text(self, text):
+        vector = [0.0] * self.dimension
+        words = re.findall(r"\w+", text.casefold())
+        features = words + [f"#{word[i:i + 3]}" for word in words for i in range(max(len(word) - 2, 1))]
+        for feature in features:
+            value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[value % self.dimension] += 1.0 if value >> 63 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_with_usage(self, texts):
+        return [self._embed_text(text) for text in texts], sum(len(text.split()) for text in texts)
+
+
+def provider_from_env(client=None, async_client=None) -> EmbeddingProvider:
+    """
+    Builds the embedding provider selected by EMBEDDING_PROVIDER (openai, local or hashing).
+
+    Args:
+        client (OpenAI, optional): Synchronous OpenAI client for the openai provider.
+        async_client (AsyncOpenAI, optional): Async OpenAI client for the openai provider.
+    """
+    provider = os.getenv("EMBEDDING_PROVIDER", "openai")
+    if provider == "openai":
+        return OpenAIEmbeddingProvider(
+            model=os.getenv("EMBEDDING_MODEL", LEGACY_MODEL),
+            dimension=int(os.getenv("EMBEDDING_DIM", str(LEGACY_DIMENSION))),
+            client=client,
+            async_client=async_client
+        )
+    if provider == "local":
+        return SentenceTransformerProvider(os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"))
+    if provider == "hashing":
+        return HashingProvider(int(os.getenv("EMBEDDING_DIM", str(LEGACY_DIMENSION))))
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER '{provider}', expected openai, local or hashing")
@@ -0,0 +1,175 @@
+import asyncio
+import heapq
+import math
+import re
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from catalog import CatalogSnapshot
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into case-folded word tokens, single characters are dropped.
+    """
+    return [token for token in re.findall(r"\w+", text.casefold()) if len(token) > 1]
+
+
+def _analyze(documents: List[Tuple[str, str]]):
+    # Term counts and title terms per document, CPU bound and run off the event loop
+    analyzed = []
+    for text, title in documents:
+        counts = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        analyzed.append((counts, frozenset(tokenize(title))))
+    return analyzed
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k=60) -> List[Tuple[str, float]]:
+    """
+    Merges several ranked ID lists into one. Each list contributes 1 / (k + rank) per ID,
+    so IDs ranked high in several lists come first and raw scores never need to be comparable.
+
+    Returns:
+        list: (id, score) pairs, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, recipe_id in enumerate(ranking, start=1):
+            scores[recipe_id] = scores.get(recipe_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """
+    In-process BM25 inverted index over the recipe documents.
+
+    The index mirrors the recipe catalog: sync compares the content hash of every recipe in a
+    catalog snapshot with the indexed one and only fetches, tokenizes and re-indexes recipes
+    that were added or changed, removed recipes are dropped.
+
+    Args:
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 document length normalization.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_terms: Dict[str, Tuple[str, ...]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.doc_hashes: Dict[str, Optional[str]] = {}
+        self.titles: Dict[str, FrozenSet[str]] = {}
+        self.total_length = 0
+        self.ready = False
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def _add(self, recipe_id, content_hash, counts, title_terms):
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[recipe_id] = count
+        self.doc_terms[recipe_id] = tuple(counts)
+        self.doc_lengths[recipe_id] = sum(counts.values())
+        self.total_length += self.doc_lengths[recipe_id]
+        self.doc_hashes[recipe_id] = content_hash
+        self.titles[recipe_id] = title_terms
+
+    def _remove(self, recipe_id):
+        if recipe_id not in self.doc_lengths:
+            return
+        # Only the postings of the document's own terms have to be touched
+        for term in self.doc_terms.pop(recipe_id):
+            postings = self.postings[term]
+            del postings[recipe_id]
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(recipe_id)
+        del self.doc_hashes[recipe_id]
+        del self.titles[recipe_id]
+
+    async def sync(self, snapshot: CatalogSnapshot,
+                   fetch_documents: Callable[[List[str]], Awaitable[Dict[str, str]]], page_size=500):
+        """
+        Brings the index in line with a catalog snapshot.
+
+        Args:
+            snapshot (CatalogSnapshot): Current recipe metadata, with content_hash per recipe.
+            fetch_documents (callable): Coroutine function returning the document text for a list
+                of recipe IDs.
+            page_size (int): Number of documents fetched per call.
+        """
+        async with self._lock:
+            wanted = {
+                recipe_id: (metadata.get("content_hash"), metadata.get("title", ""))
+                for recipe_id, metadata in zip(snapshot.ids, snapshot.metadatas)
+            }
+            changed = [
+                recipe_id for recipe_id, (content_hash, _) in wanted.items()
+                if recipe_id not in self.doc_hashes or self.doc_hashes[recipe_id] != content_hash
+            ]
+            for recipe_id in [recipe_id for recipe_id in self.doc_hashes if recipe_id not in wanted]:
+                self._remove(recipe_id)
+
+            for start in range(0, len(changed), page_size):
+                ids = changed[start:start + page_size]
+                documents = await fetch_documents(ids)
+                analyzed = await asyncio.to_thread(
+                    _analyze, [(documents.get(recipe_id) or "", wanted[recipe_id][1]) for recipe_id in ids]
+                )
+                for recipe_id, (counts, title_terms) in zip(ids, analyzed):
+                    self._remove(recipe_id)
+                    self._add(recipe_id, wanted[recipe_id][0], counts, title_terms)
+
+            self.ready = True
+            return len(changed)
+
+    def search(self, query: str, limit: int, accept: Optional[Callable[[str], bool]] = None) \
+            -> List[Tuple[str, float]]:
+        """
+        Ranks the indexed recipes for a query with BM25.
+
+        Args:
+            query (str): Free text query.
+            limit (int): Maximum number of hits.
+            accept (callable, optional): Predicate on recipe IDs, e.g. a filter check. Candidates
+                are tested best first, so usually only a few of them.
+
+        Returns:
+            list: (recipe ID, score) pairs, best first.
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.doc_lengths:
+            return []
+
+        count = len(self.doc_lengths)
+        average_length = self.total_length / count or 1.0
+        scores = {}
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1.0 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for recipe_id, frequency in postings.items():
+                norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths[recipe_id] / average_length)
+                scores[recipe_id] = scores.get(recipe_id, 0.0) + idf * frequency * (self.k1 + 1.0) / (frequency + norm)
+
+        if accept is None:
+            return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        hits = []
+        for recipe_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            if accept(recipe_id):
+                hits.append((recipe_id, score))
+                if len(hits) == limit:
+                    break
+        return hits
+
+    def is_confident(self, query: str, recipe_id: str) -> bool:
+        """
+        A lexical hit is confident when its title contains every query term, which is the case
+        for queries that name a dish ("Spaghetti Carbonara") rather than describe one.
+        """
+        terms = set(tokenize(query))
+        return bool(terms) and terms <= self.titles.get(recipe_id, frozenset())
@@ -0,0 +1,295 @@
+import asyncio
+import bisect
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import httpx
+import openai
+from fastapi.routing import APIRoute
+
+# Timeouts raised by asyncio.wait_for and by the clients' own timeouts (OpenAI, httpx for Chroma)
+TIMEOUT_ERRORS = (asyncio.TimeoutError, openai.APITimeoutError, httpx.TimeoutException)
+
+# Upper bounds in seconds, from sub-millisecond cache hits to slow upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra="") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic counter per combination of label values.
+
+    Updates are plain dictionary operations on the event loop, no lock is taken on the hot path.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    """
+    Cumulative histogram per combination of label values, in the Prometheus bucket layout.
+
+    Args:
+        buckets (tuple): Sorted upper bounds of the buckets, +Inf is added implicitly.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (non-cumulative, last one is +Inf), sum]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        for labels, (counts, total) in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Collected:
+    """
+    Metric whose values are read at scrape time, e.g. from the counters a cache already keeps.
+
+    Args:
+        kind (str): Prometheus type, counter or gauge.
+        collect (Callable): Returns pairs of label values and value.
+    """
+
+    def __init__(self, name, documentation, kind, labelnames, collect: Callable[[], Iterable[Tuple[Tuple, float]]]):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self):
+        for labels, value in self.collect():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Registry:
+    """
+    Holds the backend's metrics and renders them in the Prometheus text format (version 0.0.4).
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def collected(self, name, documentation, kind, labelnames, collect) -> Collected:
+        return self._add(Collected(name, documentation, kind, labelnames, collect))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_seconds = registry.histogram(
+    "backend_request_duration_seconds", "Time from request start to the response headers.", ["endpoint"])
+requests_total = registry.counter(
+    "backend_requests_total", "Handled requests.", ["endpoint", "method", "status"])
+stage_seconds = registry.histogram(
+    "backend_stage_duration_seconds", "Time spent in one stage of a request.", ["endpoint", "stage"])
+upstream_seconds = registry.histogram(
+    "backend_upstream_duration_seconds", "Duration of calls to upstream services.", ["service", "operation"])
+upstream_total = registry.counter(
+    "backend_upstream_requests_total", "Calls to upstream services by outcome.", ["service", "operation", "outcome"])
+
+
+class RequestTimings:
+    """
+    Stage durations of the current request, for the Server-Timing header.
+    """
+
+    __slots__ = ("endpoint", "stages", "handler_end")
+
+    def __init__(self):
+        self.endpoint = "unmatched"
+        self.stages = []
+        self.handler_end = None
+
+    def server_timing(self, total) -> str:
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages]
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+# Set per request by MetricsMiddleware; tasks started by the request inherit it
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("current_timings", default=None)
+
+
+def record_stage(name, seconds):
+    timings = current_timings.get()
+    stage_seconds.observe(seconds, timings.endpoint if timings is not None else "background", name)
+    if timings is not None:
+        timings.stages.append((name, seconds))
+
+
+@contextmanager
+def stage(name):
+    """
+    Times the enclosed block as one stage of the current request.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+async def upstream_call(service, operation, awaitable):
+    """
+    Awaits a call to an upstream service, counting it by outcome and recording its duration.
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        result = await awaitable
+        outcome = "ok"
+        return result
+    except TIMEOUT_ERRORS:
+        outcome = "timeout"
+        raise
+    finally:
+        upstream_seconds.observe(time.perf_counter() - start, service, operation)
+        upstream_total.inc(service, operation, outcome)
+
+
+class TimedRoute(APIRoute):
+    """
+    Route that labels the request's timings with its path and records the time FastAPI spends
+    after the endpoint returned (validation, encoding and rendering the response) as the
+    serialize stage.
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+            original = endpoint
+
+            @functools.wraps(original)
+            async def endpoint(*args, **kwargs):
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    timings = current_timings.get()
+                    if timings is not None:
+                        timings.handler_end = time.perf_counter()
+
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def timed_handler(request):
+            timings = current_timings.get()
+            if timings is None:
+                return await handler(request)
+            timings.endpoint = path
+            response = await handler(request)
+            if timings.handler_end is not None:
+                record_stage("serialize", time.perf_counter() - timings.handler_end)
+            return response
+
+        return timed_handler
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that times every HTTP request and adds its stages as a Server-Timing header.
+
+    Args:
+        server_timing (bool): Whether to send the Server-Timing header.
+    """
+
+    def __init__(self, app, server_timing=True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                request_seconds.observe(time.perf_counter() - start, timings.endpoint)
+                if self.server_timing:
+                    header = timings.server_timing(time.perf_counter() - start).encode("latin-1")
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timings.reset(token)
+            requests_total.inc(timings.endpoint, scope["method"], str(status))
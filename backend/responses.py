@@ -0,0 +1,99 @@
+import asyncio
+import functools
+from typing import FrozenSet, List, Optional
+
+from fastapi.datastructures import DefaultPlaceholder
+from starlette.responses import Response
+
+from metrics import TimedRoute
+
+# Fields of a recipe in list responses: the collection metadata plus the search distance
+RECIPE_FIELDS = frozenset({
+    "id", "title", "tags", "cuisine", "diet_type", "instructions", "ingredients", "img_links", "time_to_eat",
+    "source_url", "distance"
+})
+
+# Ingest bookkeeping stored in the Chroma metadata, never sent to clients
+INTERNAL_FIELDS = frozenset({"content_hash"})
+
+# Named projections, fields=card returns what a recipe card in the chat UI shows
+FIELD_SETS = {
+    "card": frozenset({"id", "title", "img_links", "cuisine", "diet_type", "time_to_eat"}),
+}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[FrozenSet[str]]:
+    """
+    Parses a comma-separated fields parameter, e.g. "title,img_links" or "card".
+
+    Returns:
+        frozenset: Fields to return, always including the ID. None if every field is requested.
+
+    Raises:
+        ValueError: If a field name is unknown.
+    """
+    if not fields or not fields.strip():
+        return None
+    selected = {"id"}
+    for name in fields.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name in FIELD_SETS:
+            selected.update(FIELD_SETS[name])
+        elif name in RECIPE_FIELDS:
+            selected.add(name)
+        else:
+            known = ", ".join(sorted(RECIPE_FIELDS | set(FIELD_SETS)))
+            raise ValueError(f"Unknown field '{name}', expected one of {known}")
+    return frozenset(selected)
+
+
+def needs_metadata(fields: Optional[FrozenSet[str]]) -> bool:
+    # IDs and distances come with every Chroma query, everything else is metadata
+    return fields is None or not fields <= {"id", "distance"}
+
+
+def public_recipe(recipe: dict) -> dict:
+    # Recipes are shared with the caches, only those carrying internal fields are copied
+    if INTERNAL_FIELDS.isdisjoint(recipe):
+        return recipe
+    return {key: value for key, value in recipe.items() if key not in INTERNAL_FIELDS}
+
+
+def project(recipes: List[dict], fields: Optional[FrozenSet[str]]) -> List[dict]:
+    if fields is None:
+        return [public_recipe(recipe) for recipe in recipes]
+    return [{key: value for key, value in recipe.items() if key in fields} for recipe in recipes]
+
+
+class CompactJSONRoute(TimedRoute):
+    """
+    Route that renders the dicts returned by its endpoint with the response class directly.
+
+    FastAPI otherwise runs every result through jsonable_encoder before rendering it, which
+    takes far longer than encoding the plain JSON values of a recipe list with orjson. Results
+    the response class cannot render take FastAPI's usual path. The endpoint itself still returns
+    the dict, so in-process callers see no difference.
+    """
+
+    def get_route_handler(self):
+        call = self.dependant.call
+        response_class = self.response_class
+        if isinstance(response_class, DefaultPlaceholder):
+            response_class = response_class.value
+
+        if asyncio.iscoroutinefunction(call) and self.response_model is None:
+            @functools.wraps(call)
+            async def render(*args, **kwargs):
+                content = await call(*args, **kwargs)
+                if isinstance(content, Response):
+                    return content
+                try:
+                    return response_class(content)
+                except TypeError:
+                    return content
+
+            self.dependant.call = render
+
+        return super().get_route_handler()
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+import orjson
+
+from cache import LRUCache
+
+
+def read_index_version(path: str) -> int:
+    """
+    Returns:
+        int: Version number in the index version file, 0 if there is none yet.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return int(file.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def bump_index_version(path: str) -> int:
+    """
+    Increments the index version after the collections changed, invalidating cached results.
+
+    Returns:
+        int: The new version.
+    """
+    version = read_index_version(path) + 1
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Written next to the target and renamed, readers never see a partial file
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(f"{version}\n")
+    os.replace(temp_path, path)
+    return version
+
+
+class IndexVersion:
+    """
+    Follows the index version file written by tools/db_processor.py.
+
+    The file is only re-read when its modification time or size changed; a stat per lookup is
+    cheap enough that a new version is seen by the very next request.
+
+    Args:
+        path (str): Location of the version file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.value = 0
+        self._stamp = None
+
+    def current(self) -> int:
+        try:
+            stat = os.stat(self.path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp != self._stamp:
+            self._stamp = stamp
+            self.value = read_index_version(self.path) if stamp is not None else 0
+        return self.value
+
+
+def result_key(endpoint: str, **params) -> str:
+    """
+    Builds the cache key of a request from its endpoint and normalized parameters.
+    """
+    return json.dumps([endpoint, params], sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+                      default=sorted)
+
+
+class ResultCache:
+    """
+    Cache for complete endpoint results, scoped to the index version.
+
+    Every entry belongs to the index version it was computed from; once ingest bumps the
+    version, older entries are never served again. The first tier is an in-process LRU, the
+    optional second tier a SQLite file shared by the workers on the same host, like the disk
+    tier of the embedding cache. Entries expire after ttl seconds in both tiers.
+
+    Returned results are shared between requests and must not be modified.
+
+    Args:
+        version (IndexVersion): Source of the current index version.
+        memory_size (int): Maximum number of results kept in process, 0 disables the cache.
+        ttl (float): Seconds a result is served.
+        disk_path (str, optional): Path of the SQLite file. The shared tier is disabled if empty.
+        disk_max_entries (int): Maximum number of rows kept on disk.
+    """
+
+    def __init__(self, version: IndexVersion, memory_size=2048, ttl=600.0, disk_path: Optional[str] = None,
+                 disk_max_entries=50000):
+        self.version = version
+        self.memory = LRUCache(memory_size)
+        self.ttl = ttl
+        self.disk_max_entries = disk_max_entries
+        self.disk_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._version = version.current()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._disk_rows = 0
+        self._disk_version = None
+
+        if disk_path and memory_size > 0:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT NOT NULL, version INTEGER NOT NULL, value BLOB NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (key, version))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)")
+            self._disk_rows = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    @property
+    def enabled(self):
+        return self.memory.maxsize > 0
+
+    def _current_version(self) -> int:
+        version = self.version.current()
+        if version != self._version:
+            # Results of the old index are unreachable now, free the memory they hold. Their rows
+            # on disk are deleted with the next disk access.
+            self._version = version
+            self.memory.clear()
+            self.invalidations += 1
+        return version
+
+    async def get(self, key: str) -> Optional[Any]:
+        """
+        Looks a result up in memory, then on disk in a worker thread, so SQLite I/O never blocks
+        the event loop.
+        """
+        if not self.enabled:
+            return None
+        version = self._current_version()
+        now = time.time()
+        entry = self.memory.get((version, key))
+        if entry is not None:
+            if entry[0] > now:
+                return entry[1]
+            self.memory.pop((version, key))
+
+        if self._db is not None:
+            row = await asyncio.to_thread(self._disk_get, key, version, now)
+            if row is not None:
+                value = orjson.loads(row[0])
+                self.memory.put((version, key), (row[1], value))
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, value: Any, version: Optional[int] = None):
+        """
+        Stores a result computed from the given index version, by default the current one.
+        """
+        if not self.enabled:
+            return
+        current = self._current_version()
+        if version is not None and version != current:
+            # Computed while ingest bumped the version, it may mix both indexes
+            return
+        expires_at = time.time() + self.ttl
+        self.memory.put((current, key), (expires_at, value))
+
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_put, key, current, orjson.dumps(value), expires_at)
+
+    def _purge_old_versions(self, version: int):
+        # Called with the lock held
+        if version != self._disk_version:
+            self._db.execute("DELETE FROM results WHERE version < ?", (version,))
+            self._disk_rows = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            self._disk_version = version
+
+    def _disk_get(self, key: str, version: int, now: float):
+        with self._db_lock:
+            self._purge_old_versions(version)
+            return self._db.execute(
+                "SELECT value, expires_at FROM results WHERE key = ? AND version = ? AND expires_at > ?",
+                (key, version, now)
+            ).fetchone()
+
+    def _disk_put(self, key: str, version: int, value: bytes, expires_at: float):
+        with self._db_lock:
+            self._purge_old_versions(version)
+            cursor = self._db.execute(
+                "INSERT OR REPLACE INTO results (key, version, value, expires_at) VALUES (?, ?, ?, ?)",
+                (key, version, value, expires_at)
+            )
+            self._disk_rows += cursor.rowcount
+            if self._disk_rows > self.disk_max_entries:
+                self._evict()
+
+    def _evict(self):
+        # Expired rows go first, then the ones closest to expiry; chunks of 10% as in the embedding cache
+        self._db.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+        self._disk_rows = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        excess = self._disk_rows - self.disk_max_entries
+        if excess <= 0:
+            return
+        excess += self.disk_max_entries // 10
+        self._db.execute(
+            "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY expires_at LIMIT ?)",
+            (excess,)
+        )
+        self._disk_rows = max(self._disk_rows - excess, 0)
+
+    def stats(self):
+        memory_stats = self.memory.stats()
+        lookups = memory_stats["hits"] + self.disk_hits + self.misses
+        return {
+            "index_version": self._version,
+            "memory_size": memory_stats["size"],
+            "memory_hits": memory_stats["hits"],
+            "disk_enabled": self._db is not None,
+            "disk_size": self._disk_rows,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": (memory_stats["hits"] + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+def result_cache_from_env():
+    return ResultCache(
+        IndexVersion(os.getenv("INDEX_VERSION_PATH", "../db/index_version")),
+        memory_size=int(os.getenv("RESULT_CACHE_SIZE", "2048")),
+        ttl=float(os.getenv("RESULT_CACHE_TTL", "600")),
+        disk_path=os.getenv("RESULT_CACHE_PATH") or None,
+        disk_max_entries=int(os.getenv("RESULT_CACHE_DISK_MAX", "50000")),
+    )
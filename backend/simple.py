@@ -1,20 +1,202 @@
+import asyncio
 import json
+import os
+from contextlib import asynccontextmanager
 
+import httpx
 from chromadb.api.types import IncludeEnum
-from fastapi import FastAPI, Query
-from typing import List, Optional, Union
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field
+from typing import Annotated, List, Literal, Optional, Tuple, Union
 from uuid import UUID
 import chromadb
-from openai import OpenAI
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
 
+from cache import LRUCache
+from catalog import RecipeCatalog
+from embedding_cache import embedding_cache_from_env, normalize_text
+from embedding_providers import provider_from_env
+from lexical import LexicalIndex, reciprocal_rank_fusion
+from metrics import MetricsMiddleware, registry, stage, upstream_call
+from responses import CompactJSONRoute, needs_metadata, parse_fields, project, public_recipe
+from result_cache import result_cache_from_env, result_key
+from startup import Startup, StartupError
+from vector_index import VectorIndex
+from substitutions import (SUBSTITUTION_MODEL, SubstitutionCache, SubstitutionTable, parse_substitutions,
+                           substitution_prompt)
+
 # Load envs and setup openai client
 load_dotenv()
-client = OpenAI()
 
-# Initialize FastAPI
-app = FastAPI()
+# Per-call timeouts in seconds for the upstream services
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+CHROMA_TIMEOUT = float(os.getenv("CHROMA_TIMEOUT", "10"))
+
+# Maximum number of queries accepted by /search_batch
+SEARCH_BATCH_MAX = int(os.getenv("SEARCH_BATCH_MAX", "64"))
+
+# Lexical (BM25) fast path and rank fusion for /search_by_text
+LEXICAL_SEARCH = os.getenv("LEXICAL_SEARCH", "true").lower() in ("1", "true", "yes")
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Send per-stage durations of each request in a Server-Timing header
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() in ("1", "true", "yes")
+
+# Optional gzip compression of responses of at least GZIP_MIN_SIZE bytes
+GZIP_RESPONSES = os.getenv("GZIP_RESPONSES", "false").lower() in ("1", "true", "yes")
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+
+# Startup: Chroma is connected in the background with retries, requests wait at most STARTUP_WAIT
+# seconds for it. With WARMUP the app only reports ready once caches and connections are primed.
+STARTUP_RETRY_MIN = float(os.getenv("STARTUP_RETRY_MIN", "0.5"))
+STARTUP_RETRY_MAX = float(os.getenv("STARTUP_RETRY_MAX", "10"))
+STARTUP_WAIT = float(os.getenv("STARTUP_WAIT", "5"))
+WARMUP = os.getenv("WARMUP", "false").lower() in ("1", "true", "yes")
+WARMUP_EMBEDDINGS = int(os.getenv("WARMUP_EMBEDDINGS", "1000"))
+WARMUP_QUERIES_PATH = os.getenv("WARMUP_QUERIES_PATH", "")
+
+# Similarity search engine: chroma (server side HNSW) or numpy (in-process, memory-mapped export)
+SEARCH_ENGINE = os.getenv("SEARCH_ENGINE", "chroma")
+
+# One pooled async client for all OpenAI calls, requests waiting on OpenAI do not hold a thread
+client = AsyncOpenAI(
+    timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=5.0),
+    max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+    http_client=httpx.AsyncClient(limits=httpx.Limits(
+        max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "200")),
+        max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE", "50"))
+    ))
+)
+
+# Query embeddings come from the provider selected by EMBEDDING_PROVIDER (openai, local or hashing)
+embedding_provider = provider_from_env(async_client=client)
+
+# Cache for query embeddings, repeated chat phrases skip the embedding round trip
+embedding_cache = embedding_cache_from_env()
+
+# Hot recipe objects for detail pages, keyed by index version and recipe ID
+recipe_cache = LRUCache(int(os.getenv("RECIPE_CACHE_SIZE", "2048")))
+
+# Complete search and listing results, valid until tools/db_processor.py bumps the index version
+result_cache = result_cache_from_env()
+
+# BM25 index over the recipe documents, kept in line with the catalog
+lexical_index = LexicalIndex()
+
+# Exported embedding matrices for SEARCH_ENGINE=numpy, written by tools/export_vectors.py
+vector_indexes = {
+    name: VectorIndex(os.getenv("VECTOR_INDEX_DIR", "../db/vectors"), name,
+                      embedding_provider.model, embedding_provider.dimension)
+    for name in ("recipes", "recipes_by_ingredients")
+} if SEARCH_ENGINE == "numpy" else {}
+
+# Set up by connect_upstreams, the async Chroma client can only be created inside the event loop
+chroma_client = None
+recipes_collection = None
+ingredients_collection = None
+catalog: Optional[RecipeCatalog] = None
+
+# Index version the catalog snapshot includes, and the reload started for a newer one
+catalog_version = 0
+catalog_sync: Optional[Tuple[int, asyncio.Task]] = None
+
+
+async def connect_upstreams():
+    global chroma_client, recipes_collection, ingredients_collection, catalog, catalog_version
+
+    # Initialize ChromaDB client, its connections are pooled and kept alive
+    new_client = await chroma_call(chromadb.AsyncHttpClient(
+        host=os.getenv("CHROMA_HOST", "localhost"),
+        port=int(os.getenv("CHROMA_PORT", "8000"))
+    ), "connect")
+
+    # Connect to collections
+    recipes = await chroma_call(new_client.get_collection(name="recipes"), "get_collection")
+    ingredients = await chroma_call(new_client.get_collection(name="recipes_by_ingredients"), "get_collection")
+
+    # Query vectors must come from the model the collections were built with, retrying won't help
+    try:
+        embedding_provider.check_collection(recipes)
+        embedding_provider.check_collection(ingredients)
+    except RuntimeError as e:
+        raise StartupError(str(e)) from e
+
+    # Published together, requests only see a complete set of upstream objects
+    chroma_client, recipes_collection, ingredients_collection = new_client, recipes, ingredients
+
+    # In-process columnar copy of the recipe metadata, answers listing and filter requests. It is
+    # loaded on first use, after the version read here.
+    catalog_version = result_cache.version.current()
+    catalog = RecipeCatalog(
+        recipes_collection,
+        check_interval=float(os.getenv("CATALOG_CHECK_INTERVAL", "5")),
+        max_age=float(os.getenv("CATALOG_MAX_AGE", "300")),
+        on_refresh=on_catalog_refresh
+    )
+
+
+def warmup_queries():
+    # One query per line, e.g. the most frequent queries from the logs
+    if not WARMUP_QUERIES_PATH or not os.path.exists(WARMUP_QUERIES_PATH):
+        return []
+    with open(WARMUP_QUERIES_PATH, "r", encoding="utf-8") as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+async def warm_up():
+    """
+    Does the work the first requests would otherwise pay for: loads the catalog and builds the
+    lexical index, moves recently used query embeddings from the disk cache into memory, embeds
+    the warm-up queries and runs one query per collection, which opens the OpenAI and Chroma
+    connections and loads the vector indexes.
+    """
+    await catalog.get()
+    await catalog.wait_idle()
+
+    preloaded = await asyncio.to_thread(embedding_cache.preload, embedding_provider.model, WARMUP_EMBEDDINGS)
+    queries = warmup_queries()
+    embeddings = await generate_embeddings(queries or ["recipe"])
+    await asyncio.gather(*[
+        vector_query(collection, embeddings[:1], 1, None, include=[IncludeEnum.distances])
+        for collection in (recipes_collection, ingredients_collection)
+    ])
+    print(f"Warm-up: {preloaded} cached embeddings loaded, {len(queries)} queries embedded")
+
+
+# Connects in the background, so the process starts while Chroma is still coming up
+startup = Startup(connect_upstreams, warm_up if WARMUP else None,
+                  min_delay=STARTUP_RETRY_MIN, max_delay=STARTUP_RETRY_MAX)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup.start()
+
+    yield
+
+    await startup.stop()
+    await client.close()
+
+
+# Answered without upstream services
+PROBE_PATHS = {"/health", "/ready", "/metrics", "/cache_stats"}
+
+
+async def require_upstreams(request: Request):
+    if startup.connected or request.url.path in PROBE_PATHS:
+        return
+    if not await startup.wait(STARTUP_WAIT):
+        raise HTTPException(status_code=503, detail="Backend is starting", headers={"Retry-After": "1"})
+
+
+# Initialize FastAPI, routes record their stage timings and render their results with orjson
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse, dependencies=[Depends(require_upstreams)])
+app.router.route_class = CompactJSONRoute
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,21 +206,96 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
-# Initialize ChromaDB client
-chroma_client = chromadb.HttpClient()
-
-# Connect to collections
-recipes_collection = chroma_client.get_collection(name="recipes")
-ingredients_collection = chroma_client.get_collection(name="recipes_by_ingredients")
-
-
-# Dummy function to simulate embedding generation
-def generate_ada_embedding(text: str, model='text-embedding-3-small'):
-    if text == "":
-        return generate_zero_vector(1536)
-
-    text = text.replace('\n', ' ')
-    return client.embeddings.create(input=[text], model=model).data[0].embedding
+if GZIP_RESPONSES:
+    app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE)
+
+# Outermost, so the measured time includes the other middleware
+app.add_middleware(MetricsMiddleware, server_timing=SERVER_TIMING)
+
+async def chroma_call(awaitable, operation="query"):
+    # The async Chroma client has no request timeout of its own
+    return await upstream_call("chroma", operation, asyncio.wait_for(awaitable, timeout=CHROMA_TIMEOUT))
+
+
+async def vector_query(collection, query_embeddings, n_results: int, filters, include=None):
+    """
+    Runs a similarity query on the configured search engine.
+
+    The numpy engine answers in process when an export is loaded and the catalog can evaluate the
+    filters, otherwise the query goes to Chroma. Both return the Chroma result layout.
+    """
+    with stage("vector_query"):
+        index = vector_indexes.get(collection.name)
+        if index is not None:
+            await index.refresh()
+        if index is not None and index.available():
+            snapshot = await catalog.get()
+            rows = snapshot.match(filters)
+            if rows is not None:
+                view = index.view(snapshot, rows, json.dumps(filters, sort_keys=True))
+                hits = await asyncio.to_thread(index.search, view, query_embeddings, n_results)
+                return index.results(snapshot, hits)
+
+        return await chroma_call(collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            include=include or [IncludeEnum.distances, IncludeEnum.metadatas],
+            where=filters
+        ))
+
+
+async def fetch_documents(ids: List[str]):
+    results = await chroma_call(recipes_collection.get(ids=ids, include=[IncludeEnum.documents]), "get")
+    return dict(zip(results["ids"], results["documents"]))
+
+
+async def on_catalog_refresh(snapshot):
+    recipe_cache.clear()
+    if LEXICAL_SEARCH:
+        # Only recipes whose content hash changed since the last snapshot are re-indexed
+        changed = await lexical_index.sync(snapshot, fetch_documents)
+        print(f"Lexical index: {changed} recipes updated, {len(lexical_index)} indexed")
+
+
+async def generate_embeddings(texts: List[str]):
+    """
+    Embeds several texts with at most one call to the embedding provider.
+
+    Cached texts are answered from the embedding cache, the remaining distinct ones are sent
+    together in a single request.
+    """
+    model = embedding_provider.model
+    embeddings = [None] * len(texts)
+    missing = {}
+    with stage("embed"):
+        positions = []
+        for i, text in enumerate(texts):
+            if text == "":
+                embeddings[i] = generate_zero_vector(embedding_provider.dimension)
+            else:
+                positions.append(i)
+
+        cached = await embedding_cache.get_many(model, [texts[i] for i in positions])
+        for i, embedding in zip(positions, cached):
+            if embedding is not None:
+                embeddings[i] = embedding
+            else:
+                # Spellings that share a cache entry are embedded once, as the first one was written
+                missing.setdefault(normalize_text(texts[i]), (texts[i], []))[1].append(i)
+
+        if missing:
+            missing_texts = [text for text, _ in missing.values()]
+            vectors = await upstream_call("embedding", model, embedding_provider.aembed(missing_texts))
+            await embedding_cache.put_many(model, missing_texts, vectors)
+            for (_, text_positions), embedding in zip(missing.values(), vectors):
+                for i in text_positions:
+                    embeddings[i] = embedding
+
+    return embeddings
+
+
+async def generate_embedding(text: str):
+    return (await generate_embeddings([text]))[0]
 
 
 def generate_zero_vector(dim: int):
@@ -52,8 +309,8 @@ def extract_recipes(results, similarity_limit=0.6):
         if results["distances"][0][i] > similarity_limit:
             continue
 
-        # Extract metadata dynamically
-        metadata = results["metadatas"][0][i]
+        # Extract metadata dynamically, queries for IDs and distances only come without it
+        metadata = results["metadatas"][0][i] if results.get("metadatas") else {}
         recipe = {"id": results["ids"][0][i], "distance": results["distances"][0][i]}
 
         # Add all metadata fields dynamically
@@ -63,6 +320,58 @@ def extract_recipes(results, similarity_limit=0.6):
     return recipes
 
 
+def lexical_search(snapshot, query_text: str, filters, limit: int):
+    """
+    Ranks recipes for a query with the BM25 index, restricted to the rows matching the filters.
+
+    Returns:
+        list: Recipes in the same format as extract_recipes, without a vector distance. Empty if
+            the index is not ready or the filters cannot be answered by the catalog.
+    """
+    if not LEXICAL_SEARCH or not lexical_index.ready:
+        return []
+    rows = snapshot.match(filters)
+    if rows is None:
+        return []
+
+    def accept(recipe_id):
+        row = snapshot.row_by_id.get(recipe_id)
+        return row is not None and (rows >> row) & 1
+
+    return [
+        {"id": recipe_id, "distance": None, **snapshot.metadatas[snapshot.row_by_id[recipe_id]]}
+        for recipe_id, _ in lexical_index.search(query_text, limit, accept)
+    ]
+
+
+def fuse_recipes(rankings: List[List[dict]], n_results: int):
+    # Reciprocal-rank fusion, a recipe keeps the entry of the first ranking it appears in
+    recipes = {}
+    for ranking in rankings:
+        for recipe in ranking:
+            recipes.setdefault(recipe["id"], recipe)
+    fused = reciprocal_rank_fusion([[recipe["id"] for recipe in ranking] for ranking in rankings], k=RRF_K)
+    return [recipes[recipe_id] for recipe_id, _ in fused[:n_results]]
+
+
+def query_result_at(results, i, n_results):
+    # Cuts the i-th query out of a multi-query Chroma result, keeping the single-query layout
+    return {
+        key: [values[i][:n_results]]
+        for key, values in results.items()
+        if key in ("ids", "distances", "metadatas", "documents") and values is not None
+    }
+
+
+# Query parameter of the list endpoints
+FIELDS_QUERY = Query(description="Comma-separated recipe fields to return, e.g. title,img_links, or card")
+
+
+def search_include(fields):
+    # Documents are never returned, metadata only when a projected field needs it
+    return [IncludeEnum.distances, IncludeEnum.metadatas] if needs_metadata(fields) else [IncludeEnum.distances]
+
+
 def build_filters(
         diet_type: Optional[str] = None,
         cuisine: Optional[str] = None,
@@ -92,158 +401,220 @@ def build_filters(
         return None  # No filters
 
 
-@app.get("/diet_types")
-def get_diet_types():
-    # Generate a zero vector with the correct dimensionality
-    zero_vector = generate_zero_vector(1536)  # Adjust to your collection's dimensionality
-
-    # Perform the query using the zero vector as a placeholder
-    results = recipes_collection.query(
-        query_embeddings=[zero_vector],  # Placeholder embedding
-        n_results=recipes_collection.count()  # Retrieve all documents
-    )
+async def catalog_snapshot():
+    """
+    Returns the catalog snapshot. After ingest bumped the index version, the catalog is reloaded
+    first, so results cached under the new version never come from the old catalog.
+    """
+    global catalog_version, catalog_sync
+    with stage("catalog"):
+        version = result_cache.version.current()
+        if version != catalog_version:
+            # Concurrent requests share one reload
+            if catalog_sync is None or catalog_sync[0] != version:
+                catalog_sync = (version, asyncio.create_task(catalog.refresh()))
+            try:
+                await asyncio.shield(catalog_sync[1])
+            except Exception:
+                # The next request tries again
+                catalog_sync = None
+                raise
+            catalog_version = version
+        return await catalog.get()
+
+
+async def cached_result(key: str, compute, cacheable=True):
+    """
+    Answers a request from the result cache, or computes the result and caches it.
+    """
+    with stage("result_cache"):
+        result = await result_cache.get(key)
+    if result is not None:
+        return result
+
+    # Results computed while ingest bumps the version are not cached
+    version = result_cache.version.current()
+    result = await compute()
+    if cacheable:
+        await result_cache.put(key, result, version)
+    return result
+
+
+@app.get("/health")
+async def get_health():
+    # Liveness: the process answers, whatever the state of the upstream services
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def get_ready():
+    # Readiness: connected to the upstream services and, if enabled, warmed up
+    status = startup.status()
+    return ORJSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+@app.get("/cache_stats")
+async def get_cache_stats():
+    return {
+        "embeddings": embedding_cache.stats(),
+        "recipes": recipe_cache.stats(),
+        "results": result_cache.stats(),
+        "substitutions": substitution_cache.stats()
+    }
 
-    # Extract distinct diet types
-    if "metadatas" in results:
-        diet_types = set(
-            meta.get("diet_type", "Unknown")
-            for metas in results["metadatas"]
-            for meta in metas if meta
-        )
-        return list(diet_types)
 
-    # Return empty list if no data found
-    return []
+def cache_lookups():
+    # Hits and misses per cache, read from the counters the caches keep anyway
+    embeddings = embedding_cache.stats()
+    recipes = recipe_cache.stats()
+    results = result_cache.stats()
+    substitutions = substitution_cache.stats()
+    return {
+        "embeddings": (embeddings["memory_hits"] + embeddings["disk_hits"], embeddings["misses"]),
+        "recipes": (recipes["hits"], recipes["misses"]),
+        "results": (results["memory_hits"] + results["disk_hits"], results["misses"]),
+        "substitutions": (substitutions["memory_hits"] + substitutions["stale_hits"] + substitutions["table_hits"],
+                          substitutions["llm_calls"]),
+    }
 
 
-@app.get("/cuisines")
-def get_cuisines():
-    # Generate a zero vector with the correct dimensionality
-    zero_vector = generate_zero_vector(1536)  # Adjust to match your collection's dimensionality
-
-    # Perform the query using the zero vector as a placeholder
-    results = recipes_collection.query(
-        query_embeddings=[zero_vector],  # Use a zero vector as a placeholder embedding
-        n_results=recipes_collection.count()  # Retrieve all documents
-    )
+registry.collected("backend_cache_hits_total", "Cache lookups answered from the cache.", "counter", ["cache"],
+                   lambda: [((name,), hits) for name, (hits, _) in cache_lookups().items()])
+registry.collected("backend_cache_misses_total", "Cache lookups that went to the source.", "counter", ["cache"],
+                   lambda: [((name,), misses) for name, (_, misses) in cache_lookups().items()])
+registry.collected("backend_cache_hit_ratio", "Share of cache lookups answered from the cache.", "gauge", ["cache"],
+                   lambda: [((name,), hits / (hits + misses) if hits + misses else 0.0)
+                            for name, (hits, misses) in cache_lookups().items()])
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/diet_types")
+async def get_diet_types():
+    # Distinct values come straight from the catalog's diet_type index
+    return (await catalog_snapshot()).values("diet_type")
 
-    # Extract unique cuisines from the metadata
-    if "metadatas" in results:
-        cuisines = set(
-            meta.get("cuisine", "Unknown")
-            for metas in results["metadatas"]
-            for meta in metas if meta
-        )
-        return list(cuisines)
 
-    # Return an empty list if no data is found
-    return []
+@app.get("/cuisines")
+async def get_cuisines():
+    # Distinct values come straight from the catalog's cuisine index
+    return (await catalog_snapshot()).values("cuisine")
+
+
+async def ask_substitutions(ingredient_query: str):
+    # Call GPT-4o-mini in JSON mode so that the answer always parses
+    response = await upstream_call("openai", "chat", client.chat.completions.create(
+        model=SUBSTITUTION_MODEL,
+        messages=[{"role": "user", "content": substitution_prompt(ingredient_query)}],
+        response_format={"type": "json_object"}
+    ))
+    return parse_substitutions(response.choices[0].message.content or "")
+
+
+# Answers common substitutions from the precomputed table or recent LLM answers
+substitution_cache = SubstitutionCache(
+    ask_substitutions,
+    SubstitutionTable(os.getenv("SUBSTITUTIONS_TABLE_PATH", "../db/substitutions.sqlite")),
+    ttl=float(os.getenv("SUBSTITUTIONS_TTL", str(7 * 24 * 3600))),
+    maxsize=int(os.getenv("SUBSTITUTIONS_CACHE_SIZE", "4096")),
+    miss_wait=float(os.getenv("SUBSTITUTIONS_MISS_WAIT", "2"))
+)
 
 
 @app.get("/substitute")
-def get_substitute(
-        query: str = Query(..., description="Ingredient(s) to find substitutions for, separated by commas if multiple")
+async def get_substitute(
+        query: Annotated[str, Query(
+            description="Ingredient(s) to find substitutions for, separated by commas if multiple")]
 ):
     try:
-        # Handle single or multiple ingredients
-        ingredients = query.split(",")  # Split comma-separated query string into a list
-        ingredient_query = ", ".join(ingredient.strip() for ingredient in ingredients)
-
-        # Define the prompt for GPT-4o-mini
-        prompt = (
-            f"Provide 1 to 3 substitutions for the ingredient '{ingredient_query}'. "
-            "Each substitution should be a simple and practical alternative."
-            "Only answer with the substitions as JSON without the json formatting (NO 3 time ` json stuff)"
-            "directly answer with raw json"
-            
-            f"""
-            Always answer like this:
-            
-            {{
-                "substitutions": [place substitions here]
-            }}
-            
-            Just place what to substitiute with no manual how to do it. Each substitution is just a string.
-            """
-        )
-
-        # Call GPT-4o-mini
-        clientresponse = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}]
-        )
-
-        # Extract substitutions from the response
-        raw_response = clientresponse.choices[0].message.content
-
-        # Convert the response into a list of substitutions
-        substitutions = raw_response.split("\n")
-        substitutions = [sub.strip() for sub in substitutions if sub.strip()]
-
-        if isinstance(raw_response, str):
-            try:
-                return json.loads(raw_response)
-            except json.JSONDecodeError:
-                raise ValueError("Failed to decode GPT's response as JSON.")
-        elif isinstance(raw_response, dict):
-            return raw_response  # Already a dict
-        else:
-            raise ValueError("Unexpected GPT response format.")
-
+        with stage("substitutions"):
+            substitutions = await substitution_cache.get(query)
     except Exception as e:
-        return []
+        print(f"Error fetching substitutions: {e}")
+        substitutions = None
 
+    # pending: the answer is still being fetched and will be served to the next request
+    return {"substitutions": substitutions or [], "pending": substitution_cache.pending(query)}
 
-@app.get("/recipes/{recipe_id}")
-def get_recipe_by_id(recipe_id: UUID):
-    # Generate a zero vector with the correct dimensionality
-    zero_vector = generate_zero_vector(1536)  # Adjust to match your collection's dimensionality
-
-    # Perform the query using the zero vector as a placeholder
-    results = recipes_collection.query(
-        query_embeddings=[zero_vector],  # Use the zero vector
-        where={"id": str(recipe_id)},  # Filter by recipe ID
-        n_results=1  # Limit results to 1
-    )
 
-    # Check if any documents are found
-    if results["documents"]:
-        return results["metadatas"][0][0]
+# Registered before /recipes/{recipe_id}, which would otherwise capture the path
+@app.get("/recipes/filter")
+async def filter_recipes(
+        diet_type: Optional[str] = None,
+        cuisine: Optional[str] = None,
+        min_time_to_eat: Annotated[Optional[int], Query(ge=0)] = None,
+        max_time_to_eat: Annotated[Optional[int], Query(ge=0)] = None
+):
+    filters = build_filters(diet_type, cuisine, min_time_to_eat, max_time_to_eat)
+
+    snapshot = await catalog_snapshot()
+    rows = snapshot.match(filters)
+
+    # Same number of results as the previous default Chroma query
+    recipes = [
+        {"id": snapshot.ids[row], **public_recipe(snapshot.metadatas[row])}
+        for row in snapshot.page(rows, 0, 10)
+    ]
+
+    return {"recipes": recipes}
+
+
+@app.get("/recipes/{recipe_id}")
+async def get_recipe_by_id(recipe_id: UUID):
+    recipe_id = str(recipe_id)
+    # Entries of an older index version are never hit again, ingest may have changed the recipe
+    key = (result_cache.version.current(), recipe_id)
+    recipe = recipe_cache.get(key)
+    if recipe is not None:
+        return recipe
+
+    # Recipes are stored under their ID, so this is a key lookup instead of a vector query
+    results = await chroma_call(recipes_collection.get(ids=[recipe_id], include=[IncludeEnum.metadatas]), "get")
+
+    if results["metadatas"]:
+        recipe = public_recipe(results["metadatas"][0])
+        recipe_cache.put(key, recipe)
+        return recipe
 
     # Return an error if no recipe is found
     return {"error": "Recipe not found"}
 
 
 @app.get("/recipes")
-def get_recipes_paginated(
-        page: int = Query(1, ge=1),  # Page number, default is 1
-        limit: int = Query(10, ge=1),  # Number of recipes per page, default is 10
+async def get_recipes_paginated(
+        page: Annotated[int, Query(ge=1)] = 1,  # Page number, default is 1
+        limit: Annotated[int, Query(ge=1)] = 10,  # Number of recipes per page, default is 10
         diet_type: Optional[str] = None,
         cuisine: Optional[str] = None,
-        min_time_to_eat: Optional[int] = Query(None, ge=0),
-        max_time_to_eat: Optional[int] = Query(None, ge=0)
+        min_time_to_eat: Annotated[Optional[int], Query(ge=0)] = None,
+        max_time_to_eat: Annotated[Optional[int], Query(ge=0)] = None,
+        fields: Annotated[Optional[str], FIELDS_QUERY] = None
 ):
+    try:
+        fields = parse_fields(fields)
+    except ValueError as e:
+        return {"error": str(e), "page": page, "limit": limit, "total_recipes": 0, "recipes": []}
+
     # Build filters
     filters = build_filters(diet_type, cuisine, min_time_to_eat, max_time_to_eat)
-    zero_vector = generate_zero_vector(1536)
 
-    print(filters)
+    key = result_key("/recipes", page=page, limit=limit, filters=filters, fields=fields)
+    return await cached_result(key, lambda: recipes_page(page, limit, filters, fields))
 
-    # Query recipes with filters
-    results = recipes_collection.query(
-        query_embeddings=[zero_vector],  # Placeholder embedding
-        n_results=recipes_collection.count(),  # Fetch all available results
-        include=[IncludeEnum.metadatas],
-        where=filters
-    )
 
-    # Flatten the nested list
-    all_metadatas = [meta for sublist in results["metadatas"] for meta in sublist]
+async def recipes_page(page: int, limit: int, filters, fields):
+    # Resolve the filters against the catalog's bitmap indexes
+    snapshot = await catalog_snapshot()
+    rows = snapshot.match(filters)
+    total_recipes = rows.bit_count()
 
-    if not all_metadatas:
+    if not total_recipes:
         return {"error": "No recipes found", "page": page, "limit": limit, "total_recipes": 0, "recipes": []}
 
-    total_recipes = len(all_metadatas)
     offset = (page - 1) * limit
 
     # Ensure offset does not exceed total results
@@ -251,10 +622,8 @@ def get_recipes_paginated(
         return {"error": "Page exceeds total available recipes", "page": page, "limit": limit,
                 "total_recipes": total_recipes, "recipes": []}
 
-    # Apply pagination manually
-    paginated_metadata = all_metadatas[offset:offset + limit]
-
-    recipes = [meta for meta in paginated_metadata]
+    # Only the rows of the requested page are materialized, with the requested fields
+    recipes = project([snapshot.metadatas[row] for row in snapshot.page(rows, offset, limit)], fields)
 
     return {
         "page": page,
@@ -265,80 +634,162 @@ def get_recipes_paginated(
 
 
 @app.get("/search_by_ingredients")
-def search_by_ingredients(
+async def search_by_ingredients(
         ingredient_query: str,
         n_results: int = 3,
         diet_type: Optional[str] = None,
         cuisine: Optional[str] = None,
-        min_time_to_eat: Optional[int] = Query(None, ge=0),
-        max_time_to_eat: Optional[int] = Query(None, ge=0)
+        min_time_to_eat: Annotated[Optional[int], Query(ge=0)] = None,
+        max_time_to_eat: Annotated[Optional[int], Query(ge=0)] = None,
+        fields: Annotated[Optional[str], FIELDS_QUERY] = None
 ):
-    # Generate embedding for the ingredient query
-    ingredient_embedding = generate_ada_embedding(ingredient_query)
+    try:
+        fields = parse_fields(fields)
+    except ValueError as e:
+        return {"error": str(e), "recipes": []}
+
     filters = build_filters(diet_type, cuisine, min_time_to_eat, max_time_to_eat)
 
+    # Spellings that only differ in case and whitespace share one cached result
+    key = result_key("/search_by_ingredients", ingredient_query=normalize_text(ingredient_query),
+                     n_results=n_results, filters=filters, fields=fields)
+    return await cached_result(key, lambda: ingredient_search(ingredient_query, n_results, filters, fields))
+
+
+async def ingredient_search(ingredient_query: str, n_results: int, filters, fields):
+    # Generate embedding for the ingredient query
+    ingredient_embedding = await generate_embedding(ingredient_query)
+
     # Perform similarity search
-    results = ingredients_collection.query(
-        query_embeddings=[ingredient_embedding],
-        n_results=n_results,
-        include=[IncludeEnum.distances, IncludeEnum.documents, IncludeEnum.metadatas],
-        where=filters
-    )
+    results = await vector_query(ingredients_collection, [ingredient_embedding], n_results, filters,
+                                 include=search_include(fields))
 
     # Use the helper function to extract recipes
-    recipes = extract_recipes(results)
+    with stage("extract"):
+        recipes = project(extract_recipes(results), fields)
 
     return {"recipes": recipes}
 
 
 @app.get("/search_by_text")
-def search_by_text(
+async def search_by_text(
         query_text: str,
         n_results: int = 3,
         diet_type: Optional[str] = None,
         cuisine: Optional[str] = None,
-        min_time_to_eat: Optional[int] = Query(None, ge=0),
-        max_time_to_eat: Optional[int] = Query(None, ge=0)
-):
-    query_embedding = generate_ada_embedding(query_text)
-    filters = build_filters(diet_type, cuisine, min_time_to_eat, max_time_to_eat)
-
-    results = recipes_collection.query(
-        query_embeddings=[query_embedding],
-        n_results=n_results,
-        where=filters
-    )
-
-    # Use the helper function to extract recipes
-    recipes = extract_recipes(results, similarity_limit=1)
-
-    return {"recipes": recipes}
-
-
-@app.get("/recipes/filter")
-def filter_recipes(
-        diet_type: Optional[str] = None,
-        cuisine: Optional[str] = None,
-        min_time_to_eat: Optional[int] = Query(None, ge=0),
-        max_time_to_eat: Optional[int] = Query(None, ge=0)
+        min_time_to_eat: Annotated[Optional[int], Query(ge=0)] = None,
+        max_time_to_eat: Annotated[Optional[int], Query(ge=0)] = None,
+        ingredient_query: Optional[str] = None,
+        fields: Annotated[Optional[str], FIELDS_QUERY] = None
 ):
-    filters = {}
-    zero_vector = generate_zero_vector(1536)
-    if diet_type:
-        filters["diet_type"] = diet_type
-    if cuisine:
-        filters["cuisine"] = cuisine
-    if min_time_to_eat is not None:
-        filters["time_to_eat"] = {"$gte": min_time_to_eat}
-    if max_time_to_eat is not None:
-        filters["time_to_eat"] = {**filters.get("time_to_eat", {}), "$lte": max_time_to_eat}
+    try:
+        fields = parse_fields(fields)
+    except ValueError as e:
+        return {"error": str(e), "recipes": []}
 
-    results = recipes_collection.query(
-        query_embeddings=[zero_vector],
-        where=filters
-    )
+    filters = build_filters(diet_type, cuisine, min_time_to_eat, max_time_to_eat)
+    ingredient_query = (ingredient_query or "").strip()
+
+    # Spellings that only differ in case and whitespace share one cached result
+    key = result_key("/search_by_text", query_text=normalize_text(query_text),
+                     ingredient_query=normalize_text(ingredient_query), n_results=n_results, filters=filters,
+                     fields=fields)
+    # Rankings change once the lexical index is built, results from before are not kept
+    return await cached_result(key, lambda: text_search(query_text, ingredient_query, n_results, filters, fields),
+                               cacheable=not LEXICAL_SEARCH or lexical_index.ready)
+
+
+async def text_search(query_text: str, ingredient_query: str, n_results: int, filters, fields):
+    snapshot = await catalog_snapshot()
+    with stage("lexical"):
+        lexical_recipes = lexical_search(snapshot, query_text, filters, max(n_results, SEARCH_CANDIDATES))
+
+    # Queries naming a dish are answered from the lexical index, without embedding or vector query,
+    # unless ingredients were given as well
+    if not ingredient_query and lexical_recipes and lexical_index.is_confident(query_text, lexical_recipes[0]["id"]):
+        return {"recipes": project(lexical_recipes[:n_results], fields)}
+
+    # The text and, if given, the ingredients are embedded together and both collections are
+    # queried at the same time. An empty query text next to ingredients has no ranking of its own.
+    searches = []
+    if query_text or not ingredient_query:
+        searches.append((recipes_collection, query_text, 1))
+    if ingredient_query:
+        # Same similarity limit as /search_by_ingredients
+        searches.append((ingredients_collection, ingredient_query, 0.6))
+    fused = len(searches) > 1 or bool(lexical_recipes)
+
+    embeddings = await generate_embeddings([text for _, text, _ in searches])
+    results = await asyncio.gather(*[
+        vector_query(collection, [embedding], max(n_results, SEARCH_CANDIDATES) if fused else n_results, filters,
+                     include=search_include(fields))
+        for (collection, _, _), embedding in zip(searches, embeddings)
+    ])
 
     # Use the helper function to extract recipes
-    recipes = extract_recipes(results)
-
-    return {"recipes": recipes}
+    with stage("extract"):
+        rankings = [
+            extract_recipes(result, similarity_limit=similarity_limit)
+            for result, (_, _, similarity_limit) in zip(results, searches)
+        ]
+        if not fused:
+            return {"recipes": project(rankings[0], fields)}
+
+        # Otherwise vector and lexical rankings are merged
+        return {"recipes": project(fuse_recipes(rankings + [lexical_recipes], n_results), fields)}
+
+
+class SearchQuery(BaseModel):
+    type: Literal["text", "ingredients"] = "text"
+    query: str
+    n_results: int = Field(3, ge=1)
+    diet_type: Optional[str] = None
+    cuisine: Optional[str] = None
+    min_time_to_eat: Optional[int] = Field(None, ge=0)
+    max_time_to_eat: Optional[int] = Field(None, ge=0)
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[SearchQuery]
+
+
+@app.post("/search_batch")
+async def search_batch(request: BatchSearchRequest):
+    if len(request.queries) > SEARCH_BATCH_MAX:
+        return {"error": f"At most {SEARCH_BATCH_MAX} queries per batch", "results": []}
+
+    # One embedding request for every query text in the batch
+    embeddings = await generate_embeddings([query.query for query in request.queries])
+
+    # Queries against the same collection with the same filters share one multi-vector query
+    groups = {}
+    for i, query in enumerate(request.queries):
+        filters = build_filters(query.diet_type, query.cuisine, query.min_time_to_eat, query.max_time_to_eat)
+        key = (query.type, json.dumps(filters, sort_keys=True))
+        groups.setdefault(key, (filters, []))[1].append(i)
+
+    async def run_group(query_type, filters, positions):
+        collection = recipes_collection if query_type == "text" else ingredients_collection
+        results = await vector_query(collection, [embeddings[i] for i in positions],
+                                     max(request.queries[i].n_results for i in positions), filters,
+                                     include=search_include(None))
+        # Same similarity limits as /search_by_text and /search_by_ingredients
+        similarity_limit = 1 if query_type == "text" else 0.6
+        with stage("extract"):
+            return [
+                (i, project(extract_recipes(query_result_at(results, j, request.queries[i].n_results),
+                                            similarity_limit), None))
+                for j, i in enumerate(positions)
+            ]
+
+    group_results = await asyncio.gather(*[
+        run_group(query_type, filters, positions)
+        for (query_type, _), (filters, positions) in groups.items()
+    ])
+
+    results = [None] * len(request.queries)
+    for group in group_results:
+        for i, recipes in group:
+            results[i] = {"recipes": recipes}
+
+    return {"results": results}
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+
+class StartupError(Exception):
+    """
+    Raised by a connect function for failures that retrying cannot fix, e.g. a configuration
+    that does not match the data.
+    """
+
+
+class Startup:
+    """
+    Connects to the upstream services in the background and tracks whether the app is ready.
+
+    The connect function is retried with exponential backoff until it succeeds, so the process
+    starts (and answers liveness probes) while a dependency like Chroma is still coming up.
+    After connecting, the optional warm-up runs; the app counts as ready once it is done.
+    A failing warm-up is reported but does not keep the app from becoming ready.
+
+    Args:
+        connect (Callable): Coroutine function that opens the upstream connections.
+        warmup (Callable, optional): Coroutine function that primes caches and connections.
+        min_delay (float): Seconds before the first retry.
+        max_delay (float): Upper bound of the retry delay.
+    """
+
+    def __init__(self, connect: Callable[[], Awaitable[None]], warmup: Optional[Callable[[], Awaitable[None]]] = None,
+                 min_delay=0.5, max_delay=10.0):
+        self.connect = connect
+        self.warmup = warmup
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.connected = False
+        self.ready = False
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.connect_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self._started_at = 0.0
+        self._connected_event: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._started_at = time.monotonic()
+            self._connected_event = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        delay = self.min_delay
+        while True:
+            self.attempts += 1
+            try:
+                await self.connect()
+                break
+            except StartupError as e:
+                self.error = str(e)
+                print(f"Startup failed: {e}")
+                # Nobody has to wait for a connection that will not come
+                self._connected_event.set()
+                return
+            except Exception as e:
+                self.error = repr(e)
+                print(f"Connecting to upstream services failed (attempt {self.attempts}): {e!r}, "
+                      f"retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_delay)
+
+        self.error = None
+        self.connected = True
+        self.connect_seconds = time.monotonic() - self._started_at
+        self._connected_event.set()
+        print(f"Connected to upstream services in {self.connect_seconds:.2f}s ({self.attempts} attempts)")
+
+        if self.warmup is not None:
+            start = time.monotonic()
+            try:
+                await self.warmup()
+            except Exception as e:
+                print(f"Warm-up failed: {e!r}")
+            self.warmup_seconds = time.monotonic() - start
+            print(f"Warm-up finished in {self.warmup_seconds:.2f}s")
+        self.ready = True
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits up to timeout seconds for the upstream connections.
+
+        Returns:
+            bool: Whether the upstream services are connected.
+        """
+        if self.connected:
+            return True
+        self.start()
+        try:
+            await asyncio.wait_for(self._connected_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.connected
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "connected": self.connected,
+            "warming_up": self.connected and not self.ready,
+            "attempts": self.attempts,
+            "error": self.error,
+            "connect_seconds": self.connect_seconds,
+            "warmup_seconds": self.warmup_seconds,
+        }
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from cache import LRUCache
+
+SUBSTITUTION_MODEL = "gpt-4o-mini"
+
+
+def normalize_ingredient(name: str) -> str:
+    """
+    Lower-cases an ingredient name and strips whitespace and surrounding punctuation,
+    so that "Butter ", "butter." and "BUTTER" share one entry.
+    """
+    return re.sub(r"^[\W_]+|[\W_]+$", "", " ".join(name.split()).casefold())
+
+
+def normalize_query(query: str) -> str:
+    """
+    Turns a comma separated ingredient query into a cache key: every ingredient is normalized,
+    duplicates and empty entries are dropped and the rest is sorted.
+    """
+    ingredients = {normalize_ingredient(ingredient) for ingredient in query.split(",")}
+    return ", ".join(sorted(ingredient for ingredient in ingredients if ingredient))
+
+
+def substitution_prompt(ingredient_query: str) -> str:
+    return (
+        f"Provide 1 to 3 substitutions for the ingredient '{ingredient_query}'. "
+        "Each substitution should be a simple and practical alternative. "
+        "Answer with a JSON object only, exactly like this:\n"
+        '{"substitutions": ["first substitute", "second substitute"]}\n'
+        "Just place what to substitute with no manual how to do it. Each substitution is just a string."
+    )
+
+
+def parse_substitutions(raw_response: str) -> Optional[List[str]]:
+    """
+    Extracts the substitution list from a model answer.
+
+    Returns:
+        list: The substitutions, or None if the answer is not in the expected format.
+    """
+    raw_response = raw_response.strip()
+    if raw_response.startswith("```"):
+        raw_response = raw_response.strip("`").removeprefix("json").strip()
+    try:
+        data = json.loads(raw_response)
+    except json.JSONDecodeError:
+        return None
+    substitutions = data.get("substitutions") if isinstance(data, dict) else None
+    if not isinstance(substitutions, list):
+        return None
+    return [str(substitution).strip() for substitution in substitutions if str(substitution).strip()]
+
+
+class SubstitutionTable:
+    """
+    Read-only view of the precomputed substitution table written by
+    tools/precompute_substitutions.py.
+
+    The table is small (one row per distinct core ingredient), so it is held in a dict and
+    reloaded when the file changes. Lookups only read the dict; checking for and loading a newer
+    file runs in a worker thread.
+
+    Args:
+        path (str): Location of the SQLite file. A missing file simply means an empty table.
+        check_interval (float): Minimum seconds between checks for a newer file.
+    """
+
+    def __init__(self, path: str, check_interval=30.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.entries: Dict[str, List[str]] = {}
+        self._mtime = None
+        self._checked_at = 0.0
+
+    async def refresh(self):
+        """
+        Reloads the table if the file changed, at most every check_interval seconds.
+        """
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        await asyncio.to_thread(self._reload_if_changed)
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+
+        db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            rows = db.execute("SELECT ingredient, substitutions FROM substitutions").fetchall()
+        finally:
+            db.close()
+        self.entries = {ingredient: json.loads(substitutions) for ingredient, substitutions in rows}
+        self._mtime = mtime
+
+    def get(self, key: str) -> Optional[List[str]]:
+        return self.entries.get(key)
+
+
+class SubstitutionCache:
+    """
+    Answers substitution queries from memory whenever possible.
+
+    Lookups go to an LRU of recent answers with a TTL first, then to the precomputed table.
+    Expired answers are still served while a background task refreshes them. A real miss starts
+    the LLM call as a background task; the request waits for it at most miss_wait seconds and
+    otherwise gets no answer while the task goes on to fill the cache for the next request.
+    Concurrent requests for the same ingredients share that task, and it finishes even if the
+    request that started it is cancelled.
+
+    Args:
+        fetch (callable): Coroutine function that asks the LLM for a normalized query and returns
+            the substitutions, or None if the answer was unusable.
+        table (SubstitutionTable): Precomputed answers.
+        ttl (float): Seconds an LLM answer is considered fresh.
+        maxsize (int): Maximum number of cached answers.
+        miss_wait (float, optional): Seconds a request waits for the LLM on a miss, None waits for
+            the answer.
+    """
+
+    def __init__(self, fetch: Callable[[str], Awaitable[Optional[List[str]]]], table: SubstitutionTable,
+                 ttl=7 * 24 * 3600.0, maxsize=4096, miss_wait: Optional[float] = 2.0):
+        self.fetch = fetch
+        self.table = table
+        self.ttl = ttl
+        self.miss_wait = miss_wait
+        self.memory = LRUCache(maxsize)
+        self.table_hits = 0
+        self.stale_hits = 0
+        self.llm_calls = 0
+        self.deferred = 0
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    def _fill(self, key: str) -> asyncio.Task:
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_and_store(key))
+            task.add_done_callback(self._report_failure)
+            self._pending[key] = task
+        return task
+
+    @staticmethod
+    def _report_failure(task: asyncio.Task):
+        # Refreshes of stale answers, and fills whose request was cancelled, have nobody awaiting them
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Fetching substitutions failed: {task.exception()!r}")
+
+    async def _fetch_and_store(self, key: str):
+        try:
+            self.llm_calls += 1
+            substitutions = await self.fetch(key)
+            # Unusable answers are not cached, the next request asks again
+            if substitutions is not None:
+                self.memory.put(key, (substitutions, time.monotonic() + self.ttl))
+            return substitutions
+        finally:
+            self._pending.pop(key, None)
+
+    async def get(self, query: str) -> Optional[List[str]]:
+        key = normalize_query(query)
+        if not key:
+            return None
+
+        cached = self.memory.get(key)
+        if cached is not None:
+            substitutions, expires_at = cached
+            if expires_at < time.monotonic():
+                self.stale_hits += 1
+                self._fill(key)
+            return substitutions
+
+        await self.table.refresh()
+        substitutions = self.table.get(key)
+        if substitutions is not None:
+            self.table_hits += 1
+            return substitutions
+
+        task = self._fill(key)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.miss_wait)
+        except asyncio.TimeoutError:
+            # Only the wait timed out, the task keeps running and fills the cache
+            if task.done():
+                raise
+            self.deferred += 1
+            return None
+
+    def pending(self, query: str) -> bool:
+        """
+        Returns:
+            bool: Whether an LLM answer for the query is still being fetched.
+        """
+        return normalize_query(query) in self._pending
+
+    def stats(self):
+        memory_stats = self.memory.stats()
+        return {
+            "size": memory_stats["size"],
+            "memory_hits": memory_stats["hits"],
+            "stale_hits": self.stale_hits,
+            "table_size": len(self.table.entries),
+            "table_hits": self.table_hits,
+            "llm_calls": self.llm_calls,
+            "deferred": self.deferred,
+            "pending": len(self._pending),
+        }
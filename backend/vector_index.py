@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from cache import LRUCache
+from catalog import CatalogSnapshot
+
+
+def bitmap_to_mask(rows: int, size: int) -> np.ndarray:
+    """
+    Converts a catalog bitmap (bit i set = row i matches) into a boolean array of the given size.
+    """
+    data = np.frombuffer(rows.to_bytes((size + 7) // 8, "little"), dtype=np.uint8)
+    return np.unpackbits(data, bitorder="little")[:size].astype(bool)
+
+
+class VectorIndex:
+    """
+    Brute-force cosine search over a memory-mapped float16 (or float32) embedding matrix exported
+    by tools/export_vectors.py.
+
+    The matrix is mapped read-only, so every worker process on the host shares the same page
+    cache instead of holding its own copy. Queries are scored with one matrix product per block
+    of rows; filters are applied as boolean masks built from the catalog bitmaps and cached per
+    filter. The export is reloaded when its manifest file changes.
+
+    Args:
+        directory (str): Export directory (VECTOR_INDEX_DIR).
+        name (str): Collection name, the export is read from {name}.json.
+        model (str): Embedding model the query vectors come from.
+        dimension (int): Dimension of the query vectors.
+        check_interval (float): Minimum seconds between checks for a newer export.
+        block_rows (int): Rows scored per matrix product, bounds the float32 working memory.
+    """
+
+    def __init__(self, directory: str, name: str, model: str, dimension: int, check_interval=30.0,
+                 block_rows=16384):
+        self.directory = directory
+        self.name = name
+        self.model = model
+        self.dimension = dimension
+        self.check_interval = check_interval
+        self.block_rows = block_rows
+        self.ids: List[str] = []
+        self.matrix: Optional[np.ndarray] = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._masks = LRUCache(256)
+        self._mask_snapshot = None
+        self._catalog_rows = None
+
+    async def refresh(self):
+        """
+        Loads a newer export if there is one, at most every check_interval seconds. Reading the
+        manifest runs in a worker thread.
+        """
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        loaded = await asyncio.to_thread(self._load_if_changed)
+        if loaded is not None:
+            # Swapped on the event loop, searches never see the IDs of one export with the matrix of another
+            self.ids, self.matrix = loaded
+            self._mask_snapshot = None
+
+    def _load_if_changed(self) -> Optional[Tuple[List[str], np.ndarray]]:
+        manifest_path = os.path.join(self.directory, f"{self.name}.json")
+        try:
+            mtime = os.stat(manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime == self._mtime:
+            return None
+        self._mtime = mtime
+
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        matrix = np.load(os.path.join(self.directory, manifest["matrix"]), mmap_mode="r")
+        if (manifest.get("embedding_model"), matrix.shape[1]) != (self.model, self.dimension):
+            print(f"Vector export of '{self.name}' was built with {manifest.get('embedding_model')} "
+                  f"({matrix.shape[1]} dimensions), expected {self.model} ({self.dimension} dimensions), ignoring it")
+            return None
+        return manifest["ids"], matrix
+
+    def available(self) -> bool:
+        return self.matrix is not None
+
+    def view(self, snapshot: CatalogSnapshot, rows: int, key: str) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Returns the loaded export together with the boolean mask over its rows for a catalog
+        bitmap. Rows of recipes the catalog does not know (deleted since the export) are always
+        excluded. Searches take the view, so a reload in between cannot mix up two exports.
+
+        Args:
+            snapshot (CatalogSnapshot): Snapshot the bitmap belongs to.
+            rows (int): Catalog bitmap of the matching recipes.
+            key (str): Cache key of the filter that produced the bitmap.
+        """
+        if self._mask_snapshot is not snapshot:
+            self._masks.clear()
+            self._catalog_rows = np.fromiter((snapshot.row_by_id.get(recipe_id, -1) for recipe_id in self.ids),
+                                             dtype=np.int64, count=len(self.ids))
+            self._mask_snapshot = snapshot
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = (self._catalog_rows >= 0) & bitmap_to_mask(rows, len(snapshot))[self._catalog_rows]
+            self._masks.put(key, mask)
+        return self.ids, self.matrix, mask
+
+    def search(self, view: Tuple[List[str], np.ndarray, np.ndarray], queries: List[List[float]], n_results: int) \
+            -> List[Tuple[List[str], np.ndarray]]:
+        """
+        Finds the n_results most similar unmasked rows for each query vector. Safe to call from a
+        worker thread, numpy releases the GIL during the matrix products.
+
+        Returns:
+            list: One (recipe IDs, cosine distances) pair per query, closest first.
+        """
+        ids, matrix, mask = view
+        queries = np.asarray(queries, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, matrix.shape[0], self.block_rows):
+            # float16 blocks are upcast one at a time, there are no float16 BLAS kernels
+            scores = (queries @ np.asarray(matrix[start:start + self.block_rows], dtype=np.float32).T)
+            scores[:, ~mask[start:start + scores.shape[1]]] = -np.inf
+            rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            if scores.shape[1] > n_results:
+                top = np.argpartition(-scores, n_results - 1, axis=1)[:, :n_results]
+                scores = np.take_along_axis(scores, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_scores, best_rows = scores, rows
+
+        results = []
+        for scores, rows in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            order = order[np.isfinite(scores[order])]
+            results.append(([ids[row] for row in rows[order]], 1.0 - scores[order]))
+        return results
+
+    @staticmethod
+    def results(snapshot: CatalogSnapshot, hits: List[Tuple[List[str], np.ndarray]]):
+        """
+        Builds a Chroma style query result from search hits, metadata comes from the catalog.
+        """
+        results = {"ids": [], "distances": [], "metadatas": []}
+        for ids, distances in hits:
+            results["ids"].append(ids)
+            results["distances"].append([float(distance) for distance in distances])
+            results["metadatas"].append([snapshot.metadatas[snapshot.row_by_id[recipe_id]] for recipe_id in ids])
+        return results
@@ -37,6 +37,7 @@ export default function Recipes() {
             const queryParams = new URLSearchParams({
                 page,
                 limit,
+                fields: "card,instructions",
                 ...(selectedCuisine && { cuisine: selectedCuisine }),
                 ...(selectedDietType && { diet_type: selectedDietType }),
             });
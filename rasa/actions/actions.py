@@ -4,14 +4,15 @@ from rasa_sdk import Action, Tracker
 from rasa_sdk.events import SlotSet
 from rasa_sdk.executor import CollectingDispatcher
 import random
-import requests
+
+from .backend_client import BackendError, backend
 
 
 class ActionGetRecipe(Action):
     def name(self):
         return "action_get_recipe"
 
-    def run(self, dispatcher: CollectingDispatcher, tracker, domain):
+    async def run(self, dispatcher: CollectingDispatcher, tracker, domain):
         # Extract ingredients from the slot
         ingredients = tracker.get_slot("ingredient")
         if not ingredients:
@@ -48,7 +49,8 @@ class ActionGetRecipe(Action):
         # Prepare query parameters
         params = {
             "ingredient_query": ingredient_query,
-            "n_results": 3
+            "n_results": 3,
+            "fields": "card"  # The chat only renders recipe cards
         }
 
         if current_diet_type:
@@ -56,12 +58,8 @@ class ActionGetRecipe(Action):
         if current_cuisine:
             params["cuisine"] = current_cuisine
 
-        api_url = "http://localhost:8844/search_by_ingredients"
-
         try:
-            response = requests.get(api_url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            data = await backend.get("/search_by_ingredients", params=params)
 
             recipes = data.get("recipes", [])
 
@@ -70,7 +68,7 @@ class ActionGetRecipe(Action):
                 dispatcher.utter_message(json_message={"recipes": recipes})
             else:
                 dispatcher.utter_message(text="Sorry, I couldn't find any close matches based on your criteria.")
-        except requests.exceptions.RequestException as e:
+        except BackendError as e:
             dispatcher.utter_message(text="Sorry, I couldn't fetch recipes right now. Please try again later.")
             print(f"Error fetching recipes: {e}")
 
@@ -86,7 +84,7 @@ class ActionGetSubstitution(Action):
     def name(self) -> Text:
         return "action_get_substitution"
 
-    def run(
+    async def run(
             self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: Dict[Text, Any]
     ) -> List[Dict[Text, Any]]:
         # Get the ingredient from the slot
@@ -100,20 +98,20 @@ class ActionGetSubstitution(Action):
             ingredient = " ".join(ingredient)
 
         # Send the request to the substitution API
-        api_url = f"http://localhost:8844/substitute?query={ingredient}"
         try:
-            response = requests.get(api_url)
-            response.raise_for_status()
-            data = response.json()
+            data = await backend.get("/substitute", params={"query": ingredient})
 
             # Check if substitutions are available
             substitutions = data.get("substitutions")
             if substitutions:
                 substitutes_text = ", ".join(substitutions)
                 dispatcher.utter_message(text=f"You can use these substitutes for {ingredient}: {substitutes_text}.")
+            elif data.get("pending"):
+                dispatcher.utter_message(text=f"I'm still looking up substitutes for {ingredient}. "
+                                              f"Please ask me again in a moment.")
             else:
                 dispatcher.utter_message(text=f"Sorry, I couldn't find any substitutes for {ingredient}.")
-        except requests.exceptions.RequestException as e:
+        except BackendError as e:
             dispatcher.utter_message(text="I couldn't fetch the substitution data. Please try again later.")
             print(f"Error fetching substitution data: {e}")
 
@@ -125,7 +123,7 @@ class ActionSearchByText(Action):
     def name(self):
         return "action_search_by_text"
 
-    def run(self, dispatcher: CollectingDispatcher, tracker, domain):
+    async def run(self, dispatcher: CollectingDispatcher, tracker, domain):
         # Extract slots
         query_text = tracker.get_slot("query_text")
         diet_type = tracker.get_slot("diet_type")
@@ -173,7 +171,8 @@ class ActionSearchByText(Action):
         # Prepare query parameters
         params = {
             "query_text": query_text,
-            "n_results": 3
+            "n_results": 3,
+            "fields": "card"
         }
 
         if current_diet_type:
@@ -183,12 +182,8 @@ class ActionSearchByText(Action):
         if ingredient_query:
             params["ingredient_query"] = ingredient_query
 
-        api_url = "http://localhost:8844/search_by_text"
-
         try:
-            response = requests.get(api_url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            data = await backend.get("/search_by_text", params=params)
             recipes = data.get("recipes", [])
 
             if recipes:
@@ -196,7 +191,7 @@ class ActionSearchByText(Action):
                 dispatcher.utter_message(json_message={"recipes": recipes})
             else:
                 dispatcher.utter_message(text="Sorry, I couldn't find any recipes matching your search.")
-        except requests.exceptions.RequestException as e:
+        except BackendError as e:
             dispatcher.utter_message(text="Sorry, I couldn't fetch recipes right now. Please try again later.")
             print(f"Error fetching recipes by text: {e}")
 
@@ -213,7 +208,7 @@ class ActionGetCuisine(Action):
     def name(self):
         return "action_get_cuisine"
 
-    def run(self, dispatcher: CollectingDispatcher, tracker, domain):
+    async def run(self, dispatcher: CollectingDispatcher, tracker, domain):
         cuisine = tracker.get_slot("cuisine")
         if not cuisine:
             dispatcher.utter_message(text="I need to know the cuisine type to find recipes.")
@@ -223,19 +218,16 @@ class ActionGetCuisine(Action):
         params = {
             "cuisine": cuisine,
             "limit": 3,
-            "page": 1
+            "page": 1,
+            "fields": "card"
         }
 
         diet_type = tracker.get_slot("diet_type")
         if diet_type:
             params["diet_type"] = diet_type
 
-        api_url = "http://localhost:8844/recipes"
-
         try:
-            response = requests.get(api_url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            data = await backend.get("/recipes", params=params)
             recipes = data.get("recipes", [])
 
             if recipes:
@@ -243,7 +235,7 @@ class ActionGetCuisine(Action):
                 dispatcher.utter_message(json_message={"recipes": recipes})
             else:
                 dispatcher.utter_message(text=f"Sorry, I couldn't find any {cuisine} recipes.")
-        except requests.exceptions.RequestException as e:
+        except BackendError as e:
             dispatcher.utter_message(text="Sorry, I couldn't fetch recipes right now. Please try again later.")
             print(f"Error fetching cuisine recipes: {e}")
 
@@ -260,7 +252,7 @@ class ActionGetDietaryOptions(Action):
     def name(self):
         return "action_get_dietary_options"
 
-    def run(self, dispatcher: CollectingDispatcher, tracker, domain):
+    async def run(self, dispatcher: CollectingDispatcher, tracker, domain):
         diet_type = tracker.get_slot("diet_type")
         if not diet_type:
             dispatcher.utter_message(text="I need to know the diet type to find recipes.")
@@ -270,19 +262,16 @@ class ActionGetDietaryOptions(Action):
         params = {
             "diet_type": diet_type,
             "limit": 3,
-            "page": 1
+            "page": 1,
+            "fields": "card"
         }
 
         cuisine = tracker.get_slot("cuisine")
         if cuisine:
             params["cuisine"] = cuisine
 
-        api_url = "http://localhost:8844/recipes"
-
         try:
-            response = requests.get(api_url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            data = await backend.get("/recipes", params=params)
             recipes = data.get("recipes", [])
 
             if recipes:
@@ -290,7 +279,7 @@ class ActionGetDietaryOptions(Action):
                 dispatcher.utter_message(json_message={"recipes": recipes})
             else:
                 dispatcher.utter_message(text=f"Sorry, I couldn't find any {diet_type} recipes.")
-        except requests.exceptions.RequestException as e:
+        except BackendError as e:
             dispatcher.utter_message(text="Sorry, I couldn't fetch recipes right now. Please try again later.")
             print(f"Error fetching dietary recipes: {e}")
 
@@ -0,0 +1,261 @@
+import asyncio
+import importlib
+import inspect
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Location of backend/simple.py for the in-process transport
+DEFAULT_BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "backend")
+
+
+class BackendError(Exception):
+    """
+    Raised when the recipe backend could not answer a request, including when the circuit
+    breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calling a backend that keeps failing.
+
+    After failure_threshold consecutive failures the breaker opens and requests fail at once
+    instead of tying up conversations on timeouts. After reset_timeout seconds one trial request
+    is let through (half-open); its success closes the breaker, its failure opens it again.
+
+    Args:
+        failure_threshold (int): Consecutive failures that open the breaker.
+        reset_timeout (float): Seconds the breaker stays open before a trial request.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial_running = False
+
+    def release_trial(self):
+        # A trial that ended without an outcome, e.g. cancelled, lets the next request try
+        self._trial_running = False
+
+
+class BackendClient:
+    """
+    Shared async client for the recipe backend.
+
+    One pooled httpx client keeps connections alive across actions, so concurrent conversations
+    neither block the action server nor open a connection per call. Connection errors, timeouts,
+    429 and 5xx responses are retried with exponential backoff and jitter; 4xx responses are not,
+    the backend is healthy and the request itself is wrong.
+
+    Args:
+        base_url (str): URL of the backend, e.g. http://localhost:8844.
+        timeout (float): Seconds to wait for a response.
+        connect_timeout (float): Seconds to wait for a connection.
+        max_retries (int): Retries per request after the first attempt.
+        max_connections (int): Size of the connection pool.
+        breaker (CircuitBreaker, optional): Breaker shared by all requests of this client.
+    """
+
+    def __init__(self, base_url="http://localhost:8844", timeout=10.0, connect_timeout=2.0, max_retries=2,
+                 max_connections=100, breaker: Optional[CircuitBreaker] = None):
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.breaker = breaker or CircuitBreaker()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created on first use, inside the action server's event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    async def get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        Sends a GET request and returns the decoded JSON body.
+
+        Raises:
+            BackendError: If the backend did not answer successfully.
+        """
+        trial = self.breaker.state == "half-open"
+        if not self.breaker.allow():
+            raise BackendError(f"Backend circuit is open, not calling {path}")
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await self.client.get(path, params=params)
+                    if response.status_code != 429 and response.status_code < 500:
+                        response.raise_for_status()
+                        self.breaker.record_success()
+                        return response.json()
+                    error = BackendError(f"Backend answered {response.status_code} for {path}")
+                except httpx.HTTPStatusError as e:
+                    self.breaker.record_success()
+                    raise BackendError(str(e)) from e
+                except (httpx.TransportError, ValueError) as e:
+                    error = BackendError(f"Backend request to {path} failed: {e!r}")
+
+                if attempt < self.max_retries:
+                    await asyncio.sleep(min(2.0, 0.1 * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+            self.breaker.record_failure()
+            raise error
+        finally:
+            if trial:
+                self.breaker.release_trial()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+
+class InProcessBackend:
+    """
+    Calls the endpoint functions of backend/simple.py in this process instead of over HTTP.
+
+    Meant for an action server that runs on the same host as the backend: there is no socket,
+    no JSON encoding and no decoding, the endpoint's return value is handed over as is. The
+    backend's startup (Chroma connection, catalog) begins with the first request, which waits
+    for it like an HTTP request would. Every parameter of the endpoint is passed explicitly,
+    values not given by the caller take the endpoint's defaults, so results are the same as
+    over HTTP.
+
+    Returned objects may be shared with the backend's caches and must not be modified.
+
+    Args:
+        backend_dir (str): Directory containing simple.py.
+    """
+
+    def __init__(self, backend_dir=DEFAULT_BACKEND_DIR):
+        self.backend_dir = os.path.abspath(backend_dir)
+        self.routes = {}
+        self._startup = None
+        self._startup_wait = None
+        self._lifespan = None
+        self._lock = None
+
+    async def _start(self):
+        if self._lifespan is not None:
+            return
+        self._lock = self._lock or asyncio.Lock()
+        async with self._lock:
+            if self._lifespan is not None:
+                return
+            if self.backend_dir not in sys.path:
+                sys.path.insert(0, self.backend_dir)
+            from fastapi.routing import APIRoute
+
+            simple = importlib.import_module("simple")
+            lifespan = simple.lifespan(simple.app)
+            await lifespan.__aenter__()
+
+            # GET routes without path parameters, i.e. the search and listing endpoints
+            self.routes = {
+                route.path: route.endpoint
+                for route in simple.app.routes
+                if isinstance(route, APIRoute) and "GET" in route.methods and "{" not in route.path
+            }
+            self._startup = simple.startup
+            self._startup_wait = simple.STARTUP_WAIT
+            self._lifespan = lifespan
+
+    async def get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        Calls the endpoint registered for path with the given query parameters.
+
+        Raises:
+            BackendError: If there is no such endpoint, a parameter is missing or unknown, or the
+                endpoint raised.
+        """
+        await self._start()
+        if not await self._startup.wait(self._startup_wait):
+            raise BackendError("Backend is not connected to its upstream services yet")
+        endpoint = self.routes.get(path)
+        if endpoint is None:
+            raise BackendError(f"No in-process endpoint for {path}")
+
+        params = dict(params or {})
+        arguments = {}
+        for name, parameter in inspect.signature(endpoint).parameters.items():
+            if name in params:
+                arguments[name] = params.pop(name)
+            elif parameter.default is inspect.Parameter.empty:
+                raise BackendError(f"Missing parameter '{name}' for {path}")
+            else:
+                arguments[name] = parameter.default
+        if params:
+            raise BackendError(f"Unknown parameters {sorted(params)} for {path}")
+
+        try:
+            return await endpoint(**arguments)
+        except Exception as e:
+            raise BackendError(f"In-process call to {path} failed: {e!r}") from e
+
+    async def close(self):
+        if self._lifespan is not None:
+            await self._lifespan.__aexit__(None, None, None)
+            self._lifespan = None
+
+
+def client_from_env():
+    """
+    Builds the backend transport selected by BACKEND_TRANSPORT (http or inprocess).
+    """
+    if os.getenv("BACKEND_TRANSPORT", "http") == "inprocess":
+        return InProcessBackend(os.getenv("BACKEND_PATH", DEFAULT_BACKEND_DIR))
+    return BackendClient(
+        base_url=os.getenv("BACKEND_URL", "http://localhost:8844"),
+        timeout=float(os.getenv("BACKEND_TIMEOUT", "10")),
+        connect_timeout=float(os.getenv("BACKEND_CONNECT_TIMEOUT", "2")),
+        max_retries=int(os.getenv("BACKEND_MAX_RETRIES", "2")),
+        max_connections=int(os.getenv("BACKEND_MAX_CONNECTIONS", "100")),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("BACKEND_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.getenv("BACKEND_BREAKER_RESET", "30"))
+        )
+    )
+
+
+# Shared by all actions of the action server process
+backend = client_from_env()
@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+# The action server's transports live next to the Rasa actions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rasa"))
+from actions.backend_client import DEFAULT_BACKEND_DIR, BackendClient, InProcessBackend  # noqa: E402
+
+# The calls the Rasa actions make, with the parameters they send
+CALLS = [
+    ("/search_by_ingredients", {"ingredient_query": "tomaten, basilikum, nudeln", "n_results": 3}),
+    ("/search_by_text", {"query_text": "schnelles abendessen mit gemüse", "n_results": 3}),
+    ("/search_by_text", {"query_text": "pasta salad", "n_results": 3, "diet_type": "vegetarian"}),
+    ("/recipes", {"cuisine": "italian", "limit": 3, "page": 1}),
+    ("/recipes", {"diet_type": "vegan", "limit": 3, "page": 1}),
+    ("/substitute", {"query": "butter"}),
+]
+
+
+def start_backend(port):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "simple:app", "--port", str(port), "--log-level", "warning"],
+        cwd=DEFAULT_BACKEND_DIR
+    )
+    for _ in range(300):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/diet_types", timeout=1.0).raise_for_status()
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Backend did not start")
+
+
+async def measure(transport, requests, concurrency):
+    # Warm-up, starts the backend and its connections
+    for path, params in CALLS:
+        await transport.get(path, params)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def call(i):
+        path, params = CALLS[i % len(CALLS)]
+        async with semaphore:
+            start = time.perf_counter()
+            await transport.get(path, params)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[call(i) for i in range(requests)])
+    elapsed = time.perf_counter() - start
+
+    # Taken after the run, once background work like the lexical index build has finished
+    results = [await transport.get(path, params) for path, params in CALLS]
+
+    latencies.sort()
+    return results, {
+        "requests_per_second": round(requests / elapsed, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+    }
+
+
+async def main(args):
+    process = None if args.url else start_backend(args.port)
+    http = BackendClient(args.url or f"http://127.0.0.1:{args.port}")
+    inprocess = InProcessBackend()
+    try:
+        http_results, http_stats = await measure(http, args.requests, args.concurrency)
+        inprocess_results, inprocess_stats = await measure(inprocess, args.requests, args.concurrency)
+    finally:
+        await http.close()
+        await inprocess.close()
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    # In-process results go through the same JSON round trip the HTTP ones took
+    for (path, params), http_result, inprocess_result in zip(CALLS, http_results, inprocess_results):
+        if json.loads(json.dumps(inprocess_result)) != http_result:
+            print(f"MISMATCH for {path} {params}")
+
+    print(json.dumps({"http": http_stats, "inprocess": inprocess_stats}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the HTTP and in-process backend transports of the Rasa actions.")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8845, help="Port for the backend started by the benchmark")
+    parser.add_argument("--url", default=None, help="Use an already running backend instead")
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
@@ -1,45 +1,79 @@
+import argparse
+import asyncio
 import json
 import re
 import uuid
 
+import httpx
 import requests
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from openai import OpenAI
-from urllib.parse import urlparse, urlunparse
+from openai import AsyncOpenAI, OpenAI
 import os
 
+from crawler import DONE, Crawler, Frontier, get_base_url
+from dedup import DuplicateIndex, recipe_id_for_url
+from fetch_cache import ExtractionCache, hash_page
+from html_extract import pre_extract, recipe_from_structured
+from recipe_store import RecipeStore, iter_recipes, recipe_store_path
+
 load_dotenv()
 
 client = OpenAI()
 
+# Crawl state, lets an interrupted crawl continue where it stopped
+frontier_path = os.getenv("CRAWL_FRONTIER_PATH", "../db/crawl_frontier.sqlite")
 
-def get_base_url(url):
-    """
-    Removes query parameters and fragments from a URL.
+# Validators, content hashes and extracted recipes of fetched pages, makes re-crawls cheap
+extract_cache_path = os.getenv("EXTRACT_CACHE_PATH", "../db/extract_cache.sqlite")
 
-    Args:
-        url (str): The full URL to process.
+recipes_folder = "../db/recipes_raw"
 
-    Returns:
-        str: The base URL without query parameters or fragments.
+# Packed recipe store (RECIPE_STORE_PATH), recipes are saved there instead of the folder when set
+recipe_store = None
+
+# Near-duplicate index per recipes folder or store, built from its recipes on first use
+duplicate_indexes = {}
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Connection": "keep-alive",
+}
+
+
+def request_headers(entry=None):
+    # A page fetched before is requested conditionally, the server answers 304 if it is unchanged
+    headers = dict(HEADERS)
+    if entry and entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry["last_modified"]:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def fetch_html(url, entry=None):
     """
-    parsed_url = urlparse(url)
-    # Reconstruct the URL without query and fragment
-    base_url = urlunparse((parsed_url.scheme, parsed_url.netloc, parsed_url.path, '', '', ''))
-    return base_url
+    Fetches a page, conditionally if a cache entry for it is given.
 
+    Returns:
+        tuple: The page, or None if it is unchanged since the entry was cached, and the response headers.
+    """
+    response = requests.get(url, headers=request_headers(entry))
+    if response.status_code == 304 and entry:
+        return None, response.headers
+    if response.status_code == 200:
+        return response.text, response.headers
+    else:
+        raise Exception(f"Failed to fetch the URL. Status code: {response.status_code}")
 
-def fetch_html(url):
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Connection": "keep-alive",
-    }
 
-    response = requests.get(url, headers=headers)
+async def fetch_html_async(http, url, entry=None):
+    response = await http.get(url, headers=request_headers(entry))
+    if response.status_code == 304 and entry:
+        return None, response.headers
     if response.status_code == 200:
-        return response.text
+        return response.text, response.headers
     else:
         raise Exception(f"Failed to fetch the URL. Status code: {response.status_code}")
 
@@ -62,11 +96,8 @@ def extract_text_from_html(html):
     return soup.get_text()
 
 
-def extract_recipe_from_url(url):
-    html_content = fetch_html(url)
-    plain_text = extract_text_from_html(html_content)
-
-    prompt = f"""
+def recipe_prompt(plain_text):
+    return f"""
     Extract and format the recipe from the following text into the structure below:
 
     {{
@@ -77,18 +108,14 @@ def extract_recipe_from_url(url):
       "tags": ["relevant tags"],
       "diet_type": "e.g., Vegetarian, Vegan, Non-Vegetarian",
       "cuisine": "e.g., Italian, Chinese, Indian",
-      "time_to_eat": estimate how long it takes from cutting to cooking to eating for an average cook in minutes,
-      "suggestion_links": ["list of links to suggested recipes"],
-      "img_links": ["list of links to images for this recipe"]
+      "time_to_eat": estimate how long it takes from cutting to cooking to eating for an average cook in minutes
     }}
     
     Always answer with JSON only. If an error occurs, answer with an JSON containing the reason in the
     error field. Explain what is missing and why something is an error. 
     Everything should be translated to english. Core ingredients should be only the ingredient itself
-    without any measurement. e.g. 15ml of honey should be just 'honey'. Often the recipe is hidden in html code and
-    other useless stuff, extract only the recipe and ignore the rest. Suggestion links can often be found in <a> tags
-    in href. Keep the link intact as is! otherwise they will break!. The links will look similar to {url}. The img_links
-    should only include direct images that can be embedded later.
+    without any measurement. e.g. 15ml of honey should be just 'honey'. The text may still contain parts of the
+    web page around the recipe, extract only the recipe and ignore the rest.
 
     Recipe Text:
     {plain_text}
@@ -96,12 +123,8 @@ def extract_recipe_from_url(url):
     Output:
     """
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}]
-    )
 
-    raw_response = response.choices[0].message.content
+def parse_recipe_response(raw_response):
     cleaned_response = clean_gpt_response(raw_response)
 
     if isinstance(cleaned_response, str):
@@ -115,20 +138,141 @@ def extract_recipe_from_url(url):
         raise ValueError("Unexpected GPT response format.")
 
 
-def save_recipe(recipe_data, folder="../db/recipes_raw"):
-    """
-    Save the recipe JSON data to a file with a UUID as the filename.
+def with_page_links(recipe_data, pre):
+    # Links and images come from the page itself, not from the LLM
+    if "error" not in recipe_data:
+        recipe_data["suggestion_links"] = pre["suggestion_links"]
+        recipe_data["img_links"] = pre["img_links"]
+    return recipe_data
+
+
+def extract_recipe(pre):
+    if pre["complete"]:
+        return recipe_from_structured(pre)
+
+    response = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{"role": "user", "content": recipe_prompt(pre["text"])}]
+    )
+    return with_page_links(parse_recipe_response(response.choices[0].message.content), pre)
+
+
+async def extract_recipe_async(llm, pre):
+    if pre["complete"]:
+        return recipe_from_structured(pre)
+
+    response = await llm.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{"role": "user", "content": recipe_prompt(pre["text"])}]
+    )
+    return with_page_links(parse_recipe_response(response.choices[0].message.content), pre)
+
+
+def cached_recipe(cache, key, entry, headers, content_hash):
+    # The page changed but not its recipe content (ads, tracking, layout), only the validators are refreshed
+    if entry and entry["content_hash"] == content_hash:
+        cache.unchanged += 1
+        cache.put(key, headers.get("ETag"), headers.get("Last-Modified"), content_hash, entry["recipe"])
+        return entry["recipe"]
+    return None
+
+
+def open_store():
+    global recipe_store
+    if recipe_store is None and recipe_store_path:
+        recipe_store = RecipeStore(recipe_store_path)
+    return recipe_store
+
+
+def duplicate_index(folder):
+    key = recipe_store_path or folder
+    if key not in duplicate_indexes:
+        recipes = open_store().scan() if recipe_store_path else iter_recipes(folder, store_path="")
+        duplicate_indexes[key] = DuplicateIndex.from_recipes(recipes)
+    return duplicate_indexes[key]
+
+
+def store_recipe(recipe_data, url, cache, key, entry, headers, content_hash, folder):
+    if "error" not in recipe_data:
+        recipe_data["source_url"] = url
+        if entry and "id" in entry["recipe"]:
+            # A changed page replaces the recipe extracted from it before
+            recipe_data["id"] = entry["recipe"]["id"]
+        recipe_id = recipe_data.get("id") or recipe_id_for_url(url)
+        duplicate_of = duplicate_index(folder).check(recipe_id, recipe_data)
+        if duplicate_of:
+            # Already stored from another page, it is neither saved nor embedded twice
+            print(f"Skipping {url}, near-duplicate of recipe {duplicate_of}")
+            recipe_data["duplicate_of"] = duplicate_of
+        else:
+            recipe_data["id"] = recipe_id
+            save_recipe(recipe_data, folder)
+    if cache:
+        cache.extracted += 1
+        cache.put(key, headers.get("ETag"), headers.get("Last-Modified"), content_hash, recipe_data)
+    return recipe_data
+
+
+def process_url(url, cache=None, folder=recipes_folder):
     """
-    # Generate a UUID for the recipe
-    recipe_id = str(uuid.uuid4())
+    Fetches a page, extracts its recipe and saves it. With a cache, a page that is unchanged since
+    the last fetch is neither extracted nor saved again.
 
-    # Ensure the output folder exists
-    os.makedirs(folder, exist_ok=True)
+    Returns:
+        dict: The recipe, or a dict with an error field.
+    """
+    key = get_base_url(url)
+    entry = cache.get(key) if cache else None
+    html_content, headers = fetch_html(url, entry)
+    if html_content is None:
+        cache.not_modified += 1
+        return entry["recipe"]
+
+    pre = pre_extract(html_content, url)
+    content_hash = hash_page(pre)
+    recipe_data = cache and cached_recipe(cache, key, entry, headers, content_hash)
+    if recipe_data:
+        return recipe_data
+    return store_recipe(extract_recipe(pre), url, cache, key, entry, headers, content_hash, folder)
+
+
+async def process_url_async(http, llm, url, cache=None, folder=recipes_folder):
+    key = get_base_url(url)
+    entry = cache.get(key) if cache else None
+    html_content, headers = await fetch_html_async(http, url, entry)
+    if html_content is None:
+        cache.not_modified += 1
+        return entry["recipe"]
+
+    # Parsing is CPU bound, keep it off the event loop so other pages keep downloading
+    pre = await asyncio.to_thread(pre_extract, html_content, url)
+    content_hash = hash_page(pre)
+    recipe_data = cache and cached_recipe(cache, key, entry, headers, content_hash)
+    if recipe_data:
+        return recipe_data
+    return store_recipe(await extract_recipe_async(llm, pre), url, cache, key, entry, headers, content_hash, folder)
+
+
+def save_recipe(recipe_data, folder=recipes_folder):
+    """
+    Save the recipe JSON data to a file with a UUID as the filename, or to the packed recipe
+    store if RECIPE_STORE_PATH is set.
+    """
+    # The UUID is derived from the source URL, the same page always ends up in the same file
+    recipe_id = recipe_data.get("id")
+    if not recipe_id:
+        recipe_id = recipe_id_for_url(recipe_data["source_url"]) if recipe_data.get("source_url") else str(uuid.uuid4())
 
     # Update the recipe JSON with the ID and source URL
     recipe_data["id"] = recipe_id
 
+    if open_store() is not None:
+        recipe_store.put(recipe_data)
+        print(f"Recipe {recipe_id} saved to {os.path.abspath(recipe_store_path)}")
+        return recipe_store_path
+
     # Save the recipe JSON to a file
+    os.makedirs(folder, exist_ok=True)
     file_path = os.path.join(folder, f"{recipe_id}.json")
     with open(file_path, "w", encoding="utf-8") as file:
         json.dump(recipe_data, file, indent=4, ensure_ascii=False)
@@ -155,12 +299,70 @@ def clean_gpt_response(response_text):
     return response_text
 
 
+async def crawl(seeds, concurrency=8, per_host=2, delay=1.0, max_pages=None, done=(), path=None,
+                recrawl=False, cache_path=None, folder=recipes_folder):
+    """
+    Crawls recipes starting from seeds and following their suggestion links.
+
+    Args:
+        seeds (list): URLs to start from. Already crawled ones are skipped, pending URLs of an
+            earlier crawl are continued.
+        done (list): URLs that were already processed outside the crawler.
+        path (str, optional): Frontier file, CRAWL_FRONTIER_PATH by default.
+        recrawl (bool): Visit all known URLs again. Unchanged pages cost a conditional request.
+        cache_path (str, optional): Extraction cache file, EXTRACT_CACHE_PATH by default.
+        folder (str): Folder the recipes are saved to.
+    """
+    frontier = Frontier(path or frontier_path)
+    cache = ExtractionCache(cache_path or extract_cache_path)
+    if recrawl:
+        frontier.requeue()
+    for url in frontier.add(done, 0):
+        frontier.mark(url, DONE, 0)
+
+    # Both clients pool connections, they are bound to the event loop of this crawl
+    async with httpx.AsyncClient(timeout=30.0, follow_redirects=True,
+                                 limits=httpx.Limits(max_connections=concurrency)) as http, AsyncOpenAI() as llm:
+        async def handle(url):
+            recipe_data = await process_url_async(http, llm, url, cache, folder)
+            if "error" in recipe_data:
+                print(f"Error: {recipe_data['error']}")
+                return []
+            return recipe_data.get("suggestion_links", [])
+
+        crawler = Crawler(handle, frontier, concurrency=concurrency, per_host=per_host, delay=delay,
+                          max_pages=max_pages)
+        await crawler.run([get_base_url(url) for url in seeds])
+    print(f"Pages: {cache.stats()}")
+    cache.close()
+    frontier.close()
+    if recipe_store is not None:
+        recipe_store.commit()
+
+
 auto = True
-links_traversed = []
-links_open = []
 
 if __name__ == "__main__":
-    while True:
+    parser = argparse.ArgumentParser(description="Extract recipes from web pages.")
+    parser.add_argument("--crawl", nargs="*", metavar="URL",
+                        help="Crawl from these URLs without prompting; without URLs, resume the last crawl")
+    parser.add_argument("--concurrency", type=int, default=8, help="Pages processed at the same time")
+    parser.add_argument("--per-host", type=int, default=2, help="Pages processed at the same time per host")
+    parser.add_argument("--delay", type=float, default=1.0, help="Seconds between requests to one host")
+    parser.add_argument("--max-pages", type=int, default=None)
+    parser.add_argument("--frontier", default=frontier_path, help="Frontier file (CRAWL_FRONTIER_PATH)")
+    parser.add_argument("--recrawl", action="store_true",
+                        help="Visit all known URLs again, unchanged pages are not extracted again")
+    parser.add_argument("--cache", default=extract_cache_path, help="Extraction cache file (EXTRACT_CACHE_PATH)")
+    args = parser.parse_args()
+    crawl_options = dict(concurrency=args.concurrency, per_host=args.per_host, delay=args.delay,
+                         max_pages=args.max_pages, path=args.frontier, cache_path=args.cache)
+
+    if args.crawl is not None:
+        asyncio.run(crawl(args.crawl, recrawl=args.recrawl, **crawl_options))
+
+    cache = ExtractionCache(args.cache) if args.crawl is None else None
+    while args.crawl is None:
         try:
             # Prompt user for URL
             recipe_url = input("Enter a recipe URL (or 'exit' to quit): ").strip()
@@ -172,43 +374,24 @@ if __name__ == "__main__":
             if recipe_url.lower() == "raw":
                 print("Paste recipe here")
                 recipe_data = input()
+                if "error" not in recipe_data:
+                    save_recipe(recipe_data)
             else:
                 print("Processing the recipe...")
-                recipe_data = extract_recipe_from_url(recipe_url)
-                recipe_data["source_url"] = recipe_url
+                # Saves the recipe, unless the page is unchanged since it was last processed
+                recipe_data = process_url(recipe_url, cache)
+                cache.commit()
+                if recipe_store is not None:
+                    recipe_store.commit()
 
             if "error" in recipe_data:
                 print(f"Error: {recipe_data['error']}")
                 continue
 
-            # Save the recipe
-            save_recipe(recipe_data)
-
-            if auto:
-                links_open.extend(list(map(lambda url: get_base_url(url), recipe_data["suggestion_links"])))
-                links_traversed.append(get_base_url(recipe_url))
-                links_open = [item for item in links_open if item not in links_traversed]
-
-            while auto:
-                if len(links_open) > 0:
-                    next_url = links_open.pop()
-                    print(f"auto fetching {next_url}")
-
-                    recipe_data = extract_recipe_from_url(next_url)
-                    recipe_data["source_url"] = next_url
-
-                    if "error" in recipe_data:
-                        print(f"Error: {recipe_data['error']}")
-                        continue
-
-                    save_recipe(recipe_data)
-
-                    links_open.extend(list(map(lambda url: get_base_url(url), recipe_data["suggestion_links"])))
-                    links_traversed.append(get_base_url(next_url))
-                    links_open = [item for item in links_open if item not in links_traversed]
-                else:
-                    print("Cannot auto-fetch more recipes")
-                    break
+            if auto and recipe_url.lower() != "raw":
+                # Continue with the suggested recipes, the frontier remembers what was crawled
+                asyncio.run(crawl(recipe_data.get("suggestion_links", []), done=[get_base_url(recipe_url)],
+                                  **crawl_options))
 
         except Exception as e:
             print(f"An error occurred: {e}")
@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from collections import deque
+from typing import Awaitable, Callable, Iterable, List
+from urllib.parse import urljoin, urlparse, urlunparse
+
+import httpx
+
+# States of a URL in the frontier
+PENDING, DONE, FAILED = 0, 1, 2
+
+
+def get_base_url(url):
+    """
+    Removes query parameters and fragments from a URL.
+
+    Args:
+        url (str): The full URL to process.
+
+    Returns:
+        str: The base URL without query parameters or fragments.
+    """
+    parsed_url = urlparse(url)
+    # Reconstruct the URL without query and fragment
+    base_url = urlunparse((parsed_url.scheme, parsed_url.netloc, parsed_url.path, '', '', ''))
+    return base_url
+
+
+def url_key(url: str) -> int:
+    # 64-bit hash of the canonical URL, fits an SQLite INTEGER and keeps the visited set small
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+class Frontier:
+    """
+    Persistent crawl frontier and visited set.
+
+    Every URL ever discovered has one row in SQLite, keyed by the 64-bit hash of its canonical
+    form, with its state (pending, done, failed). The keys are also held in a set of ints, so
+    checking a discovered link costs one hash and one set lookup. After a crash the pending rows
+    are simply crawled again.
+
+    Args:
+        path (str): Location of the SQLite file.
+        commit_every (int): Number of updates between commits; at most that many pages are
+            crawled twice after a crash.
+    """
+
+    def __init__(self, path, commit_every=50):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "key INTEGER PRIMARY KEY, url TEXT NOT NULL, state INTEGER NOT NULL, depth INTEGER NOT NULL, "
+            "attempts INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.db.commit()
+        self.commit_every = commit_every
+        self.seen = {key for key, in self.db.execute("SELECT key FROM urls")}
+        self._updates = 0
+
+    def _updated(self, count=1):
+        self._updates += count
+        if self._updates >= self.commit_every:
+            self.commit()
+
+    def pending(self):
+        """
+        Returns:
+            list: (url, depth, attempts) of all URLs still to crawl, oldest first.
+        """
+        return self.db.execute(
+            "SELECT url, depth, attempts FROM urls WHERE state = ? ORDER BY updated_at", (PENDING,)
+        ).fetchall()
+
+    def add(self, urls: Iterable[str], depth: int) -> List[str]:
+        """
+        Adds URLs that were never seen before.
+
+        Returns:
+            list: The URLs that were new.
+        """
+        new = {}
+        for url in urls:
+            key = url_key(url)
+            if key not in self.seen:
+                self.seen.add(key)
+                new[key] = url
+        if new:
+            now = time.time()
+            self.db.executemany("INSERT OR IGNORE INTO urls VALUES (?, ?, ?, ?, 0, ?)",
+                                [(key, url, PENDING, depth, now) for key, url in new.items()])
+            self._updated(len(new))
+        return list(new.values())
+
+    def mark(self, url: str, state: int, attempts: int):
+        self.db.execute("UPDATE urls SET state = ?, attempts = ?, updated_at = ? WHERE key = ?",
+                        (state, attempts, time.time(), url_key(url)))
+        self._updated()
+
+    def requeue(self):
+        """
+        Marks all crawled and failed URLs as pending again, for a re-crawl.
+        """
+        self.db.execute("UPDATE urls SET state = ?, attempts = 0 WHERE state != ?", (PENDING, PENDING))
+        self.commit()
+
+    def counts(self):
+        counts = dict(self.db.execute("SELECT state, COUNT(*) FROM urls GROUP BY state"))
+        return {"pending": counts.get(PENDING, 0), "done": counts.get(DONE, 0), "failed": counts.get(FAILED, 0)}
+
+    def commit(self):
+        self.db.commit()
+        self._updates = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+
+class Crawler:
+    """
+    Crawls URLs from a Frontier with asyncio.
+
+    At most `concurrency` pages are processed at once overall and at most `per_host` per host.
+    Requests to the same host start at least `delay` seconds apart. A page whose handler raises
+    is retried later, up to max_attempts times.
+
+    Args:
+        handler (callable): Coroutine function that processes a URL and returns the canonical
+            URLs of the links to follow.
+        frontier (Frontier): Persistent frontier and visited set.
+        concurrency (int): Maximum number of pages in flight.
+        per_host (int): Maximum number of pages in flight per host.
+        delay (float): Minimum seconds between request starts on one host.
+        max_pages (int, optional): Stop after this many pages in this run.
+        max_depth (int, optional): Do not follow links found at this depth.
+        max_attempts (int): Attempts per URL before it is marked as failed.
+    """
+
+    def __init__(self, handler: Callable[[str], Awaitable[List[str]]], frontier: Frontier, concurrency=8,
+                 per_host=2, delay=1.0, max_pages=None, max_depth=None, max_attempts=3):
+        self.handler = handler
+        self.frontier = frontier
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.delay = delay
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.started = 0
+        self.crawled = 0
+        self.failed = 0
+        self._queue = deque()
+        self._in_flight = 0
+        self._condition = None
+        self._host_slots = {}
+        self._host_next_start = {}
+
+    async def _wait_turn(self, host):
+        # Reserve the next start slot of the host, so concurrent requests are spread out as well
+        now = time.monotonic()
+        start = max(now, self._host_next_start.get(host, 0.0))
+        self._host_next_start[host] = start + self.delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def _crawl(self, url, depth, attempts):
+        host = urlparse(url).netloc
+        slots = self._host_slots.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with slots:
+            await self._wait_turn(host)
+            try:
+                links = await self.handler(url)
+            except Exception as e:
+                attempts += 1
+                print(f"Error crawling {url} (attempt {attempts}): {e}")
+                if attempts < self.max_attempts:
+                    self.frontier.mark(url, PENDING, attempts)
+                    self._queue.append((url, depth, attempts))
+                else:
+                    self.frontier.mark(url, FAILED, attempts)
+                    self.failed += 1
+                return
+
+        self.frontier.mark(url, DONE, attempts)
+        self.crawled += 1
+        if self.max_depth is None or depth < self.max_depth:
+            self._queue.extend((link, depth + 1, 0) for link in self.frontier.add(links or [], depth + 1))
+
+    async def _worker(self):
+        while True:
+            async with self._condition:
+                while not self._queue and self._in_flight:
+                    await self._condition.wait()
+                if not self._queue or (self.max_pages is not None and self.started >= self.max_pages):
+                    self._condition.notify_all()
+                    return
+                url, depth, attempts = self._queue.popleft()
+                self.started += 1
+                self._in_flight += 1
+            try:
+                await self._crawl(url, depth, attempts)
+            finally:
+                async with self._condition:
+                    self._in_flight -= 1
+                    self._condition.notify_all()
+
+    async def run(self, seeds: Iterable[str] = ()):
+        """
+        Crawls until the frontier is exhausted or max_pages is reached. Seeds that were already
+        crawled in an earlier run are not crawled again; pending URLs of an earlier run are.
+        """
+        self._condition = asyncio.Condition()
+        self.frontier.add(seeds, 0)
+        self._queue.extend(self.frontier.pending())
+
+        start = time.perf_counter()
+        await asyncio.gather(*[self._worker() for _ in range(self.concurrency)])
+        self.frontier.commit()
+        elapsed = time.perf_counter() - start
+        print(f"Crawled {self.crawled} pages ({self.failed} failed) in {elapsed:.1f}s, "
+              f"{self.crawled / (elapsed or 1e-9):.1f} pages/s, frontier {self.frontier.counts()}")
+
+
+if __name__ == "__main__":
+    # Benchmark against the local fixture site, e.g. python crawler.py --pages 2000 --latency 0.05
+    from fixture_site import start_fixture_site
+
+    parser = argparse.ArgumentParser(description="Benchmark the crawler against a local fixture site.")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--per-host", type=int, default=16)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--max-pages", type=int, default=None)
+    parser.add_argument("--frontier", default=None, help="Frontier file, a temporary one by default")
+    parser.add_argument("--port", type=int, default=0, help="Fixed fixture site port, to resume a frontier")
+    args = parser.parse_args()
+
+    site, base_url = start_fixture_site(port=args.port, pages=args.pages, latency=args.latency)
+    frontier_path = args.frontier or os.path.join(tempfile.mkdtemp(), "frontier.sqlite")
+
+    async def bench():
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=args.concurrency)) as http:
+            async def handler(url):
+                response = await http.get(url)
+                response.raise_for_status()
+                return [get_base_url(urljoin(url, href)) for href in re.findall(r'href="(/rezepte/[^"]+)"', response.text)]
+
+            frontier = Frontier(frontier_path)
+            crawler = Crawler(handler, frontier, concurrency=args.concurrency, per_host=args.per_host,
+                              delay=args.delay, max_pages=args.max_pages)
+            await crawler.run([f"{base_url}/rezepte/0/rezept.html"])
+            frontier.close()
+
+    asyncio.run(bench())
+    print(f"Frontier: {frontier_path}")
+    site.shutdown()
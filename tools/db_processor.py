@@ -1,22 +1,54 @@
+import argparse
 import os
 import json
-from sentence_transformers import SentenceTransformer
+import sys
+from functools import partial
+
 import chromadb
+import numpy as np
 from openai import OpenAI
 from dotenv import load_dotenv
 
+from dedup import DuplicateIndex, recipe_features
+from embedder import BatchEmbedder
+from export_vectors import export_vectors
+from manifest import IndexManifest, hash_content
+from pipeline import batched, prefetch, threaded_map
+from recipe_store import RecipeStore, RecordStat, recipe_store_path
+
+# Embedding providers and the index version are shared with the backend so that index and query
+# vectors match and cached results are dropped after an ingest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from embedding_providers import provider_from_env  # noqa: E402
+from result_cache import bump_index_version  # noqa: E402
+
 load_dotenv()
-client = OpenAI()
 
-# Initialize ChromaDB client
-chroma_client = chromadb.HttpClient()
+# Retries are left to the batch embedder so that rate limiting feeds back into its concurrency
+client = OpenAI(max_retries=0)
+
+# Embedding model selected by EMBEDDING_PROVIDER, the backend must be configured the same way
+provider = provider_from_env(client=client)
 
-# Define embedding model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Packs texts into few requests and keeps a bounded, 429-aware number of them in flight
+embedder = BatchEmbedder(
+    provider,
+    batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "256")),
+    max_concurrency=int(os.getenv("EMBEDDING_CONCURRENCY", "8"))
+)
+
+# Initialize ChromaDB client, same server settings as the backend
+chroma_client = chromadb.HttpClient(host=os.getenv("CHROMA_HOST", "localhost"), port=int(os.getenv("CHROMA_PORT", "8000")))
 
 # Directory containing recipe JSON files
 recipes_dir = "../db/recipes_raw"
 
+# Remembers content hash and embedding model per recipe file between runs
+manifest_path = os.getenv("INGEST_MANIFEST_PATH", "../db/index_manifest.sqlite")
+
+# Bumped after every run that changed the collections, the backend drops cached results on a new version
+index_version_path = os.getenv("INDEX_VERSION_PATH", "../db/index_version")
+
 
 # Preprocess recipes into a single string for embedding
 def preprocess_recipe(recipe):
@@ -29,91 +61,313 @@ def preprocess_ingredients(recipe):
     return ", ".join(recipe.get('core_ingredients', []))
 
 
-def generate_ada_embedding(text, model='text-embedding-3-small'):
-    text = text.replace('\n', ' ')
-    return client.embeddings.create(input=[text], model=model).data[0].embedding
-
-
-# Read all JSON files from the directory and process
-recipes = []
-for filename in os.listdir(recipes_dir):
-    if filename.endswith(".json"):
-        file_path = os.path.join(recipes_dir, filename)
-        with open(file_path, "r", encoding="utf-8") as file:
-            recipe = json.load(file)
-            recipe_text = preprocess_recipe(recipe)
-            recipe_embedding = generate_ada_embedding(recipe_text)
-            ingredient_embedding = generate_ada_embedding(preprocess_ingredients(recipe))
-
-            if isinstance(recipe["instructions"], list):
-                recipe["instructions"] = " ".join(recipe["instructions"])
-
-            recipes.append({
-                "id": recipe.get("id", filename),  # Use file name as ID if 'id' is missing
-                "title": recipe.get("title", "Unknown Title"),
-                "ingredients": recipe.get("ingredients", []),
-                "tags": recipe.get("tags", []),
-                "cuisine": recipe.get("cuisine", "Unknown"),
-                "diet_type": recipe.get("diet_type", "Unknown"),
-                "time_to_eat": recipe.get("time_to_eat", "-"),
-                "img_links": recipe.get("img_links", []),
-                "instructions": recipe.get("instructions", ""),
-                "source_url": recipe.get("source_url", ""),
-                "embedding": recipe_embedding,
-                "ingredient_embedding": ingredient_embedding
-            })
-
-# Create the main recipes collection
-collection = chroma_client.get_or_create_collection(name="recipes", metadata={"hnsw:space": "cosine"})
-
-# Create the ingredients-specific collection
-ingredient_collection = chroma_client.get_or_create_collection(name="recipes_by_ingredients",
-                                                               metadata={"hnsw:space": "cosine"})
-
-# Insert recipes into the main collection
-for recipe in recipes:
-    if len(recipe["img_links"]) == 0:
-        continue
-
-    collection.add(
-        documents=[preprocess_recipe(recipe)],
-        metadatas=[{
-            "id": recipe["id"],
-            "title": recipe["title"],
-            "tags": ", ".join(recipe["tags"]),  # Convert list to comma-separated string
-            "cuisine": recipe["cuisine"],
-            "diet_type": recipe["diet_type"],
-            "instructions": recipe["instructions"],
-            "ingredients": ";; ".join(recipe["ingredients"]),
-            "img_links": ", ".join(recipe["img_links"]),
-            "time_to_eat": recipe.get("time_to_eat", "-"),
-            "source_url": recipe["source_url"]
-        }],
-        ids=[recipe["id"]],
-        embeddings=[recipe["embedding"]]
-    )
-
-# Insert recipes into the ingredients-specific collection
-for recipe in recipes:
-    if len(recipe["img_links"]) == 0:
-        continue
-
-    ingredient_collection.add(
-        documents=[preprocess_ingredients(recipe)],
-        metadatas=[{
-            "id": recipe["id"],
-            "title": recipe["title"],
-            "tags": ", ".join(recipe["tags"]),
-            "cuisine": recipe["cuisine"],
-            "diet_type": recipe["diet_type"],
-            "instructions": recipe["instructions"],
-            "ingredients": ";; ".join(recipe["ingredients"]),
-            "img_links": ", ".join(recipe["img_links"]),
-            "time_to_eat": recipe.get("time_to_eat", "-"),
-            "source_url": recipe["source_url"]
-        }],
-        ids=[recipe["id"]],
-        embeddings=[recipe["ingredient_embedding"]]
-    )
-
-print(f"Inserted {len(recipes)} recipes into ChromaDB.")
+def normalize_recipe(recipe, filename, content_hash):
+    if isinstance(recipe.get("instructions"), list):
+        recipe["instructions"] = " ".join(recipe["instructions"])
+
+    return {
+        "id": recipe.get("id", filename),  # Use file name as ID if 'id' is missing
+        "title": recipe.get("title", "Unknown Title"),
+        "ingredients": recipe.get("ingredients", []),
+        "core_ingredients": recipe.get("core_ingredients", []),
+        "tags": recipe.get("tags", []),
+        "cuisine": recipe.get("cuisine", "Unknown"),
+        "diet_type": recipe.get("diet_type", "Unknown"),
+        "time_to_eat": recipe.get("time_to_eat", "-"),
+        "img_links": recipe.get("img_links", []),
+        "instructions": recipe.get("instructions", ""),
+        "source_url": recipe.get("source_url", ""),
+        "content_hash": content_hash,
+        "duplicate_of": None
+    }
+
+
+def indexable(recipe):
+    # Recipes without images are not shown, near-duplicates are only stored under the first recipe's ID
+    return len(recipe["img_links"]) > 0 and not recipe["duplicate_of"]
+
+
+def recipe_metadata(recipe):
+    return {
+        "id": recipe["id"],
+        "title": recipe["title"],
+        "tags": ", ".join(recipe["tags"]),  # Convert list to comma-separated string
+        "cuisine": recipe["cuisine"],
+        "diet_type": recipe["diet_type"],
+        "instructions": recipe["instructions"],
+        "ingredients": ";; ".join(recipe["ingredients"]),
+        "img_links": ", ".join(recipe["img_links"]),
+        "time_to_eat": recipe.get("time_to_eat", "-"),
+        "source_url": recipe["source_url"],
+        "content_hash": recipe["content_hash"]
+    }
+
+
+def read_file(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def recipe_sources(store=None):
+    """
+    Lists the raw recipes, from the packed store if one is given, else from the recipes folder.
+
+    Yields:
+        tuple: (filename, stat, content_hash, read), where content_hash is None if only reading
+        the recipe tells, and read() returns the recipe's JSON bytes.
+    """
+    if store is None:
+        for entry in os.scandir(recipes_dir):
+            if entry.name.endswith(".json"):
+                yield entry.name, entry.stat(), None, partial(read_file, entry.path)
+        return
+    for recipe_id, segment, offset, length, content_hash in store.entries():
+        # Named like the files so the manifest carries over; the record's location stands in for size and mtime
+        yield f"{recipe_id}.json", RecordStat(length, (segment << 40) | offset), content_hash, \
+            partial(store.read, segment, offset, length)
+
+
+def read_recipe(filename, store=None):
+    if store is not None:
+        return store.get(filename[:-len(".json")])
+    path = os.path.join(recipes_dir, filename)
+    if not os.path.exists(path):
+        return None
+    return json.loads(read_file(path).decode("utf-8"))
+
+
+def load_duplicate_index(manifest_entries, fingerprints, full=False, store=None):
+    """
+    Builds the near-duplicate index from the stored fingerprints of all indexed recipes.
+
+    Indexed recipes without a fingerprint, from before deduplication, are read and fingerprinted
+    once. A full run starts with an empty index and checks every recipe again.
+
+    Returns:
+        tuple: The index and the fingerprint rows to store for the backfilled recipes.
+    """
+    duplicates = DuplicateIndex()
+    backfilled = []
+    if full:
+        return duplicates, backfilled
+    for filename, known in manifest_entries.items():
+        if not known[5]:
+            continue
+        if filename in fingerprints:
+            recipe_id, features, signature, _ = fingerprints[filename]
+            duplicates.add(recipe_id, set(json.loads(features)), np.frombuffer(signature, dtype=np.uint32))
+            continue
+        recipe = read_recipe(filename, store)
+        if recipe is None:
+            continue
+        features = recipe_features(recipe)
+        signature = duplicates.signature(features)
+        duplicates.add(known[0], features, signature)
+        backfilled.append((filename, known[0], json.dumps(sorted(features)), signature.tobytes(), None))
+    return duplicates, backfilled
+
+
+def scan_recipes(manifest_entries, present, refreshed, duplicates, full=False, store=None):
+    """
+    Walks the recipes folder (or store) and yields the recipes that are new or changed since the manifest.
+
+    Files whose size and mtime are unchanged are skipped without being read. Files that were
+    touched but still have the same content hash only get their manifest row refreshed.
+
+    Args:
+        manifest_entries (dict): Rows of the manifest, keyed by file name.
+        present (set): Filled with the names of all recipe files found.
+        refreshed (list): Filled with manifest rows whose stat changed but content did not.
+        duplicates (DuplicateIndex): Indexed recipes; a recipe with images that is a near-duplicate
+            of one of them gets its ID in duplicate_of and is not embedded, otherwise it is added.
+        full (bool): Yield every recipe regardless of the manifest.
+        store (RecipeStore, optional): Packed store to read instead of the recipes folder.
+
+    Yields:
+        tuple: (filename, stat, content_hash, recipe), the recipe carries its fingerprint row.
+    """
+    for filename, stat, content_hash, read in recipe_sources(store):
+        present.add(filename)
+        known = manifest_entries.get(filename)
+        if not full and known and known[4] == embedder.model and known[1:3] == (stat.st_size, stat.st_mtime_ns):
+            continue
+
+        data = None
+        if content_hash is None:
+            data = read()
+            content_hash = hash_content(data)
+        if not full and known and known[4] == embedder.model and known[3] == content_hash:
+            refreshed.append((filename, known[0], stat.st_size, stat.st_mtime_ns, content_hash,
+                              embedder.model, known[5]))
+            continue
+
+        data = read() if data is None else data
+        recipe = normalize_recipe(json.loads(data.decode("utf-8")), filename, content_hash)
+        if known and known[0] != recipe["id"]:
+            duplicates.remove(known[0])
+        features = recipe_features(recipe)
+        signature = duplicates.signature(features)
+        if len(recipe["img_links"]) > 0:
+            recipe["duplicate_of"] = duplicates.find(features, signature, exclude=recipe["id"])
+        if indexable(recipe):
+            duplicates.add(recipe["id"], features, signature)
+        else:
+            duplicates.remove(recipe["id"])
+        recipe["fingerprint"] = (filename, recipe["id"], json.dumps(sorted(features)), signature.tobytes(),
+                                 recipe["duplicate_of"])
+        yield filename, stat, content_hash, recipe
+
+
+def embed_chunk(chunk):
+    # Recipe and ingredient texts of a chunk go out together, in as few requests as possible
+    recipes = [recipe for _, _, _, recipe in chunk if indexable(recipe)]
+    texts = [preprocess_recipe(recipe) for recipe in recipes] + [preprocess_ingredients(recipe) for recipe in recipes]
+    embeddings = embedder.embed(texts) if texts else []
+    return chunk, recipes, embeddings[:len(recipes)], embeddings[len(recipes):]
+
+
+def index_recipes(full=False, chunk_size=256, embed_workers=2, queue_size=4, store=None):
+    """
+    Streams new and changed recipes through read -> embed -> write stages.
+
+    Each stage runs in its own threads and hands over chunks through bounded queues, so file
+    reads, embedding requests and Chroma upserts overlap while only a few chunks are held in
+    memory at any time. With a RecipeStore, recipes are streamed from its segments instead of
+    the recipes folder.
+
+    Returns:
+        dict: Numbers of upserted, removed, changed and near-duplicate recipes.
+    """
+    manifest = IndexManifest(manifest_path)
+    manifest_entries = manifest.entries()
+    present = set()
+    refreshed = []
+    duplicates, backfilled = load_duplicate_index(manifest_entries, manifest.fingerprints(), full=full,
+                                                 store=store)
+    manifest.record_fingerprints(backfilled)
+
+    # Collections are tagged with the model and dimension their vectors come from
+    collection_metadata = {"hnsw:space": "cosine", **provider.collection_metadata()}
+    if full:
+        # A full run may switch the embedding model, collections built with another one start over
+        for existing in chroma_client.list_collections():
+            if existing.name in ("recipes", "recipes_by_ingredients"):
+                try:
+                    provider.check_collection(chroma_client.get_collection(existing.name))
+                except RuntimeError:
+                    print(f"Recreating collection '{existing.name}' for {provider.model}")
+                    chroma_client.delete_collection(existing.name)
+
+    # Create the main recipes collection
+    collection = chroma_client.get_or_create_collection(name="recipes", metadata=collection_metadata)
+
+    # Create the ingredients-specific collection
+    ingredient_collection = chroma_client.get_or_create_collection(name="recipes_by_ingredients",
+                                                                   metadata=collection_metadata)
+    provider.check_collection(collection)
+    provider.check_collection(ingredient_collection)
+
+    chunk_size = min(chunk_size, chroma_client.get_max_batch_size())
+    counts = {"upserted": 0, "removed": 0, "changed": 0, "duplicates": 0}
+    # IDs of indexed recipes that changed or are gone; their near-duplicates are checked again
+    released = set()
+
+    def write_chunk(embedded):
+        chunk, recipes, recipe_embeddings, ingredient_embeddings = embedded
+
+        # Drop vectors stored under an old ID, or of recipes that no longer have images or became duplicates
+        stale_ids = []
+        for filename, _, _, recipe in chunk:
+            known = manifest_entries.get(filename)
+            if known and known[5] and (known[0] != recipe["id"] or not indexable(recipe)):
+                stale_ids.append(known[0])
+        if stale_ids:
+            collection.delete(ids=stale_ids)
+            ingredient_collection.delete(ids=stale_ids)
+
+        if recipes:
+            ids = [recipe["id"] for recipe in recipes]
+            metadatas = [recipe_metadata(recipe) for recipe in recipes]
+            collection.upsert(
+                documents=[preprocess_recipe(recipe) for recipe in recipes],
+                metadatas=metadatas,
+                ids=ids,
+                embeddings=recipe_embeddings
+            )
+            ingredient_collection.upsert(
+                documents=[preprocess_ingredients(recipe) for recipe in recipes],
+                metadatas=metadatas,
+                ids=ids,
+                embeddings=ingredient_embeddings
+            )
+        return chunk, len(recipes), len(stale_ids)
+
+    chunks = prefetch(batched(scan_recipes(manifest_entries, present, refreshed, duplicates, full=full, store=store),
+                              chunk_size),
+                      maxsize=queue_size)
+    embedded = threaded_map(embed_chunk, chunks, workers=embed_workers, maxsize=queue_size)
+    for chunk, upserted, removed in threaded_map(write_chunk, embedded, workers=1, maxsize=queue_size):
+        # Only record files once their vectors are stored, so a failed run is picked up next time
+        manifest.record([
+            (filename, recipe["id"], stat.st_size, stat.st_mtime_ns, content_hash, embedder.model,
+             int(indexable(recipe)))
+            for filename, stat, content_hash, recipe in chunk
+        ])
+        manifest.record_fingerprints([recipe["fingerprint"] for _, _, _, recipe in chunk])
+        released.update(manifest_entries[filename][0] for filename, _, _, _ in chunk
+                        if filename in manifest_entries and manifest_entries[filename][5])
+        counts["duplicates"] += sum(1 for _, _, _, recipe in chunk if recipe["duplicate_of"])
+        counts["upserted"] += upserted
+        counts["removed"] += removed
+        counts["changed"] += len(chunk)
+    manifest.record(refreshed)
+
+    # Drop recipes whose source file is gone
+    removed_files = [name for name in manifest_entries if name not in present]
+    for names in batched(removed_files, chunk_size):
+        stale_ids = [manifest_entries[name][0] for name in names if manifest_entries[name][5]]
+        if stale_ids:
+            collection.delete(ids=stale_ids)
+            ingredient_collection.delete(ids=stale_ids)
+        manifest.remove(names)
+        released.update(stale_ids)
+        counts["removed"] += len(stale_ids)
+
+    # A duplicate of a recipe that changed or is gone may no longer be a duplicate. Forgetting it
+    # makes the next scan evaluate it like a new recipe; a full run has checked everything already
+    orphans = [] if full else manifest.duplicates_of(released)
+    manifest.remove(orphans)
+    manifest.close()
+
+    if counts["upserted"]:
+        print(embedder.report())
+    print(f"Upserted {counts['upserted']} recipes, removed {counts['removed']}, "
+          f"skipped {counts['duplicates']} near-duplicates, {len(present) - counts['changed']} unchanged.")
+    if orphans:
+        print(f"Checking {len(orphans)} near-duplicates of changed or removed recipes again")
+        rechecked = index_recipes(chunk_size=chunk_size, embed_workers=embed_workers, queue_size=queue_size,
+                                  store=store)
+        counts = {key: value + rechecked[key] for key, value in counts.items()}
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index new and changed recipes into ChromaDB.")
+    parser.add_argument("--full", action="store_true", help="Re-embed every recipe, ignoring the manifest")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Recipes per embedding and upsert chunk")
+    parser.add_argument("--embed-workers", type=int, default=2, help="Chunks embedded at the same time")
+    parser.add_argument("--export-vectors", action="store_true",
+                        help="Export the embeddings for the backend's numpy search engine afterwards")
+    parser.add_argument("--store", default=recipe_store_path,
+                        help="Read recipes from this packed store instead of the folder (RECIPE_STORE_PATH)")
+    args = parser.parse_args()
+
+    store = RecipeStore(args.store) if args.store else None
+    counts = index_recipes(full=args.full, chunk_size=args.chunk_size, embed_workers=args.embed_workers, store=store)
+    if store is not None:
+        store.close()
+    if args.export_vectors:
+        export_vectors(chroma_client)
+    # Only once everything the backend reads is written
+    if counts["upserted"] or counts["removed"]:
+        print(f"Index version {bump_index_version(index_version_path)}")
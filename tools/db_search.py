@@ -1,12 +1,21 @@
+import os
+import sys
+
 from chromadb import Client
 from chromadb.config import Settings
 import chromadb
-from sentence_transformers import SentenceTransformer
 from openai import OpenAI
 from dotenv import load_dotenv
 
+# Embedding providers are shared with the backend so that index and query vectors match
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from embedding_providers import provider_from_env  # noqa: E402
+
 load_dotenv()
 client = OpenAI()
+
+# Same embedding provider as the ingest tool and the backend
+provider = provider_from_env(client=client)
 # Connect to ChromaDB server
 chroma_client = chromadb.HttpClient()
 collection = chroma_client.get_collection(name="recipes")
@@ -28,9 +37,9 @@ def query_by_metadata(tag, cuisine):
             print("No metadata available for this document.")
 
 
-def generate_ada_embedding(text, model='text-embedding-3-small'):
+def generate_ada_embedding(text):
     text = text.replace('\n', ' ')
-    return client.embeddings.create(input=[text], model=model).data[0].embedding
+    return provider.embed([text])[0]
 
 
 def query_by_ingredients(ingredient_query, n_results=3):
@@ -0,0 +1,169 @@
+import argparse
+import hashlib
+import os
+import re
+import uuid
+from typing import Dict, FrozenSet, Iterable, Optional, Set
+
+import numpy as np
+from dotenv import load_dotenv
+
+from crawler import get_base_url
+from recipe_store import iter_recipes
+
+load_dotenv()
+
+# Jaccard similarity of title words and core ingredients above which two recipes are the same
+dedup_threshold = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+
+# Words that say nothing about which recipe it is
+STOPWORDS = {"a", "an", "and", "the", "with", "of", "in", "on", "for", "style", "mit", "und", "der", "die", "das"}
+
+# Parameters of the universal hash family, as in the common MinHash implementations
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def recipe_id_for_url(url):
+    """
+    Derives a stable recipe ID from the canonical source URL, so the same page always maps to
+    the same file and the same vectors.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, get_base_url(url)))
+
+
+def recipe_features(recipe) -> Set[str]:
+    """
+    The set a recipe is compared by: the words of its title and its core ingredients.
+    """
+    words = re.findall(r"\w+", str(recipe.get("title", "")).casefold())
+    features = {f"t:{word}" for word in words if word not in STOPWORDS and not word.isdigit()}
+    features.update(f"i:{' '.join(str(name).casefold().split())}" for name in recipe.get("core_ingredients", []))
+    return features
+
+
+class DuplicateIndex:
+    """
+    Finds near-duplicate recipes with MinHash signatures and locality-sensitive hashing.
+
+    Every recipe gets a signature of num_perm minimum hashes over its features. The signature is
+    split into bands and recipes sharing any band are candidates. With 20 bands of 6 rows a pair
+    at similarity 0.8 becomes a candidate with 99.8% probability, one at 0.3 with 1.5%, so a
+    lookup stays cheap as the corpus grows. Candidates are confirmed with the exact Jaccard
+    similarity of the feature sets, the MinHash estimate is too noisy near the threshold.
+
+    Args:
+        threshold (float): Minimum Jaccard similarity of a duplicate.
+        num_perm (int): Number of hash functions per signature.
+        bands (int): Number of LSH bands, must divide num_perm.
+        seed (int): Seed of the hash functions; signatures are only comparable with the same seed.
+    """
+
+    def __init__(self, threshold=dedup_threshold, num_perm=120, bands=20, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.features: Dict[str, FrozenSet[str]] = {}
+        self.signatures: Dict[str, np.ndarray] = {}
+        self._tables = [{} for _ in range(bands)]
+
+    def signature(self, features) -> np.ndarray:
+        if not features:
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint32)
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=4).digest(), "little") for f in features],
+            dtype=np.uint64
+        )
+        # uint64 arithmetic wraps around, which the modulo and mask tolerate
+        permuted = ((hashes[:, None] * self.a + self.b) % MERSENNE_PRIME) & MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, recipe_id, features, signature=None):
+        if recipe_id in self.signatures:
+            self.remove(recipe_id)
+        signature = self.signature(features) if signature is None else signature
+        self.features[recipe_id] = frozenset(features)
+        self.signatures[recipe_id] = signature
+        for table, key in zip(self._tables, self._band_keys(signature)):
+            table.setdefault(key, set()).add(recipe_id)
+
+    def remove(self, recipe_id):
+        signature = self.signatures.pop(recipe_id, None)
+        if signature is None:
+            return
+        del self.features[recipe_id]
+        for table, key in zip(self._tables, self._band_keys(signature)):
+            ids = table.get(key)
+            if ids:
+                ids.discard(recipe_id)
+                if not ids:
+                    del table[key]
+
+    def find(self, features, signature=None, exclude=None) -> Optional[str]:
+        """
+        Returns:
+            str: ID of the most similar indexed recipe at or above the threshold, or None.
+        """
+        if not features:
+            return None
+        signature = self.signature(features) if signature is None else signature
+        candidates = set()
+        for table, key in zip(self._tables, self._band_keys(signature)):
+            candidates.update(table.get(key, ()))
+        candidates.discard(exclude)
+
+        best_id, best_similarity = None, self.threshold
+        for candidate in candidates:
+            other = self.features[candidate]
+            similarity = len(features & other) / len(features | other)
+            if similarity >= best_similarity:
+                best_id, best_similarity = candidate, similarity
+        return best_id
+
+    def check(self, recipe_id, recipe) -> Optional[str]:
+        """
+        Looks a recipe up and adds it if it is not a duplicate.
+
+        Returns:
+            str: ID of the recipe it duplicates, or None.
+        """
+        features = recipe_features(recipe)
+        signature = self.signature(features)
+        duplicate_of = self.find(features, signature, exclude=recipe_id)
+        if duplicate_of is None:
+            self.add(recipe_id, features, signature)
+        return duplicate_of
+
+    @classmethod
+    def from_recipes(cls, recipes: Iterable[dict], **kwargs):
+        index = cls(**kwargs)
+        for recipe in recipes:
+            index.add(recipe["id"], recipe_features(recipe))
+        return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List near-duplicate recipes in a recipes folder.")
+    parser.add_argument("--folder", default="../db/recipes_raw", help="Recipes folder, unless RECIPE_STORE_PATH is set")
+    parser.add_argument("--threshold", type=float, default=dedup_threshold)
+    args = parser.parse_args()
+
+    index = DuplicateIndex(threshold=args.threshold)
+    titles = {}
+    duplicates = 0
+    for recipe in iter_recipes(args.folder):
+        titles[recipe["id"]] = recipe.get("title")
+        duplicate_of = index.check(recipe["id"], recipe)
+        if duplicate_of:
+            duplicates += 1
+            print(f"{recipe['id']} ({recipe.get('title')}) duplicates {duplicate_of} ({titles[duplicate_of]})")
+    print(f"{duplicates} duplicates among {len(titles)} recipes")
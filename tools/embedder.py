@@ -0,0 +1,193 @@
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+from openai import OpenAI
+
+# Embedding providers are shared with the backend so that index and query vectors match
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from embedding_providers import EmbeddingProvider, OpenAIEmbeddingProvider  # noqa: E402
+
+# OpenAI accepts up to 2048 inputs and roughly 300k tokens per embeddings request
+MAX_BATCH_SIZE = 2048
+MAX_BATCH_TOKENS = 250000
+
+
+def estimate_tokens(text):
+    # Cheap upper bound, German recipe text averages well above 3 characters per token
+    return len(text) // 3 + 1
+
+
+def make_batches(texts, batch_size=256, max_batch_tokens=MAX_BATCH_TOKENS):
+    """
+    Packs texts into batches limited by item count and estimated token count.
+
+    Returns:
+        list: (start, end) index pairs into texts.
+    """
+    batches = []
+    start = 0
+    tokens = 0
+    for i, text in enumerate(texts):
+        text_tokens = estimate_tokens(text)
+        if i > start and (i - start >= batch_size or tokens + text_tokens > max_batch_tokens):
+            batches.append((start, i))
+            start = i
+            tokens = 0
+        tokens += text_tokens
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that halves on rate limiting and grows back by one after a full
+    window of successful requests (AIMD).
+    """
+
+    def __init__(self, maximum, minimum=1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = maximum
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+
+class BatchEmbedder:
+    """
+    Embeds many texts with few requests: texts are packed into batches, a bounded number of
+    batches is in flight at once, and the concurrency adapts to 429 responses.
+
+    Failed batches are retried on their own with exponential backoff and jitter, batches that
+    already succeeded are never sent again.
+
+    Args:
+        provider (EmbeddingProvider): Provider that computes the embeddings. For OpenAI, give its
+            client max_retries=0 so that rate limiting reaches the adaptive limiter.
+        batch_size (int): Maximum number of texts per request.
+        max_batch_tokens (int): Maximum estimated number of tokens per request.
+        max_concurrency (int): Maximum number of requests in flight.
+        max_retries (int): How often a single batch is retried before giving up.
+    """
+
+    def __init__(self, provider: EmbeddingProvider, batch_size=256, max_batch_tokens=MAX_BATCH_TOKENS,
+                 max_concurrency=8, max_retries=8):
+        self.provider = provider
+        self.model = provider.model
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.limiter = AdaptiveLimiter(max_concurrency)
+        self.texts = 0
+        self.tokens = 0
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.elapsed = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _embed_batch(self, texts):
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            throttled = False
+            try:
+                embeddings, tokens = self.provider.embed_with_usage(texts)
+                with self._stats_lock:
+                    self.requests += 1
+                    self.texts += len(texts)
+                    self.tokens += tokens
+                return embeddings
+            except openai.RateLimitError as e:
+                throttled = True
+                error = e
+                with self._stats_lock:
+                    self.throttled += 1
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                error = e
+            finally:
+                self.limiter.release(throttled=throttled)
+
+            if attempt == self.max_retries:
+                raise error
+            with self._stats_lock:
+                self.retries += 1
+            time.sleep(min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def embed(self, texts):
+        """
+        Embeds all texts and returns the embeddings in input order.
+        """
+        texts = [text.replace("\n", " ") for text in texts]
+        embeddings = [None] * len(texts)
+        batches = make_batches(texts, self.batch_size, self.max_batch_tokens)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {
+                executor.submit(self._embed_batch, texts[begin:end]): begin
+                for begin, end in batches
+            }
+            for future, begin in futures.items():
+                for offset, embedding in enumerate(future.result()):
+                    embeddings[begin + offset] = embedding
+        self.elapsed += time.perf_counter() - start
+
+        return embeddings
+
+    def report(self):
+        elapsed = self.elapsed or 1e-9
+        return (
+            f"Embedded {self.texts} texts ({self.tokens} tokens) in {self.elapsed:.2f}s: "
+            f"{self.texts / elapsed:.1f} texts/s, {self.tokens / elapsed:.1f} tokens/s, "
+            f"{self.requests} requests, {self.throttled} throttled, {self.retries} retries, "
+            f"final concurrency {self.limiter.limit}"
+        )
+
+
+if __name__ == "__main__":
+    # Benchmark against the local fake server, e.g. python embedder.py --texts 20000 --latency 0.2
+    from fake_openai import start_fake_server
+
+    parser = argparse.ArgumentParser(description="Benchmark the batch embedder against a local fake server.")
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--server-max-concurrent", type=int, default=4)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_server(latency=args.latency, max_concurrent=args.server_max_concurrent)
+    fake_provider = OpenAIEmbeddingProvider(client=OpenAI(base_url=base_url, api_key="fake", max_retries=0))
+    embedder = BatchEmbedder(fake_provider, batch_size=args.batch_size, max_concurrency=args.concurrency)
+    sample = [f"Recipe {i} with pasta, tomatoes and basil" for i in range(args.texts)]
+    result = embedder.embed(sample)
+    assert len(result) == len(sample) and all(result)
+    print(embedder.report())
+    server.shutdown()
@@ -0,0 +1,103 @@
+import argparse
+import glob
+import json
+import os
+import time
+
+import chromadb
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Directory the backend's numpy search engine reads from
+vectors_dir = os.getenv("VECTOR_INDEX_DIR", "../db/vectors")
+
+# float16 halves memory and page cache use, float32 is several times faster to score where numpy
+# has no vectorized float16 conversion
+vectors_dtype = os.getenv("VECTOR_INDEX_DTYPE", "float16")
+
+COLLECTIONS = ("recipes", "recipes_by_ingredients")
+
+
+def export_collection(chroma_client, name, out_dir=vectors_dir, dtype=vectors_dtype, page_size=1000):
+    """
+    Writes the embeddings of a Chroma collection as a contiguous, row-normalized float16 (or
+    float32) matrix.
+
+    The matrix goes to a new file named after the export time, then {name}.json, which holds the
+    recipe IDs in row order and points to the matrix, is replaced atomically. Readers therefore
+    always see a matching pair, and a backend that still maps an older matrix keeps working.
+
+    Returns:
+        int: Number of exported vectors.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    collection = chroma_client.get_collection(name)
+    metadata = collection.metadata or {}
+    count = collection.count()
+
+    matrix_name = f"{name}-{time.time_ns()}.npy"
+    matrix_path = os.path.join(out_dir, matrix_name)
+    matrix = None
+    ids = []
+    offset = 0
+    while offset < count:
+        batch = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+        if not batch["ids"]:
+            break
+        embeddings = np.asarray(batch["embeddings"], dtype=np.float32)
+        if matrix is None:
+            # Written straight into the memory-mapped output file, the whole matrix is never held in memory
+            matrix = np.lib.format.open_memmap(matrix_path, mode="w+", dtype=dtype,
+                                               shape=(count, embeddings.shape[1]))
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix[offset:offset + len(embeddings)] = embeddings / norms
+        ids.extend(batch["ids"])
+        offset += len(batch["ids"])
+
+    if matrix is None:
+        print(f"Collection '{name}' is empty, nothing exported")
+        return 0
+    matrix.flush()
+    del matrix
+    if len(ids) != count:
+        os.remove(matrix_path)
+        raise RuntimeError(f"Collection '{name}' changed during the export, run it again")
+
+    manifest_path = os.path.join(out_dir, f"{name}.json")
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump({
+            "matrix": matrix_name,
+            "ids": ids,
+            "embedding_model": metadata.get("embedding_model"),
+            "embedding_dim": metadata.get("embedding_dim"),
+            "exported_at": time.time()
+        }, file)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    # Processes that still map an old matrix keep their pages after the file is unlinked
+    for old_path in glob.glob(os.path.join(out_dir, f"{name}-*.npy")):
+        if os.path.basename(old_path) != matrix_name:
+            os.remove(old_path)
+    return len(ids)
+
+
+def export_vectors(chroma_client=None, out_dir=vectors_dir, dtype=vectors_dtype):
+    # Same server settings as the backend and db_processor.py
+    chroma_client = chroma_client or chromadb.HttpClient(host=os.getenv("CHROMA_HOST", "localhost"),
+                                                         port=int(os.getenv("CHROMA_PORT", "8000")))
+    for name in COLLECTIONS:
+        start = time.perf_counter()
+        exported = export_collection(chroma_client, name, out_dir, dtype)
+        print(f"Exported {exported} vectors of '{name}' in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the Chroma embeddings for the backend's numpy search engine.")
+    parser.add_argument("--out-dir", default=vectors_dir, help="Target directory (VECTOR_INDEX_DIR)")
+    parser.add_argument("--dtype", default=vectors_dtype, choices=["float16", "float32"])
+    args = parser.parse_args()
+
+    export_vectors(out_dir=args.out_dir, dtype=args.dtype)
@@ -0,0 +1,170 @@
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text, dim=1536):
+    """
+    Deterministic pseudo-embedding for a text, normalized to unit length.
+
+    The same text always maps to the same vector, so cached and uncached paths can be compared.
+    """
+    values = []
+    counter = 0
+    while len(values) < dim:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        values.extend(v / 2 ** 31 - 1.0 for v in struct.unpack("<8I", digest))
+        counter += 1
+    values = values[:dim]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open hundreds of connections at once, the default backlog of 5 drops them
+    request_queue_size = 1024
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            throttled = server.max_concurrent is not None and server.in_flight > server.max_concurrent
+            if throttled:
+                server.throttled += 1
+        try:
+            if throttled:
+                self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                headers={"Retry-After": "0.1"})
+                return
+
+            if server.latency:
+                time.sleep(server.latency * random.uniform(0.8, 1.2))
+
+            if self.path.endswith("/embeddings"):
+                self._send_json(200, self._embeddings(request))
+            elif self.path.endswith("/chat/completions"):
+                self._send_json(200, self._chat_completion(request))
+            else:
+                self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _embeddings(self, request):
+        inputs = request.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        tokens = sum(max(len(text.split()), 1) for text in inputs)
+
+        # The OpenAI client asks for base64 encoded float32 vectors when numpy is installed
+        if request.get("encoding_format") == "base64":
+            def encode(vector):
+                return base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+        else:
+            def encode(vector):
+                return vector
+
+        return {
+            "object": "list",
+            "model": request.get("model", "text-embedding-3-small"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": encode(fake_embedding(text, self.server.dim))}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+
+    def _chat_completion(self, request):
+        # Answers every prompt with a deterministic JSON object, enough for the substitution endpoint
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        content = json.dumps({"substitutions": [f"substitute {digest[:6]}", f"substitute {digest[6:12]}"]})
+        tokens = max(len(prompt.split()), 1)
+        return {
+            "id": f"chatcmpl-{digest[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": tokens, "completion_tokens": 12, "total_tokens": tokens + 12},
+        }
+
+
+def start_fake_server(host="127.0.0.1", port=0, latency=0.0, dim=1536, max_concurrent=None):
+    """
+    Starts a fake OpenAI API in a background thread.
+
+    Args:
+        host (str): Interface to bind to.
+        port (int): Port to bind to, 0 picks a free one.
+        latency (float): Simulated upstream latency per request in seconds.
+        dim (int): Dimension of the returned embeddings.
+        max_concurrent (int, optional): Requests above this concurrency get a 429 response.
+
+    Returns:
+        tuple: The running server and its base URL to pass to the OpenAI client.
+    """
+    server = FakeOpenAIServer((host, port), FakeOpenAIHandler)
+    server.latency = latency
+    server.dim = dim
+    server.max_concurrent = max_concurrent
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.in_flight = 0
+    server.throttled = 0
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake of the OpenAI API for tests and benchmarks.")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated latency per request in seconds")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--max-concurrent", type=int, default=None, help="Answer with 429 above this concurrency")
+    args = parser.parse_args()
+
+    fake_server, base_url = start_fake_server(port=args.port, latency=args.latency, dim=args.dim,
+                                              max_concurrent=args.max_concurrent)
+    print(f"Fake OpenAI API listening on {base_url} (set OPENAI_BASE_URL to use it)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake_server.shutdown()
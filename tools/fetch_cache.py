@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Optional
+
+
+def hash_page(pre) -> str:
+    """
+    Hashes what the recipe extraction sees of a page: the pre-extracted text, links and images.
+    Changes elsewhere on the page (ads, tracking, layout) leave the hash unchanged.
+    """
+    content = json.dumps([pre["text"], pre["suggestion_links"], pre["img_links"]], ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """
+    Remembers, per canonical URL, how a page was fetched and what was extracted from it.
+
+    A row stores the ETag and Last-Modified validators of the last response, the hash of the
+    pre-extracted content and the extracted recipe JSON (including its ID, or the LLM's error).
+    A re-crawl sends the validators as a conditional request; a 304 or an unchanged content hash
+    reuses the stored recipe without calling the LLM.
+
+    Args:
+        path (str): Location of the SQLite file.
+        commit_every (int): Number of updates between commits.
+    """
+
+    def __init__(self, path, commit_every=50):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT NOT NULL, "
+            "recipe TEXT NOT NULL, fetched_at REAL NOT NULL)"
+        )
+        self.db.commit()
+        self.commit_every = commit_every
+        self.not_modified = 0
+        self.unchanged = 0
+        self.extracted = 0
+        self._updates = 0
+
+    def get(self, url) -> Optional[dict]:
+        row = self.db.execute(
+            "SELECT etag, last_modified, content_hash, recipe FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "content_hash": row[2], "recipe": json.loads(row[3])}
+
+    def put(self, url, etag, last_modified, content_hash, recipe):
+        self.db.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, content_hash, json.dumps(recipe, ensure_ascii=False), time.time())
+        )
+        self._updates += 1
+        if self._updates >= self.commit_every:
+            self.commit()
+
+    def stats(self):
+        return {"not_modified": self.not_modified, "unchanged": self.unchanged, "extracted": self.extracted}
+
+    def commit(self):
+        self.db.commit()
+        self._updates = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+
+if __name__ == "__main__":
+    # Crawls a fixture site, changes some pages and re-crawls it, e.g. python fetch_cache.py --pages 500
+    import argparse
+    import asyncio
+    import random
+    import tempfile
+
+    from fake_openai import start_fake_server
+    from fixture_site import revise_page, start_fixture_site
+
+    parser = argparse.ArgumentParser(description="Benchmark a re-crawl with conditional requests and the extraction cache.")
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.02, help="Latency of the fixture site")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Latency of the fake LLM")
+    parser.add_argument("--layout-changes", type=float, default=0.05, help="Share of pages with a new layout")
+    parser.add_argument("--recipe-changes", type=float, default=0.02, help="Share of pages with a changed recipe")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    llm, llm_url = start_fake_server(latency=args.llm_latency)
+    os.environ["OPENAI_BASE_URL"] = llm_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    import chefkoch_extract
+
+    site, base_url = start_fixture_site(pages=args.pages, latency=args.latency)
+    work_dir = tempfile.mkdtemp()
+    options = dict(concurrency=args.concurrency, per_host=args.concurrency, delay=0.0,
+                   path=os.path.join(work_dir, "frontier.sqlite"), cache_path=os.path.join(work_dir, "cache.sqlite"),
+                   folder=os.path.join(work_dir, "recipes"))
+
+    results = {}
+    for run in ("crawl", "recrawl"):
+        requests_before, llm_before, not_modified_before = site.requests, llm.requests, site.not_modified
+        start = time.perf_counter()
+        asyncio.run(chefkoch_extract.crawl([f"{base_url}/rezepte/0/rezept.html"], recrawl=run == "recrawl", **options))
+        results[run] = {
+            "seconds": round(time.perf_counter() - start, 2),
+            "requests": site.requests - requests_before,
+            "not_modified": site.not_modified - not_modified_before,
+            "llm_calls": llm.requests - llm_before,
+        }
+        if run == "crawl":
+            rng = random.Random(0)
+            for page in rng.sample(range(args.pages), int(args.pages * args.layout_changes)):
+                revise_page(site, page)
+            for page in rng.sample(range(args.pages), int(args.pages * args.recipe_changes)):
+                revise_page(site, page, recipe=True)
+
+    results["recipe_files"] = len(os.listdir(options["folder"]))
+    print(json.dumps(results, indent=2))
+    site.shutdown()
+    llm.shutdown()
@@ -0,0 +1,190 @@
+import argparse
+import hashlib
+import html
+import json
+import random
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DISHES = ["Spaghetti", "Risotto", "Gulasch", "Flammkuchen", "Linsensuppe", "Ofengemüse", "Käsespätzle", "Curry"]
+INGREDIENTS = ["Zwiebel", "Knoblauch", "Tomate", "Paprika", "Sahne", "Butter", "Reis", "Nudeln", "Linsen", "Käse"]
+
+
+def recipe_links(page, pages, links_per_page):
+    # Deterministic pseudo-random neighbours, the site is one connected graph
+    rng = random.Random(page)
+    return sorted({(page + 1) % pages} | {rng.randrange(pages) for _ in range(links_per_page - 1)})
+
+
+def recipe_page(page, pages, links_per_page, json_ld=False, language="de", revision=(0, 0)):
+    """
+    Renders a recipe page in the shape of a typical recipe site: navigation, ads and a footer
+    around the recipe, and links to other recipes. With json_ld the recipe is also embedded as
+    schema.org JSON-LD, like most large recipe sites do.
+
+    revision is a pair of counters: the first changes only the page around the recipe (tracking
+    code), the second changes the recipe itself.
+    """
+    rng = random.Random(page)
+    title = f"{DISHES[page % len(DISHES)]} Nr. {page}"
+    ingredients = [f"{rng.randint(1, 500)} g {name}" for name in rng.sample(INGREDIENTS, 5)]
+    minutes = rng.randint(10, 90)
+    instructions = f"Alles klein schneiden, anbraten und {minutes} Minuten garen."
+    if revision[1]:
+        instructions += f" Variante {revision[1]}: mit Salz abschmecken."
+    structured = ""
+    if json_ld:
+        structured = '<script type="application/ld+json">' + json.dumps({
+            "@context": "https://schema.org", "@type": "Recipe", "name": title, "inLanguage": language,
+            "image": [f"/img/{page}.jpg"], "recipeIngredient": ingredients, "totalTime": f"PT{minutes + 10}M",
+            "recipeInstructions": [{"@type": "HowToStep", "text": instructions}], "recipeCuisine": "Deutsch"
+        }) + "</script>"
+    navigation = "".join(f'<li><a href="/kategorie/{i}">Kategorie {i}</a></li>' for i in range(40))
+    suggestions = "".join(
+        f'<li><a href="/rezepte/{link}/rezept.html?ref=suggestion">Rezept {link}</a></li>'
+        for link in recipe_links(page, pages, links_per_page)
+    )
+    return f"""<!DOCTYPE html>
+<html lang="{language}"><head><title>{html.escape(title)}</title>{structured}
+<script>window.tracking = {{"page": {page}, "revision": {revision[0]}}};</script><style>body {{ font-family: sans-serif; }}</style></head>
+<body>
+<header><nav><ul>{navigation}</ul></nav></header>
+<div class="ad">Anzeige: Jetzt Kochkurs buchen!</div>
+<main><article class="recipe">
+<h1>{html.escape(title)}</h1>
+<img src="/img/{page}.jpg" alt="{html.escape(title)}">
+<table class="ingredients">{"".join(f"<tr><td>{html.escape(i)}</td></tr>" for i in ingredients)}</table>
+<div class="instructions"><p>{html.escape(instructions)}</p></div>
+</article>
+<section class="suggestions"><h2>Das könnte dir auch gefallen</h2><ul>{suggestions}</ul></section></main>
+<footer>{"".join(f'<a href="/info/{i}">Info {i}</a>' for i in range(30))}</footer>
+</body></html>"""
+
+
+class FixtureSiteServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class FixtureSiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if len(parts) == 3 and parts[0] == "rezepte" and parts[1].isdigit() and int(parts[1]) < server.pages:
+            page = int(parts[1])
+            status = 200
+            body = recipe_page(page, server.pages, server.links_per_page, server.json_ld, server.language,
+                               server.revisions.get(page, (0, 0))).encode("utf-8")
+            etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+            last_modified = server.modified.get(page, server.started)
+            if self._not_modified(etag, last_modified):
+                with server.lock:
+                    server.not_modified += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            headers = {"ETag": etag, "Last-Modified": formatdate(last_modified, usegmt=True)}
+        else:
+            status = 404
+            body = b"<html><body>Not found</body></html>"
+            headers = {}
+
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_modified(self, etag, last_modified):
+        # If-None-Match takes precedence over If-Modified-Since
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match:
+            return etag in [tag.strip() for tag in if_none_match.split(",")]
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+def start_fixture_site(host="127.0.0.1", port=0, pages=1000, links_per_page=5, latency=0.0, json_ld=False,
+                       language="de"):
+    """
+    Starts a local recipe site in a background thread, for crawler tests and benchmarks.
+
+    Args:
+        host (str): Interface to bind to.
+        port (int): Port to bind to, 0 picks a free one.
+        pages (int): Number of recipe pages, reachable at /rezepte/<n>/rezept.html.
+        links_per_page (int): Links from each recipe to other recipes.
+        latency (float): Simulated server latency per request in seconds.
+        json_ld (bool): Embed the recipes as schema.org JSON-LD.
+        language (str): Language the pages declare.
+
+    Returns:
+        tuple: The running server and its base URL.
+    """
+    server = FixtureSiteServer((host, port), FixtureSiteHandler)
+    server.pages = pages
+    server.links_per_page = links_per_page
+    server.latency = latency
+    server.json_ld = json_ld
+    server.language = language
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.not_modified = 0
+    server.started = time.time()
+    # page -> (layout revision, recipe revision) and the time of the change, see revise_page
+    server.revisions = {}
+    server.modified = {}
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def revise_page(server, page, recipe=False):
+    """
+    Changes a page of a running fixture site: only its layout, or with recipe=True its recipe.
+    """
+    with server.lock:
+        layout, content = server.revisions.get(page, (0, 0))
+        server.revisions[page] = (layout, content + 1) if recipe else (layout + 1, content)
+        server.modified[page] = time.time()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local recipe site for crawler tests and benchmarks.")
+    parser.add_argument("--port", type=int, default=8910)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--links-per-page", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated latency per request in seconds")
+    parser.add_argument("--json-ld", action="store_true", help="Embed the recipes as schema.org JSON-LD")
+    parser.add_argument("--language", default="de")
+    args = parser.parse_args()
+
+    site, base_url = start_fixture_site(port=args.port, pages=args.pages, links_per_page=args.links_per_page,
+                                        latency=args.latency, json_ld=args.json_ld, language=args.language)
+    print(f"Fixture recipe site listening on {base_url}/rezepte/0/rezept.html")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        site.shutdown()
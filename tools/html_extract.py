@@ -0,0 +1,393 @@
+import argparse
+import importlib.util
+import json
+import os
+import re
+from urllib.parse import urljoin, urlparse
+
+from bs4 import BeautifulSoup
+from dotenv import load_dotenv
+
+from crawler import get_base_url
+
+load_dotenv()
+
+# lxml parses several times faster than the built-in parser, it is used when installed
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+# Upper bound for the page text sent to the LLM
+max_prompt_tokens = int(os.getenv("MAX_PROMPT_TOKENS", "3000"))
+
+# Languages of structured recipes that are taken as is, without the LLM translating them
+skip_llm_languages = [lang.strip() for lang in os.getenv("SKIP_LLM_LANGUAGES", "en").split(",") if lang.strip()]
+
+# Page parts that never contain the recipe
+NOISE_TAGS = ["script", "style", "noscript", "template", "svg", "iframe", "form", "header", "footer", "nav", "aside"]
+NOISE_PATTERN = re.compile(r"\b(ad|ads|advert\w*|banner|cookie\w*|consent|comments?|newsletter|social|share|promo\w*)\b", re.I)
+
+_encoding = None
+
+
+def count_tokens(text):
+    """
+    Counts the tokens of a text for gpt-4o-mini. Without tiktoken, or when its encoding cannot be
+    downloaded on first use, the count is estimated at four characters per token.
+    """
+    global _encoding
+    if _encoding is None:
+        _encoding = False
+        if importlib.util.find_spec("tiktoken") is not None:
+            import tiktoken
+            try:
+                _encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                print(f"Could not load the tiktoken encoding, estimating token counts: {e!r}")
+    if _encoding is False:
+        return (len(text) + 3) // 4
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens):
+    """
+    Cuts a text down to at most max_tokens tokens, keeping its beginning.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is False:
+        return text[:max_tokens * 4]
+    return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _text(value):
+    # Values in JSON-LD may carry HTML entities and markup
+    return re.sub(r"\s+", " ", BeautifulSoup(str(value), HTML_PARSER).get_text(" ")).strip()
+
+
+def _is_recipe(node):
+    return any(str(t).rsplit("/", 1)[-1] == "Recipe" for t in _as_list(node.get("@type")))
+
+
+def _find_recipe_node(data):
+    # Recipes may be nested in lists and @graph containers
+    for node in _as_list(data):
+        if not isinstance(node, dict):
+            continue
+        if _is_recipe(node):
+            return node
+        found = _find_recipe_node(node.get("@graph"))
+        if found:
+            return found
+    return None
+
+
+def _instructions(value):
+    steps = []
+    for step in _as_list(value):
+        if isinstance(step, dict):
+            if "itemListElement" in step:
+                steps.extend(_instructions(step["itemListElement"]))
+            elif step.get("text") or step.get("name"):
+                steps.append(_text(step.get("text") or step.get("name")))
+        elif step:
+            steps.append(_text(step))
+    return steps
+
+
+def _images(value):
+    images = []
+    for image in _as_list(value):
+        if isinstance(image, dict):
+            image = image.get("url") or image.get("contentUrl")
+        if image:
+            images.append(str(image))
+    return images
+
+
+def _minutes(duration):
+    """
+    Converts an ISO 8601 duration like PT1H30M to minutes.
+    """
+    match = re.fullmatch(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:\d+S)?)?", str(duration or "").strip())
+    if not match or not any(match.groups()):
+        return None
+    days, hours, minutes = (int(group or 0) for group in match.groups())
+    return days * 1440 + hours * 60 + minutes
+
+
+def _keywords(value):
+    tags = []
+    for keyword in _as_list(value):
+        tags.extend(part.strip() for part in str(keyword).split(",") if part.strip())
+    return tags
+
+
+def _diet(value):
+    # schema.org diets look like https://schema.org/VegetarianDiet
+    for diet in _as_list(value):
+        name = str(diet).rsplit("/", 1)[-1].replace("Diet", "")
+        if name:
+            return name
+    return None
+
+
+RECIPE_TYPE = re.compile(r"schema\.org/Recipe$")
+RECIPE_CLASS = re.compile(r"recipe", re.I)
+
+
+class PageScan:
+    """
+    The elements pre-extraction needs, collected in one pass over the tree. Searching the tree
+    once per element kind costs more than parsing the page.
+    """
+
+    def __init__(self, soup):
+        self.anchors = []
+        self.json_ld = []
+        self.noise = []
+        self.recipe_scope = self.article = self.recipe_class = self.main = None
+        for element in soup.find_all(True):
+            name = element.name
+            if name == "a":
+                if element.get("href"):
+                    self.anchors.append(element)
+            elif name == "script" and element.get("type") == "application/ld+json":
+                self.json_ld.append(element)
+            elif name == "article" and self.article is None:
+                self.article = element
+            elif name == "main" and self.main is None:
+                self.main = element
+            if name in NOISE_TAGS:
+                self.noise.append(element)
+                continue
+            classes = " ".join(element.get("class") or ())
+            # Classes of html and body describe the page ("has-ads"), they never mark it as noise
+            if name not in ("html", "body") and (NOISE_PATTERN.search(classes)
+                                                 or NOISE_PATTERN.search(element.get("id") or "")):
+                self.noise.append(element)
+            elif self.recipe_scope is None and RECIPE_TYPE.search(element.get("itemtype") or ""):
+                self.recipe_scope = element
+            elif self.recipe_class is None and RECIPE_CLASS.search(classes):
+                self.recipe_class = element
+
+
+def _json_ld_recipe(scripts):
+    for script in scripts:
+        try:
+            data = json.loads(script.string or "")
+        except (ValueError, TypeError):
+            continue
+        node = _find_recipe_node(data)
+        if node:
+            return node
+    return None
+
+
+def _microdata_recipe(scope):
+    if scope is None:
+        return None
+    node = {}
+    for element in scope.find_all(attrs={"itemprop": True}):
+        value = element.get("content") or element.get("src") or element.get("datetime") or element.get_text(" ")
+        for prop in element["itemprop"].split():
+            node.setdefault(prop, []).append(value)
+    for prop in ("name", "recipeCuisine", "totalTime", "prepTime", "cookTime", "inLanguage"):
+        if prop in node:
+            node[prop] = node[prop][0]
+    return node
+
+
+def structured_recipe(soup, page_language=None, scan=None):
+    """
+    Reads a schema.org Recipe from the JSON-LD or microdata of a page.
+
+    Returns:
+        dict: The recipe in the layout of the recipe files, or None. Fields the page does not
+        provide are missing. The source language is kept in "language".
+    """
+    scan = scan or PageScan(soup)
+    node = _json_ld_recipe(scan.json_ld) or _microdata_recipe(scan.recipe_scope)
+    if node is None:
+        return None
+
+    recipe = {}
+    if node.get("name"):
+        recipe["title"] = _text(node["name"])
+    ingredients = [_text(i) for i in _as_list(node.get("recipeIngredient") or node.get("ingredients")) if i]
+    if ingredients:
+        recipe["ingredients"] = ingredients
+    steps = _instructions(node.get("recipeInstructions"))
+    if steps:
+        recipe["instructions"] = "\n".join(steps)
+    tags = _keywords(node.get("keywords")) + _keywords(node.get("recipeCategory"))
+    if tags:
+        recipe["tags"] = list(dict.fromkeys(tags))
+    if node.get("recipeCuisine"):
+        recipe["cuisine"] = ", ".join(_keywords(node["recipeCuisine"]))
+    diet = _diet(node.get("suitableForDiet"))
+    if diet:
+        recipe["diet_type"] = diet
+    minutes = _minutes(node.get("totalTime"))
+    if minutes is None and (node.get("prepTime") or node.get("cookTime")):
+        minutes = (_minutes(node.get("prepTime")) or 0) + (_minutes(node.get("cookTime")) or 0)
+    if minutes:
+        recipe["time_to_eat"] = minutes
+    images = _images(node.get("image"))
+    if images:
+        recipe["img_links"] = images
+    recipe["language"] = str(node.get("inLanguage") or page_language or "").split("-")[0].lower() or None
+    return recipe
+
+
+def core_ingredient(ingredient):
+    """
+    Strips amount, unit and remarks from an ingredient line, e.g. "15 ml honey, runny" -> "honey".
+    """
+    name = re.sub(r"\(.*?\)", " ", ingredient).split(",")[0]
+    name = re.sub(r"^[\d\s/.,½¼¾⅓⅔-]+", "", name.strip())
+    name = re.sub(r"^(tbsp|tsp|tablespoons?|teaspoons?|cups?|g|kg|mg|ml|l|oz|lbs?|pounds?|pinch(es)?|cloves?|"
+                  r"cans?|slices?|pieces?|handful|bunch(es)?|sprigs?)\.?\s+(of\s+)?", "", name, flags=re.I)
+    return name.strip().lower()
+
+
+def recipe_region(soup, scan=None):
+    """
+    Removes navigation, ads and other page furniture and returns the element holding the recipe.
+    """
+    scan = scan or PageScan(soup)
+    noise = {id(element) for element in scan.noise}
+    region = next((candidate for candidate in (scan.recipe_scope, scan.article, scan.recipe_class, scan.main)
+                   if candidate is not None and id(candidate) not in noise), None)
+    region = region or soup.body or soup
+    # A noise element wrapping the recipe (e.g. a "recipe-share-container") stays, the recipe is inside it
+    keep = {id(region), *(id(parent) for parent in region.parents)}
+    for element in scan.noise:
+        if id(element) not in keep and not element.decomposed:
+            element.decompose()
+    return region
+
+
+def suggestion_links(soup, url, scan=None):
+    """
+    Collects the links to other pages of the same kind, i.e. same host and same first path segment.
+    """
+    scan = scan or PageScan(soup)
+    page = urlparse(url)
+    page_url = get_base_url(url)
+    prefix = f"{page.scheme}://{page.netloc}/{page.path.strip('/').split('/')[0]}/"
+    links = {}
+    for a in scan.anchors:
+        link = urljoin(url, a["href"])
+        if link.startswith(prefix):
+            link = get_base_url(link)
+            if link != page_url:
+                links[link] = None
+    return list(links)
+
+
+def pre_extract(html, url, max_tokens=None):
+    """
+    Prepares a page for the recipe parser.
+
+    Structured recipe data (JSON-LD or microdata) is read first; when it holds title, ingredients
+    and instructions it becomes the text for the LLM. Otherwise the page text is cut down to the
+    recipe region. The text is capped at max_tokens. Links to other recipes and images are
+    collected here, the LLM does not need to find them.
+
+    Args:
+        html (str): The page.
+        url (str): URL of the page, used to resolve relative links.
+        max_tokens (int, optional): Token cap of the text, MAX_PROMPT_TOKENS by default.
+
+    Returns:
+        dict: "recipe" (structured data or None), "complete" (whether the structured data can be
+        saved without the LLM), "text", "tokens", "suggestion_links" and "img_links".
+    """
+    soup = BeautifulSoup(html, HTML_PARSER)
+    scan = PageScan(soup)
+    html_tag = soup.find("html")
+    recipe = structured_recipe(soup, html_tag.get("lang") if html_tag else None, scan)
+    if recipe and recipe.get("img_links"):
+        recipe["img_links"] = [urljoin(url, image) for image in recipe["img_links"]]
+    links = suggestion_links(soup, url, scan)
+
+    region = recipe_region(soup, scan)
+    images = [urljoin(url, img["src"]) for img in region.find_all("img", src=True)]
+    if recipe and recipe.get("title") and recipe.get("ingredients") and recipe.get("instructions"):
+        # The structured data is the recipe without any page text around it
+        text = json.dumps({key: value for key, value in recipe.items() if key not in ("img_links", "language")},
+                          ensure_ascii=False)
+    else:
+        text = re.sub(r"\n\s*\n+", "\n", re.sub(r"[ \t\r\f\v]+", " ", region.get_text("\n"))).strip()
+    text = truncate_tokens(text, max_tokens or max_prompt_tokens)
+
+    complete = bool(recipe and recipe.get("title") and recipe.get("ingredients") and recipe.get("instructions")
+                    and recipe.get("language") in skip_llm_languages)
+    return {
+        "recipe": recipe,
+        "complete": complete,
+        "text": text,
+        "tokens": count_tokens(text),
+        "suggestion_links": links,
+        "img_links": (recipe or {}).get("img_links") or images,
+    }
+
+
+def recipe_from_structured(pre):
+    """
+    Completes a structured recipe to the layout of the recipe files, for pages that skip the LLM.
+    """
+    recipe = {key: value for key, value in pre["recipe"].items() if key != "language"}
+    recipe["core_ingredients"] = [name for name in map(core_ingredient, recipe["ingredients"]) if name]
+    recipe.setdefault("tags", [])
+    recipe.setdefault("cuisine", "Unknown")
+    recipe.setdefault("diet_type", "Unknown")
+    recipe.setdefault("time_to_eat", "-")
+    recipe["suggestion_links"] = pre["suggestion_links"]
+    recipe["img_links"] = pre["img_links"]
+    return recipe
+
+
+if __name__ == "__main__":
+    # Compares the prompt size of the full page text with the pre-extracted one, e.g.
+    # python html_extract.py --pages 200, or python html_extract.py --url https://...
+    import time
+
+    from chefkoch_extract import extract_text_from_html, fetch_html
+    from fixture_site import recipe_page
+
+    parser = argparse.ArgumentParser(description="Measure the pre-extraction on fixture pages or a live URL.")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--json-ld", action="store_true", help="Fixture pages with schema.org JSON-LD")
+    parser.add_argument("--language", default="de", help="Language of the fixture pages")
+    args = parser.parse_args()
+
+    if args.url:
+        pages = [(args.url, fetch_html(args.url)[0])]
+    else:
+        pages = [(f"http://127.0.0.1/rezepte/{page}/rezept.html", recipe_page(page, args.pages, 5, args.json_ld, args.language))
+                 for page in range(args.pages)]
+
+    start = time.perf_counter()
+    full_tokens = sum(count_tokens(extract_text_from_html(html)) for _, html in pages)
+    full_time = time.perf_counter() - start
+    start = time.perf_counter()
+    results = [pre_extract(html, url) for url, html in pages]
+    pre_time = time.perf_counter() - start
+
+    print(json.dumps({
+        "pages": len(pages),
+        "parser": HTML_PARSER,
+        "full_text_tokens_per_page": round(full_tokens / len(pages)),
+        "pre_extracted_tokens_per_page": round(sum(r["tokens"] for r in results) / len(pages)),
+        "structured_pages": sum(r["recipe"] is not None for r in results),
+        "llm_skipped_pages": sum(r["complete"] for r in results),
+        "full_text_ms_per_page": round(full_time / len(pages) * 1000, 2),
+        "pre_extract_ms_per_page": round(pre_time / len(pages) * 1000, 2),
+    }, indent=2))
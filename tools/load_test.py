@@ -0,0 +1,304 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from fake_openai import start_fake_server
+from recipe_store import iter_recipes
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(TOOLS_DIR, "..", "backend")
+
+ENDPOINTS = ["/search_by_text", "/search_by_ingredients", "/recipes", "/recipes/{id}", "/substitute"]
+
+# Generic chat phrases next to the recipe titles, these miss the lexical fast path
+TEXT_QUERIES = ["something quick for dinner", "healthy lunch", "comfort food for a rainy day",
+                "dessert with chocolate", "spicy vegetarian dish", "easy recipe for kids"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, process, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Process for {url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0).raise_for_status()
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def start_chroma(path, port):
+    # The chroma CLI belongs to the chromadb package of this interpreter
+    chroma = shutil.which("chroma", path=os.path.dirname(sys.executable)) or shutil.which("chroma")
+    process = subprocess.Popen(
+        [chroma, "run", "--path", path, "--port", str(port), "--log-path", os.path.join(path, "chroma.log")],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    wait_for(f"http://127.0.0.1:{port}/api/v1/heartbeat", process)
+    return process
+
+
+def seed_chroma(recipes_dir):
+    # Imported here, db_processor connects to Chroma and OpenAI with the environment set up by main()
+    import db_processor
+    db_processor.recipes_dir = recipes_dir
+    db_processor.index_recipes()
+
+
+def start_backend(port, env):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "simple:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    # The first listing request waits for the catalog, afterwards the backend is warm
+    wait_for(f"http://127.0.0.1:{port}/diet_types", process)
+    return process
+
+
+def build_workload(recipes_dir, recipe_ids, seed=0):
+    """
+    Builds the parameters each endpoint is called with from the seeded recipes.
+
+    Returns:
+        dict: Endpoint -> list of (path, params) tuples, cycled through during a run.
+    """
+    rng = random.Random(seed)
+    recipes = list(iter_recipes(recipes_dir, store_path=""))
+    titles = [recipe["title"] for recipe in recipes if recipe.get("title")]
+    ingredients = sorted({name for recipe in recipes for name in recipe.get("core_ingredients", [])})
+    cuisines = sorted({recipe.get("cuisine") for recipe in recipes if recipe.get("cuisine")})
+    diet_types = sorted({recipe.get("diet_type") for recipe in recipes if recipe.get("diet_type")})
+
+    workload = {endpoint: [] for endpoint in ENDPOINTS}
+    for _ in range(500):
+        text_query = rng.choice(titles) if rng.random() < 0.7 else rng.choice(TEXT_QUERIES)
+        workload["/search_by_text"].append(("/search_by_text", {"query_text": text_query, "n_results": 3}))
+        ingredient_query = ", ".join(rng.sample(ingredients, 3))
+        workload["/search_by_ingredients"].append(
+            ("/search_by_ingredients", {"ingredient_query": ingredient_query, "n_results": 3}))
+
+        params = {"page": rng.randint(1, 3), "limit": 10}
+        if rng.random() < 0.5:
+            params["cuisine"] = rng.choice(cuisines)
+        elif rng.random() < 0.5:
+            params["diet_type"] = rng.choice(diet_types)
+        workload["/recipes"].append(("/recipes", params))
+
+        workload["/recipes/{id}"].append((f"/recipes/{rng.choice(recipe_ids)}", {}))
+        workload["/substitute"].append(("/substitute", {"query": rng.choice(ingredients)}))
+    return workload
+
+
+def percentile(latencies, q):
+    # Nearest-rank percentile of sorted latencies, in milliseconds
+    if not latencies:
+        return None
+    return round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 2)
+
+
+async def run_level(http, calls, concurrency, duration):
+    """
+    Keeps `concurrency` requests in flight for `duration` seconds, each worker sending its next
+    request as soon as the previous one answered.
+    """
+    latencies = []
+    errors = 0
+    position = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors, position
+        while time.perf_counter() < deadline:
+            path, params = calls[position % len(calls)]
+            position += 1
+            start = time.perf_counter()
+            try:
+                response = await http.get(path, params=params)
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": percentile(latencies, 1.0),
+    }
+
+
+async def measure(base_url, workload, endpoints, concurrency_levels, duration, warmup, upstream=None):
+    results = []
+    limits = httpx.Limits(max_connections=max(concurrency_levels), max_keepalive_connections=max(concurrency_levels))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as http:
+        for endpoint in endpoints:
+            calls = workload[endpoint]
+            # Warm-up fills the backend's caches the way a long-running instance has them filled
+            for path, params in calls[:warmup]:
+                await http.get(path, params=params)
+            for concurrency in concurrency_levels:
+                upstream_before = upstream.requests if upstream is not None else 0
+                stats = await run_level(http, calls, concurrency, duration)
+                if upstream is not None:
+                    stats["upstream_calls"] = upstream.requests - upstream_before
+                results.append({"endpoint": endpoint, "concurrency": concurrency, **stats})
+                print(f"{endpoint:24} c={concurrency:<4} {stats['requests_per_second']:>8} req/s  "
+                      f"p50 {stats['p50_ms']} ms  p95 {stats['p95_ms']} ms  p99 {stats['p99_ms']} ms  "
+                      f"errors {stats['errors']}")
+    return results
+
+
+def compare(results, baseline_path):
+    # Relative change of throughput and tail latency against an earlier result file
+    with open(baseline_path, "r", encoding="utf-8") as file:
+        baseline = {(row["endpoint"], row["concurrency"]): row for row in json.load(file)["results"]}
+
+    def change(new, old):
+        if not new or not old:
+            return "n/a"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    print(f"\nCompared with {baseline_path}:")
+    for row in results:
+        old = baseline.get((row["endpoint"], row["concurrency"]))
+        if old is None:
+            continue
+        print(f"{row['endpoint']:24} c={row['concurrency']:<4} "
+              f"req/s {change(row['requests_per_second'], old['requests_per_second'])}  "
+              f"p50 {change(row['p50_ms'], old['p50_ms'])}  p95 {change(row['p95_ms'], old['p95_ms'])}  "
+              f"p99 {change(row['p99_ms'], old['p99_ms'])}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=TOOLS_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(args):
+    work_dir = tempfile.mkdtemp(prefix="load_test_")
+    chroma_path = args.chroma_path or os.path.join(work_dir, "chroma")
+    os.makedirs(chroma_path, exist_ok=True)
+    chroma_port = free_port()
+    backend_port = free_port()
+    processes = []
+
+    # Seeding runs without latency, the configured one only applies to the measured requests
+    upstream, upstream_url = start_fake_server(latency=0.0, dim=args.dim)
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL=upstream_url,
+        OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "fake"),
+        EMBEDDING_PROVIDER=args.embedding_provider,
+        EMBEDDING_DIM=str(args.dim),
+        CHROMA_HOST="127.0.0.1",
+        CHROMA_PORT=str(chroma_port),
+        # Kept next to the Chroma data, so a reused --chroma-path is seeded incrementally
+        INGEST_MANIFEST_PATH=os.path.join(chroma_path, "index_manifest.sqlite"),
+        SUBSTITUTIONS_TABLE_PATH=os.path.join(work_dir, "substitutions.sqlite"),
+        INDEX_VERSION_PATH=os.path.join(work_dir, "index_version"),
+        RESULT_CACHE_SIZE=os.getenv("RESULT_CACHE_SIZE", "2048") if args.result_cache else "0",
+        RESULT_CACHE_PATH="",
+        ANONYMIZED_TELEMETRY="False",
+    )
+    os.environ.update(env)
+
+    try:
+        processes.append(start_chroma(chroma_path, chroma_port))
+        start = time.perf_counter()
+        seed_chroma(args.recipes)
+        print(f"Seeded Chroma from {args.recipes} in {time.perf_counter() - start:.1f}s")
+
+        processes.append(start_backend(backend_port, env))
+        base_url = f"http://127.0.0.1:{backend_port}"
+        recipe_ids = [recipe["id"] for recipe in httpx.get(f"{base_url}/recipes", params={"limit": 1000}).json()["recipes"]]
+
+        upstream.latency = args.latency
+        workload = build_workload(args.recipes, recipe_ids, seed=args.seed)
+        results = asyncio.run(measure(base_url, workload, args.endpoints, args.concurrency, args.duration,
+                                      args.warmup, upstream))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+        upstream.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "upstream_latency": args.latency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "embedding_provider": args.embedding_provider,
+            "dim": args.dim,
+            "recipes": len(recipe_ids),
+            "seed": args.seed,
+            "result_cache": args.result_cache,
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(TOOLS_DIR, "..", "db", "load_tests", f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=4)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    # e.g. python load_test.py --concurrency 1 8 32 --latency 0.2 --compare ../db/load_tests/abc1234.json
+    parser = argparse.ArgumentParser(
+        description="Load-test the backend against a fake OpenAI API and a Chroma seeded from the recipes folder.")
+    parser.add_argument("--recipes", default=os.path.join(TOOLS_DIR, "..", "db", "recipes_raw"), help="Recipes folder to seed Chroma from")
+    parser.add_argument("--chroma-path", default=None, help="Keep the seeded Chroma data here instead of a temp dir")
+    parser.add_argument("--endpoints", nargs="+", default=ENDPOINTS, choices=ENDPOINTS)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32], help="Concurrency levels")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=int, default=20, help="Requests per endpoint before measuring")
+    parser.add_argument("--latency", type=float, default=0.1, help="Latency of the fake OpenAI API in seconds")
+    parser.add_argument("--embedding-provider", default="openai", help="EMBEDDING_PROVIDER of seeding and backend")
+    parser.add_argument("--dim", type=int, default=1536, help="Embedding dimension")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated queries")
+    parser.add_argument("--no-result-cache", dest="result_cache", action="store_false",
+                        help="Disable the backend's result cache, every request is computed")
+    parser.add_argument("--output", default=None, help="Result file, defaults to ../db/load_tests/<commit>.json")
+    parser.add_argument("--compare", default=None, help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    main(args)
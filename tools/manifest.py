@@ -0,0 +1,85 @@
+import hashlib
+import os
+import sqlite3
+
+
+def hash_content(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class IndexManifest:
+    """
+    Remembers which recipe file was indexed with which content and embedding model.
+
+    A row is keyed by the file name inside the recipes folder and stores the recipe ID, the
+    file's size and mtime (to skip unchanged files without reading them), the SHA-256 of its
+    content and the embedding model that produced its vectors.
+
+    Args:
+        path (str): Location of the SQLite file.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS recipes ("
+            "filename TEXT PRIMARY KEY, recipe_id TEXT NOT NULL, size INTEGER NOT NULL, "
+            "mtime_ns INTEGER NOT NULL, content_hash TEXT NOT NULL, model TEXT NOT NULL, "
+            "indexed INTEGER NOT NULL)"
+        )
+        # Near-duplicate fingerprints, see dedup.py
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            "filename TEXT PRIMARY KEY, recipe_id TEXT NOT NULL, features TEXT NOT NULL, "
+            "signature BLOB NOT NULL, duplicate_of TEXT)"
+        )
+        self.db.commit()
+
+    def entries(self):
+        """
+        Returns:
+            dict: filename -> (recipe_id, size, mtime_ns, content_hash, model, indexed)
+        """
+        rows = self.db.execute(
+            "SELECT filename, recipe_id, size, mtime_ns, content_hash, model, indexed FROM recipes"
+        )
+        return {row[0]: row[1:] for row in rows}
+
+    def record(self, rows):
+        """
+        Stores (filename, recipe_id, size, mtime_ns, content_hash, model, indexed) tuples.
+        """
+        self.db.executemany("INSERT OR REPLACE INTO recipes VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.db.commit()
+
+    def fingerprints(self):
+        """
+        Returns:
+            dict: filename -> (recipe_id, features, signature, duplicate_of)
+        """
+        rows = self.db.execute("SELECT filename, recipe_id, features, signature, duplicate_of FROM fingerprints")
+        return {row[0]: row[1:] for row in rows}
+
+    def record_fingerprints(self, rows):
+        """
+        Stores (filename, recipe_id, features, signature, duplicate_of) tuples.
+        """
+        self.db.executemany("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?)", rows)
+        self.db.commit()
+
+    def duplicates_of(self, recipe_ids):
+        """
+        Returns:
+            list: Names of the files recorded as near-duplicates of one of the given recipe IDs.
+        """
+        rows = self.db.execute("SELECT filename, duplicate_of FROM fingerprints WHERE duplicate_of IS NOT NULL")
+        return [filename for filename, duplicate_of in rows if duplicate_of in recipe_ids]
+
+    def remove(self, filenames):
+        self.db.executemany("DELETE FROM recipes WHERE filename = ?", [(name,) for name in filenames])
+        self.db.executemany("DELETE FROM fingerprints WHERE filename = ?", [(name,) for name in filenames])
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,84 @@
+import queue
+import threading
+from itertools import islice
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def batched(iterable, size):
+    """
+    Groups an iterable into lists of at most size items.
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def prefetch(iterable, maxsize=4):
+    """
+    Runs an iterable in a background thread and yields its items through a bounded queue.
+
+    The producer blocks once maxsize items are waiting, so at most maxsize items are held
+    in memory no matter how fast the producer is.
+    """
+    return threaded_map(lambda item: item, iterable, workers=1, maxsize=maxsize)
+
+
+def threaded_map(func, iterable, workers=1, maxsize=4):
+    """
+    Applies func to every item of iterable in worker threads and yields the results as they
+    complete. The output queue is bounded, so workers stop pulling input while the consumer
+    is behind. An exception in a worker is re-raised in the consumer.
+
+    Args:
+        func (callable): Function applied to each item.
+        iterable (iterable): Input items, consumed lazily by the workers.
+        workers (int): Number of worker threads.
+        maxsize (int): Maximum number of finished results waiting for the consumer.
+    """
+    results = queue.Queue(maxsize=maxsize)
+    iterator = iter(iterable)
+    input_lock = threading.Lock()
+    stop = threading.Event()
+
+    def worker():
+        try:
+            while not stop.is_set():
+                with input_lock:
+                    item = next(iterator, _DONE)
+                if item is _DONE:
+                    break
+                results.put(func(item))
+        except BaseException as e:
+            results.put(_Failure(e))
+        finally:
+            results.put(_DONE)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    running = workers
+    try:
+        while running:
+            result = results.get()
+            if result is _DONE:
+                running -= 1
+            elif isinstance(result, _Failure):
+                raise result.error
+            else:
+                yield result
+    finally:
+        # Unblock workers still waiting on a full queue when the consumer stops early
+        stop.set()
+        while running:
+            if results.get() is _DONE:
+                running -= 1
@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+from recipe_store import iter_recipes
+
+# Prompt and parsing are shared with the backend so that precomputed and live answers match
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from substitutions import SUBSTITUTION_MODEL, normalize_ingredient, parse_substitutions, substitution_prompt  # noqa: E402
+
+load_dotenv()
+client = AsyncOpenAI()
+
+# Directory containing recipe JSON files
+recipes_dir = "../db/recipes_raw"
+
+table_path = os.getenv("SUBSTITUTIONS_TABLE_PATH", "../db/substitutions.sqlite")
+
+
+def count_core_ingredients():
+    counts = Counter()
+    # Reads the packed recipe store instead when RECIPE_STORE_PATH is set
+    for recipe in iter_recipes(recipes_dir):
+        for ingredient in recipe.get("core_ingredients", []):
+            ingredient = normalize_ingredient(ingredient)
+            if ingredient:
+                counts[ingredient] += 1
+    return counts
+
+
+def open_table(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS substitutions ("
+        "ingredient TEXT PRIMARY KEY, substitutions TEXT NOT NULL, created_at REAL NOT NULL)"
+    )
+    db.commit()
+    return db
+
+
+async def ask_substitutions(ingredient, semaphore):
+    async with semaphore:
+        for attempt in range(3):
+            try:
+                response = await client.chat.completions.create(
+                    model=SUBSTITUTION_MODEL,
+                    messages=[{"role": "user", "content": substitution_prompt(ingredient)}],
+                    response_format={"type": "json_object"}
+                )
+            except Exception as e:
+                print(f"Error asking for {ingredient}: {e}")
+                await asyncio.sleep(2 ** attempt)
+                continue
+            substitutions = parse_substitutions(response.choices[0].message.content or "")
+            if substitutions is not None:
+                return ingredient, substitutions
+        return ingredient, None
+
+
+async def precompute(limit=None, refresh=False, concurrency=8):
+    counts = count_core_ingredients()
+    db = open_table(table_path)
+    known = set() if refresh else {row[0] for row in db.execute("SELECT ingredient FROM substitutions")}
+
+    ingredients = [ingredient for ingredient, _ in counts.most_common(limit) if ingredient not in known]
+    print(f"{len(counts)} distinct core ingredients, {len(ingredients)} to precompute")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    stored = 0
+    for task in asyncio.as_completed([ask_substitutions(ingredient, semaphore) for ingredient in ingredients]):
+        ingredient, substitutions = await task
+        if substitutions is None:
+            continue
+        db.execute("INSERT OR REPLACE INTO substitutions VALUES (?, ?, ?)",
+                   (ingredient, json.dumps(substitutions, ensure_ascii=False), time.time()))
+        stored += 1
+        if stored % 100 == 0:
+            db.commit()
+            print(f"{stored}/{len(ingredients)} stored")
+    db.commit()
+    db.close()
+    print(f"Stored {stored} substitutions in {time.perf_counter() - start:.1f}s to {os.path.abspath(table_path)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute substitutions for all core ingredients.")
+    parser.add_argument("--limit", type=int, default=None, help="Only the N most common ingredients")
+    parser.add_argument("--refresh", action="store_true", help="Recompute ingredients already in the table")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    asyncio.run(precompute(limit=args.limit, refresh=args.refresh, concurrency=args.concurrency))
@@ -0,0 +1,380 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from typing import Iterator, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Packed recipe store, used instead of the recipes folder when set
+recipe_store_path = os.getenv("RECIPE_STORE_PATH", "")
+
+# Where a record lives, shaped like the os.stat fields the ingest manifest compares
+RecordStat = namedtuple("RecordStat", "st_size st_mtime_ns")
+
+
+def encode_recipe(recipe) -> bytes:
+    return json.dumps(recipe, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class RecipeStore:
+    """
+    Append-only store of raw recipes in a few large JSONL segment files.
+
+    Every record is one line of compact JSON, appended to the active segment; a new segment is
+    started once it reaches segment_size bytes. An SQLite index maps each recipe ID to the
+    segment, offset and length of its current record and its content hash, so a lookup is one
+    slice of a memory-mapped segment and a scan reads the segments sequentially. Updating a
+    recipe appends a new record and deleting one appends a tombstone; the old records stay until
+    compact() rewrites the live ones.
+
+    The segments alone are enough to rebuild the index. Records appended after the last index
+    commit, e.g. before a crash, are indexed again when the store is opened.
+
+    Args:
+        path (str): Directory of the store.
+        segment_size (int): Size in bytes after which a new segment is started.
+        commit_every (int): Number of writes between index commits.
+    """
+
+    def __init__(self, path, segment_size=256 * 1024 * 1024, commit_every=100):
+        self.path = path
+        self.segment_size = segment_size
+        self.commit_every = commit_every
+        os.makedirs(path, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "id TEXT PRIMARY KEY, segment INTEGER NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL, "
+            "content_hash TEXT NOT NULL)"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS segments (segment INTEGER PRIMARY KEY, indexed_to INTEGER NOT NULL)")
+        self.db.commit()
+        self._lock = threading.RLock()
+        self._maps = {}
+        self._updates = 0
+        self._writer = None
+        segments = self.segments()
+        self.active = segments[-1] if segments else 1
+        self._recover()
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, f"segment-{segment:06d}.jsonl")
+
+    def segments(self):
+        return sorted(int(name[8:14]) for name in os.listdir(self.path)
+                      if name.startswith("segment-") and name.endswith(".jsonl"))
+
+    def _recover(self):
+        # Index the records that were appended after the last commit
+        indexed_to = dict(self.db.execute("SELECT segment, indexed_to FROM segments"))
+        for segment in self.segments():
+            if os.path.getsize(self._segment_path(segment)) > indexed_to.get(segment, 0):
+                self._replay(segment, indexed_to.get(segment, 0))
+        self.commit()
+
+    def _replay(self, segment, start):
+        path = self._segment_path(segment)
+        offset = start
+        with open(path, "rb") as file:
+            file.seek(start)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    # Torn write at the end of the segment, the record never completed
+                    break
+                self._index(json.loads(line), segment, offset, line)
+                offset += len(line)
+        if offset < os.path.getsize(path):
+            with open(path, "r+b") as file:
+                file.truncate(offset)
+        self.db.execute("INSERT OR REPLACE INTO segments VALUES (?, ?)", (segment, offset))
+
+    def _index(self, record, segment, offset, line, content_hash=None):
+        if record.get("_deleted"):
+            self.db.execute("DELETE FROM records WHERE id = ?", (record["id"],))
+        else:
+            self.db.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)",
+                            (record["id"], segment, offset, len(line),
+                             record.get("_content_hash") or content_hash or hashlib.sha256(line).hexdigest()))
+
+    def _append(self, record, content_hash=None):
+        line = encode_recipe(record)
+        with self._lock:
+            if self._writer is None or self._writer.tell() + len(line) > self.segment_size and self._writer.tell() > 0:
+                if self._writer is not None:
+                    self._writer.close()
+                    self.active += 1
+                self._writer = open(self._segment_path(self.active), "ab")
+            offset = self._writer.tell()
+            self._writer.write(line)
+            self._writer.flush()
+            self._index(record, self.active, offset, line, content_hash)
+            self.db.execute("INSERT OR REPLACE INTO segments VALUES (?, ?)", (self.active, offset + len(line)))
+            self._updates += 1
+            if self._updates >= self.commit_every:
+                self.commit()
+
+    def put(self, recipe, content_hash=None):
+        """
+        Stores a recipe under its "id", replacing an earlier version.
+
+        Args:
+            recipe (dict): The recipe.
+            content_hash (str, optional): Hash to record instead of the hash of the stored line,
+                used on import so the ingest manifest still recognizes unchanged recipes.
+        """
+        record = dict(recipe)
+        if content_hash:
+            # Kept in the record too, so a rebuilt index has the same hashes
+            record["_content_hash"] = content_hash
+        self._append(record, content_hash)
+
+    def delete(self, recipe_id):
+        with self._lock:
+            if self.location(recipe_id) is not None:
+                self._append({"id": recipe_id, "_deleted": True})
+
+    def location(self, recipe_id) -> Optional[Tuple[int, int, int, str]]:
+        """
+        Returns:
+            tuple: (segment, offset, length, content_hash) of the current record, or None.
+        """
+        with self._lock:
+            return self.db.execute("SELECT segment, offset, length, content_hash FROM records WHERE id = ?",
+                                   (recipe_id,)).fetchone()
+
+    def _map(self, segment, end):
+        # Segments only grow, a mapping is renewed when a record lies beyond its end
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            if mapped is not None:
+                mapped.close()
+            with open(self._segment_path(segment), "rb") as file:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped
+
+    def read(self, segment, offset, length) -> bytes:
+        with self._lock:
+            return self._map(segment, offset + length)[offset:offset + length]
+
+    def get(self, recipe_id) -> Optional[dict]:
+        location = self.location(recipe_id)
+        if location is None:
+            return None
+        return self.decode(self.read(*location[:3]))
+
+    @staticmethod
+    def decode(line) -> dict:
+        recipe = json.loads(line)
+        recipe.pop("_content_hash", None)
+        return recipe
+
+    def entries(self) -> Iterator[Tuple[str, int, int, int, str]]:
+        """
+        Yields (id, segment, offset, length, content_hash) of all recipes in storage order,
+        without reading any record.
+        """
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT id, segment, offset, length, content_hash FROM records ORDER BY segment, offset"
+            ).fetchall()
+        return iter(rows)
+
+    def scan(self) -> Iterator[dict]:
+        """
+        Yields all current recipes, reading each segment front to back. Replaced records and
+        tombstones are skipped without being decoded.
+        """
+        live = {}
+        for _, segment, offset, _, _ in self.entries():
+            live.setdefault(segment, set()).add(offset)
+        for segment in sorted(live):
+            offsets = live[segment]
+            offset = 0
+            with open(self._segment_path(segment), "rb", buffering=1024 * 1024) as file:
+                for line in file:
+                    if offset in offsets:
+                        yield self.decode(line)
+                    offset += len(line)
+
+    def __len__(self):
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def stats(self):
+        sizes = [os.path.getsize(self._segment_path(segment)) for segment in self.segments()]
+        live = self.db.execute("SELECT COALESCE(SUM(length), 0) FROM records").fetchone()[0]
+        return {"recipes": len(self), "segments": len(sizes), "bytes": sum(sizes), "live_bytes": live}
+
+    def compact(self):
+        """
+        Rewrites the current records into new segments and removes the old ones.
+        """
+        with self._lock:
+            self.commit()
+            old_segments = self.segments()
+            rows = list(self.entries())
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self.active = (old_segments[-1] + 1) if old_segments else 1
+            for recipe_id, segment, offset, length, content_hash in rows:
+                record = json.loads(self.read(segment, offset, length))
+                record["_content_hash"] = content_hash
+                self._append(record, content_hash)
+            self.commit()
+            for segment in old_segments:
+                mapped = self._maps.pop(segment, None)
+                if mapped is not None:
+                    mapped.close()
+                os.remove(self._segment_path(segment))
+                self.db.execute("DELETE FROM segments WHERE segment = ?", (segment,))
+            self.commit()
+
+    def commit(self):
+        with self._lock:
+            self.db.commit()
+            self._updates = 0
+
+    def close(self):
+        with self._lock:
+            self.commit()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+            self.db.close()
+
+
+def iter_folder(folder) -> Iterator[Tuple[str, bytes]]:
+    for entry in os.scandir(folder):
+        if entry.name.endswith(".json"):
+            with open(entry.path, "rb") as file:
+                yield entry.name, file.read()
+
+
+def iter_recipes(folder, store_path=recipe_store_path) -> Iterator[dict]:
+    """
+    Yields the raw recipes of the store if store_path is set, otherwise of the recipes folder.
+    """
+    if store_path:
+        store = RecipeStore(store_path)
+        try:
+            yield from store.scan()
+        finally:
+            store.close()
+    elif os.path.isdir(folder):
+        for filename, data in iter_folder(folder):
+            recipe = json.loads(data.decode("utf-8"))
+            recipe.setdefault("id", filename[:-len(".json")])
+            yield recipe
+
+
+def import_folder(folder, store):
+    """
+    Copies the recipe files of a folder into the store. Each record keeps the hash of its file,
+    so recipes indexed from the folder are not embedded again after switching to the store.
+    """
+    count = 0
+    for filename, data in iter_folder(folder):
+        recipe = json.loads(data.decode("utf-8"))
+        recipe.setdefault("id", filename[:-len(".json")])
+        store.put(recipe, content_hash=hashlib.sha256(data).hexdigest())
+        count += 1
+    store.commit()
+    return count
+
+
+def export_folder(store, folder):
+    """
+    Writes every recipe of the store as a file in the folder layout used by save_recipe.
+    """
+    os.makedirs(folder, exist_ok=True)
+    count = 0
+    for recipe in store.scan():
+        with open(os.path.join(folder, f"{recipe['id']}.json"), "w", encoding="utf-8") as file:
+            json.dump(recipe, file, indent=4, ensure_ascii=False)
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the packed recipe store.")
+    parser.add_argument("command", choices=["import", "export", "stats", "compact", "bench"])
+    parser.add_argument("--store", default=recipe_store_path or "../db/recipes_store", help="Store directory (RECIPE_STORE_PATH)")
+    parser.add_argument("--folder", default="../db/recipes_raw", help="Recipes folder to import from or export to")
+    parser.add_argument("--count", type=int, default=100000, help="Number of recipes for the benchmark")
+    args = parser.parse_args()
+
+    store = RecipeStore(args.store)
+    start = time.perf_counter()
+    if args.command == "import":
+        print(f"Imported {import_folder(args.folder, store)} recipes in {time.perf_counter() - start:.2f}s")
+    elif args.command == "export":
+        print(f"Exported {export_folder(store, args.folder)} recipes in {time.perf_counter() - start:.2f}s")
+    elif args.command == "compact":
+        store.compact()
+        print(f"Compacted in {time.perf_counter() - start:.2f}s")
+    elif args.command == "bench":
+        # Copies the folder's recipes --count times over into a temporary folder and store, then
+        # compares a full read of both and random lookups in the store
+        import random
+        import tempfile
+
+        base = list(iter_recipes(args.folder, store_path=""))
+        bench_dir = tempfile.mkdtemp()
+        bench_folder = os.path.join(bench_dir, "recipes_raw")
+        bench_store = RecipeStore(os.path.join(bench_dir, "store"))
+        os.makedirs(bench_folder)
+        ids = []
+        for i in range(args.count):
+            recipe = dict(base[i % len(base)], id=f"{i:08d}-{base[i % len(base)]['id']}")
+            ids.append(recipe["id"])
+            with open(os.path.join(bench_folder, f"{recipe['id']}.json"), "w", encoding="utf-8") as file:
+                json.dump(recipe, file, indent=4, ensure_ascii=False)
+            bench_store.put(recipe)
+        bench_store.commit()
+
+        # What an ingest run without changes does: stat every file against one index query
+        start = time.perf_counter()
+        for entry in os.scandir(bench_folder):
+            entry.stat()
+        folder_stat_time = time.perf_counter() - start
+        start = time.perf_counter()
+        list(bench_store.entries())
+        store_entries_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        folder_count = sum(1 for _ in iter_recipes(bench_folder, store_path=""))
+        folder_time = time.perf_counter() - start
+        start = time.perf_counter()
+        store_count = sum(1 for _ in bench_store.scan())
+        store_time = time.perf_counter() - start
+        random.Random(0).shuffle(ids)
+        start = time.perf_counter()
+        for recipe_id in ids[:10000]:
+            bench_store.get(recipe_id)
+        lookup_time = time.perf_counter() - start
+        print(json.dumps({
+            "recipes": args.count,
+            "folder_stat_s": round(folder_stat_time, 3), "store_entries_s": round(store_entries_time, 3),
+            "folder_read_s": round(folder_time, 3), "folder_recipes": folder_count,
+            "store_scan_s": round(store_time, 3), "store_recipes": store_count,
+            "store_lookup_us": round(lookup_time / min(len(ids), 10000) * 1e6, 1),
+            "store": bench_store.stats(),
+        }, indent=2))
+        bench_store.close()
+    print(json.dumps(store.stats()))
+    store.close()